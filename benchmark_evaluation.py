@@ -0,0 +1,436 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# Benchmarks the sound event detection metrics of src/evaluation.py against the Python loops they
+# replaced (per-event roll fill and per-segment loop for segment-based metrics, all pairs event matching
+# for event-based metrics), on synthetic recordings of the given length, and the reference roll cache
+# with several system outputs per recording. Results of both implementations must be identical, the
+# script exits with an error otherwise.
+
+import argparse
+import math
+import os
+import random
+import sys
+import timeit
+
+import numpy
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.realpath(__file__)), 'runs', '2016', 'baseline'))
+from src.evaluation import *
+
+
+class LoopSegmentBasedMetrics(DCASE2016_EventDetection_SegmentBasedMetrics):
+    """Segment-based metrics with the original per-event roll fill and per-segment loop, reference for the benchmark
+    """
+
+    def list_to_roll(self, data, time_resolution=0.01):
+        """Convert event list into event roll, one event at a time.
+
+        Parameters
+        ----------
+        data : list
+            Event list, list of event dicts
+
+        time_resolution : float > 0
+            Time resolution used when converting event into event roll.
+
+        Returns
+        -------
+        event_roll : numpy.ndarray [shape=(math.ceil(data_length * 1 / time_resolution) + 1, amount of classes)]
+            Event roll
+
+        """
+
+        # Initialize
+        data_length = self.max_event_offset(data)
+        event_roll = numpy.zeros((int(math.ceil(data_length * 1 / time_resolution)) + 1, len(self.class_list)))
+
+        # Fill-in event_roll
+        for event in data:
+            pos = self.class_list.index(event['event_label'].rstrip())
+
+            onset = int(math.floor(event['event_onset'] * 1 / time_resolution))
+            offset = int(math.ceil(event['event_offset'] * 1 / time_resolution)) + 1
+
+            event_roll[onset:offset, pos] = 1
+
+        return event_roll
+
+    def evaluate(self, annotated_ground_truth, system_output):
+        """Evaluate system output and annotated ground truth pair.
+
+        Parameters
+        ----------
+        annotated_ground_truth : list
+            Ground truth event list
+
+        system_output : list
+            System output event list
+
+        Returns
+        -------
+        self
+
+        """
+
+        # Convert event list into frame-based representation
+        system_event_roll = self.list_to_roll(data=system_output, time_resolution=self.time_resolution)
+        annotated_event_roll = self.list_to_roll(data=annotated_ground_truth, time_resolution=self.time_resolution)
+
+        # Fix durations of both event_rolls to be equal
+        if annotated_event_roll.shape[0] > system_event_roll.shape[0]:
+            padding = numpy.zeros((annotated_event_roll.shape[0] - system_event_roll.shape[0], len(self.class_list)))
+            system_event_roll = numpy.vstack((system_event_roll, padding))
+
+        if system_event_roll.shape[0] > annotated_event_roll.shape[0]:
+            padding = numpy.zeros((system_event_roll.shape[0] - annotated_event_roll.shape[0], len(self.class_list)))
+            annotated_event_roll = numpy.vstack((annotated_event_roll, padding))
+
+        # Compute segment-based overall metrics
+        for segment_id in range(0, annotated_event_roll.shape[0]):
+            annotated_segment = annotated_event_roll[segment_id, :]
+            system_segment = system_event_roll[segment_id, :]
+
+            Ntp = sum(system_segment + annotated_segment > 1)
+            Ntn = sum(system_segment + annotated_segment == 0)
+            Nfp = sum(system_segment - annotated_segment > 0)
+            Nfn = sum(annotated_segment - system_segment > 0)
+
+            Nref = sum(annotated_segment)
+            Nsys = sum(system_segment)
+
+            S = min(Nref, Nsys) - Ntp
+            D = max(0, Nref - Nsys)
+            I = max(0, Nsys - Nref)
+            ER = max(Nref, Nsys) - Ntp
+
+            self.overall['Ntp'] += Ntp
+            self.overall['Ntn'] += Ntn
+            self.overall['Nfp'] += Nfp
+            self.overall['Nfn'] += Nfn
+            self.overall['Nref'] += Nref
+            self.overall['Nsys'] += Nsys
+            self.overall['S'] += S
+            self.overall['D'] += D
+            self.overall['I'] += I
+            self.overall['ER'] += ER
+
+        for class_id, class_label in enumerate(self.class_list):
+            annotated_segment = annotated_event_roll[:, class_id]
+            system_segment = system_event_roll[:, class_id]
+
+            Ntp = sum(system_segment + annotated_segment > 1)
+            Ntn = sum(system_segment + annotated_segment == 0)
+            Nfp = sum(system_segment - annotated_segment > 0)
+            Nfn = sum(annotated_segment - system_segment > 0)
+
+            Nref = sum(annotated_segment)
+            Nsys = sum(system_segment)
+
+            self.class_wise[class_label]['Ntp'] += Ntp
+            self.class_wise[class_label]['Ntn'] += Ntn
+            self.class_wise[class_label]['Nfp'] += Nfp
+            self.class_wise[class_label]['Nfn'] += Nfn
+            self.class_wise[class_label]['Nref'] += Nref
+            self.class_wise[class_label]['Nsys'] += Nsys
+
+        return self
+
+
+class LoopEventBasedMetrics(DCASE2016_EventDetection_EventBasedMetrics):
+    """Event-based metrics with the original all pairs event matching, reference for the benchmark
+    """
+
+    def evaluate(self, annotated_ground_truth, system_output):
+        """Evaluate system output and annotated ground truth pair.
+
+        Parameters
+        ----------
+        annotated_ground_truth : list
+            Ground truth event list
+
+        system_output : list
+            System output event list
+
+        Returns
+        -------
+        nothing
+
+        """
+
+        # Overall metrics
+
+        # Total number of detected and reference events
+        Nsys = len(system_output)
+        Nref = len(annotated_ground_truth)
+
+        sys_correct = numpy.zeros(Nsys, dtype=bool)
+        ref_correct = numpy.zeros(Nref, dtype=bool)
+
+        # Number of correctly transcribed events, onset/offset within a t_collar range
+        for j in range(0, len(annotated_ground_truth)):
+            for i in range(0, len(system_output)):
+                label_condition = annotated_ground_truth[j]['event_label'] == system_output[i]['event_label']
+                onset_condition = self.onset_condition(annotated_event=annotated_ground_truth[j],
+                                                       system_event=system_output[i],
+                                                       t_collar=self.t_collar)
+
+                offset_condition = self.offset_condition(annotated_event=annotated_ground_truth[j],
+                                                         system_event=system_output[i],
+                                                         t_collar=self.t_collar)
+
+                if label_condition and onset_condition and offset_condition:
+                    ref_correct[j] = True
+                    sys_correct[i] = True
+                    break
+
+        Ntp = numpy.sum(sys_correct)
+
+        sys_leftover = numpy.nonzero(numpy.negative(sys_correct))[0]
+        ref_leftover = numpy.nonzero(numpy.negative(ref_correct))[0]
+
+        # Substitutions
+        Nsubs = 0
+        for j in ref_leftover:
+            for i in sys_leftover:
+                onset_condition = self.onset_condition(annotated_event=annotated_ground_truth[j],
+                                                       system_event=system_output[i],
+                                                       t_collar=self.t_collar)
+
+                offset_condition = self.offset_condition(annotated_event=annotated_ground_truth[j],
+                                                         system_event=system_output[i],
+                                                         t_collar=self.t_collar)
+
+                if onset_condition and offset_condition:
+                    Nsubs += 1
+                    break
+
+        Nfp = Nsys - Ntp - Nsubs
+        Nfn = Nref - Ntp - Nsubs
+
+        self.overall['Nref'] += Nref
+        self.overall['Nsys'] += Nsys
+        self.overall['Ntp'] += Ntp
+        self.overall['Nsubs'] += Nsubs
+        self.overall['Nfp'] += Nfp
+        self.overall['Nfn'] += Nfn
+
+        # Class-wise metrics
+        for class_id, class_label in enumerate(self.class_list):
+            Nref = 0.0
+            Nsys = 0.0
+            Ntp = 0.0
+
+            # Count event frequencies in the ground truth
+            for i in range(0, len(annotated_ground_truth)):
+                if annotated_ground_truth[i]['event_label'] == class_label:
+                    Nref += 1
+
+            # Count event frequencies in the system output
+            for i in range(0, len(system_output)):
+                if system_output[i]['event_label'] == class_label:
+                    Nsys += 1
+
+            for j in range(0, len(annotated_ground_truth)):
+                for i in range(0, len(system_output)):
+                    if annotated_ground_truth[j]['event_label'] == class_label and \
+                            system_output[i]['event_label'] == class_label:
+                        onset_condition = self.onset_condition(annotated_event=annotated_ground_truth[j],
+                                                               system_event=system_output[i],
+                                                               t_collar=self.t_collar)
+
+                        offset_condition = self.offset_condition(annotated_event=annotated_ground_truth[j],
+                                                                 system_event=system_output[i],
+                                                                 t_collar=self.t_collar)
+
+                        if onset_condition and offset_condition:
+                            Ntp += 1
+                            break
+
+            Nfp = Nsys - Ntp
+            Nfn = Nref - Ntp
+
+            self.class_wise[class_label]['Nref'] += Nref
+            self.class_wise[class_label]['Nsys'] += Nsys
+
+            self.class_wise[class_label]['Ntp'] += Ntp
+            self.class_wise[class_label]['Nfp'] += Nfp
+            self.class_wise[class_label]['Nfn'] += Nfn
+
+
+def generate_event_list(class_list, duration, event_count, random_state):
+    """Random event list
+
+    Parameters
+    ----------
+    class_list : list
+        event labels
+
+    duration : float > 0
+        recording length in seconds
+
+    event_count : int > 0
+        number of events
+
+    random_state : random.Random
+        random generator
+
+    Returns
+    -------
+    event_list : list of dict
+        events, sorted by onset
+
+    """
+
+    event_list = []
+    for event_id in range(event_count):
+        onset = random_state.uniform(0.0, duration)
+        event_list.append({
+            'event_label': random_state.choice(class_list),
+            'event_onset': onset,
+            'event_offset': min(onset + random_state.uniform(0.1, 10.0), duration),
+        })
+    return sorted(event_list, key=lambda event: event['event_onset'])
+
+
+def benchmark(metric_class, pairs, class_list, repeats, reference_files=None, **kwargs):
+    """Best wall clock time of evaluating all pairs
+
+    Parameters
+    ----------
+    metric_class : class
+        metric class
+
+    pairs : list of tuples
+        annotated ground truth and system output event lists
+
+    class_list : list
+        event labels
+
+    repeats : int > 0
+        number of timed runs
+
+    reference_files : list of str
+        reference file of each pair, passed to evaluate to cache the reference rolls, not passed if None
+        (Default value=None)
+
+    **kwargs
+        metric class arguments
+
+    Returns
+    -------
+    elapsed : float
+        seconds, best of the runs
+
+    results : dict
+        metric results
+
+    """
+
+    elapsed = []
+    for repeat in range(repeats):
+        EventDetectionMetrics.roll_cache.clear()
+
+        start = timeit.default_timer()
+        metric = metric_class(class_list=class_list, **kwargs)
+        for pair_id, (annotated_ground_truth, system_output) in enumerate(pairs):
+            if reference_files is not None:
+                metric.evaluate(annotated_ground_truth=annotated_ground_truth, system_output=system_output,
+                                reference_file=reference_files[pair_id])
+            else:
+                metric.evaluate(annotated_ground_truth=annotated_ground_truth, system_output=system_output)
+        results = metric.results()
+        elapsed.append(timeit.default_timer() - start)
+    return min(elapsed), results
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(description='Benchmark the sound event detection metrics')
+    parser.add_argument('-duration', help='Recording length in seconds', type=float, default=3600.0,
+                        dest='duration')
+    parser.add_argument('-files', help='Number of recordings', type=int, default=4, dest='files')
+    parser.add_argument('-classes', help='Number of event classes', type=int, default=20, dest='classes')
+    parser.add_argument('-events', help='Events per recording', type=int, default=500, dest='events')
+    parser.add_argument('-time_resolution', help='Segment length in seconds', type=float, default=0.1,
+                        dest='time_resolution')
+    parser.add_argument('-t_collar', help='Event-based onset collar in seconds', type=float, default=0.2,
+                        dest='t_collar')
+    parser.add_argument('-systems', help='System outputs per recording for the roll cache', type=int, default=10,
+                        dest='systems')
+    parser.add_argument('-repeats', help='Timed runs, the best is reported', type=int, default=3, dest='repeats')
+    args = parser.parse_args()
+
+    random_state = random.Random(123456)
+    class_list = ['class' + str(class_id) for class_id in range(args.classes)]
+    pairs = [(generate_event_list(class_list, args.duration, args.events, random_state),
+              generate_event_list(class_list, args.duration, args.events, random_state))
+             for file_id in range(args.files)]
+
+    print 'Segment-based metrics, ' + str(args.files) + ' x ' + str(args.duration) + ' s, ' + \
+          str(args.classes) + ' classes, time resolution ' + str(args.time_resolution) + ' s'
+
+    loop_time, loop_results = benchmark(LoopSegmentBasedMetrics, pairs, class_list, args.repeats,
+                                        time_resolution=args.time_resolution)
+    array_time, array_results = benchmark(DCASE2016_EventDetection_SegmentBasedMetrics, pairs, class_list,
+                                          args.repeats, time_resolution=args.time_resolution)
+
+    print '  {:10s} | {:10.3f} s'.format('Loop', loop_time)
+    print '  {:10s} | {:10.3f} s'.format('Array', array_time)
+    print '  {:10s} | {:10.1f} x'.format('Speedup', loop_time / array_time)
+
+    if loop_results != array_results:
+        raise ValueError("Segment-based results differ [%s]" % args.time_resolution)
+
+    print '  Results identical'
+
+    print 'Event-based metrics, ' + str(args.files) + ' x ' + str(args.events) + ' events, ' + \
+          str(args.classes) + ' classes, t_collar ' + str(args.t_collar) + ' s'
+
+    loop_time, loop_results = benchmark(LoopEventBasedMetrics, pairs, class_list, args.repeats,
+                                        t_collar=args.t_collar)
+    sweep_time, sweep_results = benchmark(DCASE2016_EventDetection_EventBasedMetrics, pairs, class_list,
+                                          args.repeats, t_collar=args.t_collar)
+
+    print '  {:10s} | {:10.3f} s'.format('Loop', loop_time)
+    print '  {:10s} | {:10.3f} s'.format('Sweep', sweep_time)
+    print '  {:10s} | {:10.1f} x'.format('Speedup', loop_time / sweep_time)
+
+    if loop_results != sweep_results:
+        raise ValueError("Event-based results differ [%s]" % args.t_collar)
+
+    print '  Results identical'
+
+    print 'Segment-based metrics, ' + str(args.files) + ' recordings x ' + str(args.systems) + ' system outputs'
+
+    system_pairs = []
+    reference_files = []
+    for file_id, (annotated_ground_truth, system_output) in enumerate(pairs):
+        for system_id in range(args.systems):
+            system_pairs.append((annotated_ground_truth,
+                                 generate_event_list(class_list, args.duration, args.events, random_state)))
+            reference_files.append('file' + str(file_id))
+
+    build_time, build_results = benchmark(DCASE2016_EventDetection_SegmentBasedMetrics, system_pairs, class_list,
+                                          args.repeats, time_resolution=args.time_resolution)
+    cache_time, cache_results = benchmark(DCASE2016_EventDetection_SegmentBasedMetrics, system_pairs, class_list,
+                                          args.repeats, reference_files=reference_files,
+                                          time_resolution=args.time_resolution)
+
+    print '  {:10s} | {:10.3f} s'.format('Build', build_time)
+    print '  {:10s} | {:10.3f} s'.format('Cached', cache_time)
+    print '  {:10s} | {:10.1f} x'.format('Speedup', build_time / cache_time)
+
+    if build_results != cache_results:
+        raise ValueError("Cached segment-based results differ [%s]" % args.time_resolution)
+
+    print '  Results identical'
+
+    return 0
+
+
+if __name__ == "__main__":
+    try:
+        sys.exit(main(sys.argv))
+    except (ValueError, IOError) as e:
+        sys.exit(e)
@@ -0,0 +1,105 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# Converts pickled feature files (*.cpickle) under saved/features into the npy feature store: the feature
+# matrix as a raw NumPy array (*.npy) and the statistics in a pickle sidecar (*.stat.cpickle), the layout
+# written by save_feature_data in src/files.py. Set "store: npy" in the features section of a run's
+# parameter file to use the converted files. The feature hash does not depend on the store, so runs keep
+# their feature paths.
+
+import argparse
+import cPickle as pickle
+import os
+import sys
+
+import numpy
+
+
+def migrate_feature_file(filename, remove=False, overwrite=False):
+    """Convert one pickled feature file
+
+    Parameters
+    ----------
+    filename : str
+        path to pickled feature file
+
+    remove : bool
+        remove the pickled file after conversion
+        (Default value=False)
+
+    overwrite : bool
+        overwrite existing npy files
+        (Default value=False)
+
+    Returns
+    -------
+    converted : bool
+        False if the file is not a feature dict or is already converted
+
+    """
+
+    base = os.path.splitext(filename)[0]
+    if base.endswith('.stat'):
+        # Statistics sidecar of an already converted file
+        return False
+
+    feature_file = base + '.npy'
+    if os.path.isfile(feature_file) and not overwrite:
+        return False
+
+    with open(filename, 'rb') as f:
+        data = pickle.load(f)
+
+    # Feature normalizers and other pickles share the tree
+    if not isinstance(data, dict) or 'feat' not in data:
+        return False
+
+    # Same order as save_feature_data, an existing npy file always has its statistics next to it
+    if 'stat' in data:
+        with open(base + '.stat.cpickle', 'wb') as f:
+            pickle.dump(data['stat'], f, protocol=pickle.HIGHEST_PROTOCOL)
+
+    temp_filename = feature_file + '.' + str(os.getpid()) + '.tmp'
+    with open(temp_filename, 'wb') as f:
+        numpy.save(f, numpy.asarray(data['feat']))
+    os.rename(temp_filename, feature_file)
+
+    if remove:
+        os.remove(filename)
+
+    return True
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(description='Convert pickled feature files into the npy feature store')
+    parser.add_argument('path', nargs='*', default=[os.path.join('saved', 'features')],
+                        help='feature trees to convert (default: saved/features)')
+    parser.add_argument('-remove', help='Remove pickled files after conversion', action='store_true',
+                        default=False, dest='remove')
+    parser.add_argument('-overwrite', help='Overwrite existing npy files', action='store_true',
+                        default=False, dest='overwrite')
+    args = parser.parse_args()
+
+    for path in args.path:
+        if not os.path.isdir(path):
+            raise IOError("Feature path not found [%s]" % path)
+
+        converted = 0
+        for root, dirs, files in os.walk(path):
+            for filename in sorted(files):
+                if filename.endswith('.cpickle'):
+                    if migrate_feature_file(os.path.join(root, filename),
+                                            remove=args.remove,
+                                            overwrite=args.overwrite):
+                        converted += 1
+
+        print path + ': ' + str(converted) + ' feature files converted'
+
+    return 0
+
+
+if __name__ == "__main__":
+    try:
+        sys.exit(main(sys.argv))
+    except (ValueError, IOError) as e:
+        sys.exit(e)
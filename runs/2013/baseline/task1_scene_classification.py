@@ -10,12 +10,14 @@ from src.files import *
 from src.features import *
 from src.dataset import *
 from src.evaluation import *
+from src.scene_classification import *
 
 import numpy
 import csv
 import argparse
 import textwrap
 import timeit
+import multiprocessing
 from sklearn.metrics import confusion_matrix
 
 from sklearn.externals import joblib
@@ -98,21 +100,19 @@ def main(argv):
         section_header('Feature extraction')
 
         # Collect files in train sets
-        files = []
-        for fold in dataset.folds(mode=dataset_evaluation_mode):
-            for item_id, item in enumerate(dataset.train(fold)):
-                if item['file'] not in files:
-                    files.append(item['file'])
-            for item_id, item in enumerate(dataset.test(fold)):
-                if item['file'] not in files:
-                    files.append(item['file'])
+        files = dataset.fold_files(folds=dataset.folds(mode=dataset_evaluation_mode))
         files = sorted(files)
 
         # Go through files and make sure all features are extracted
         do_feature_extraction(files=files,
                               dataset=dataset,
                               feature_path=params['path']['features'],
+                              feature_store=params['extraction']['store'],
                               params=params['features'],
+                              n_jobs=params['extraction']['n_jobs'],
+                              audio_cache_path=params['path']['audio_cache'],
+                              audio_cache_size=params['extraction']['audio_cache_size'],
+                              block_frames=params['extraction']['block_frames'],
                               overwrite=params['general']['overwrite'])
 
         foot()
@@ -125,6 +125,7 @@ def main(argv):
         do_feature_normalization(dataset=dataset,
                                  feature_normalizer_path=params['path']['feature_normalizers'],
                                  feature_path=params['path']['features'],
+                                 feature_store=params['extraction']['store'],
                                  dataset_evaluation_mode=dataset_evaluation_mode,
                                  overwrite=params['general']['overwrite'])
 
@@ -134,23 +135,32 @@ def main(argv):
     train_end = 0.0
     test_start = 0.0
     test_end = 0.0
+    fold_timings = {}
+
     # System training
     # ==================================================
     if params['flow']['train_system']:
         section_header('System training')
 	
 	train_start = timeit.default_timer()	
-        do_system_training(dataset=dataset,                           
-                           model_path=params['path']['models'],
-                           feature_normalizer_path=params['path']['feature_normalizers'],
-                           feature_path=params['path']['features'],
-                           feature_params=params['features'],
-                           classifier_params=params['classifier']['parameters'],
-                           classifier_method=params['classifier']['method'],
-                           dataset_evaluation_mode=dataset_evaluation_mode,
-                           clean_audio_errors=params['classifier']['audio_error_handling']['clean_data'],
-                           overwrite=params['general']['overwrite']
-                           )
+        fold_timings['train'] = run_folds(do_system_training,
+                                          folds=dataset.folds(mode=dataset_evaluation_mode),
+                                          fold_jobs=params['folds']['n_jobs'],
+                                          fold_threads=params['folds']['threads'],
+                                          result_container=final_result,
+                                          dataset=dataset,
+                                          model_path=params['path']['models'],
+                                          feature_normalizer_path=params['path']['feature_normalizers'],
+                                          feature_path=params['path']['features'],
+                                          feature_store=params['extraction']['store'],
+                                          n_jobs=params['training']['n_jobs'],
+                                          feature_params=params['features'],
+                                          classifier_params=params['classifier']['parameters'],
+                                          classifier_method=params['classifier']['method'],
+                                          dataset_evaluation_mode=dataset_evaluation_mode,
+                                          clean_audio_errors=params['classifier']['audio_error_handling']['clean_data'],
+                                          overwrite=params['general']['overwrite']
+                                          )
 	train_end = timeit.default_timer()
 
         foot()
@@ -163,16 +173,23 @@ def main(argv):
             section_header('System testing')
 	    test_start = timeit.default_timer()
 
-            do_system_testing(dataset=dataset,                              
-                              feature_path=params['path']['features'],
-                              result_path=params['path']['results'],
-                              model_path=params['path']['models'],
-                              feature_params=params['features'],
-                              dataset_evaluation_mode=dataset_evaluation_mode,
-                              classifier_method=params['classifier']['method'],
-                              clean_audio_errors=params['recognizer']['audio_error_handling']['clean_data'],
-                              overwrite=params['general']['overwrite']
-                              )
+            fold_timings['test'] = run_folds(do_system_testing,
+                                             folds=dataset.folds(mode=dataset_evaluation_mode),
+                                             fold_jobs=params['folds']['n_jobs'],
+                                             fold_threads=params['folds']['threads'],
+                                             result_container=final_result,
+                                             dataset=dataset,
+                                             feature_path=params['path']['features'],
+                                             feature_store=params['extraction']['store'],
+                                             result_path=params['path']['results'],
+                                             model_path=params['path']['models'],
+                                             feature_params=params['features'],
+                                             dataset_evaluation_mode=dataset_evaluation_mode,
+                                             classifier_method=params['classifier']['method'],
+                                             streaming=params['testing']['streaming'],
+                                             clean_audio_errors=params['recognizer']['audio_error_handling']['clean_data'],
+                                             overwrite=params['general']['overwrite']
+                                             )
             
  	    test_end = timeit.default_timer()
 
@@ -203,11 +220,13 @@ def main(argv):
 
             do_system_testing(dataset=challenge_dataset,                              
                               feature_path=params['path']['features'],
+                              feature_store=params['extraction']['store'],
                               result_path=params['path']['challenge_results'],
                               model_path=params['path']['models'],
                               feature_params=params['features'],
                               dataset_evaluation_mode=dataset_evaluation_mode,
                               classifier_method=params['classifier']['method'],
+                              streaming=params['testing']['streaming'],
                               clean_audio_errors=params['recognizer']['audio_error_handling']['clean_data'],
                               overwrite=True
                               )
@@ -218,6 +237,12 @@ def main(argv):
             print "Your results for the challenge data are stored at ["+params['path']['challenge_results']+"]"
             print " "
 
+    if fold_timings:
+        section_header('Fold timings')
+        fold_timing_summary(fold_timings)
+        foot()
+        final_result['fold_time'] = fold_timings
+
     tot_end = timeit.default_timer()
     print " "
     print "Train Time : " + str(train_end-train_start)
@@ -260,6 +285,23 @@ def process_parameters(params):
     # Copy parameters for current classifier method
     params['classifier']['parameters'] = params['classifier_parameters'][params['classifier']['method']]
 
+    # Streaming testing is not a model parameter, keep it out of the classifier hash
+    params['testing'] = {'streaming': params['classifier']['parameters'].pop('streaming', None)}
+
+    # Training worker count does not change the models, keep it out of the classifier hash
+    params['training'] = {'n_jobs': params['classifier']['parameters'].pop('n_jobs', 1)}
+
+    # Fold scheduling does not change the models or results, keep it out of the hashes
+    params['folds'] = {'n_jobs': params['general'].pop('fold_jobs', 1),
+                       'threads': params['general'].pop('fold_threads', 0)}
+
+    # Worker count, feature file format, audio cache and extraction blocks do not change the features, keep them
+    # out of the feature hash
+    params['extraction'] = {'n_jobs': params['features'].pop('n_jobs', 1),
+                            'store': params['features'].pop('store', 'cpickle'),
+                            'audio_cache_size': params['features'].pop('audio_cache_size', 0),
+                            'block_frames': params['features'].pop('block_frames', 0)}
+
     # Hash
     params['features']['hash'] = get_parameter_hash(params['features'])
 
@@ -302,6 +344,14 @@ def process_parameters(params):
                                              params['classifier']['hash'],
                                              params['recognizer']['hash'])
 
+    # Early decisions change the results, streaming results are kept apart from whole file results
+    if params['testing']['streaming'] and params['testing']['streaming'].get('block_frames'):
+        params['path']['results'] = os.path.join(params['path']['results'], 'streaming_' +
+                                                 get_parameter_hash(params['testing']['streaming']))
+
+    # Resampled audio cache
+    params['path']['audio_cache'] = os.path.join(params['path']['base'], params['path']['audio_cache'])
+
     return params
 
 
@@ -458,6 +508,241 @@ def get_model_filename(fold, path, extension='cpickle'):
     return os.path.join(path, 'model_fold' + str(fold) + '.' + extension)
 
 
+def get_audio_error_mask(dataset, item, frame_count, hop_length_seconds):
+    """Frames to keep when removing audio errors from a file
+
+    Parameters
+    ----------
+    dataset : class
+        dataset class
+
+    item : dict
+        file meta item
+
+    frame_count : int
+        number of frames in the feature matrix
+
+    hop_length_seconds : float > 0
+        feature extraction frame hop length in seconds
+
+    Returns
+    -------
+    removal_mask : numpy.ndarray [shape=(frame_count,)] or None
+        False for frames inside audio errors, None if the file has no audio errors
+
+    """
+
+    current_errors = dataset.file_error_meta(item['file'])
+    if not current_errors:
+        return None
+
+    removal_mask = numpy.ones((frame_count), dtype=bool)
+    for error_event in current_errors:
+        onset_frame = int(numpy.floor(error_event['event_onset'] / hop_length_seconds))
+        offset_frame = int(numpy.ceil(error_event['event_offset'] / hop_length_seconds))
+        if offset_frame > frame_count:
+            offset_frame = frame_count
+        removal_mask[onset_frame:offset_frame] = False
+    return removal_mask
+
+
+def get_shard_filename(fold, path, extension='npy'):
+    """Get training shard filename
+
+    Parameters
+    ----------
+    fold : int >= 0
+        evaluation fold number
+
+    path :  str
+        shard path
+
+    extension : str
+        file extension, npy for the feature matrix and cpickle for the shard index
+        (Default value='npy')
+
+    Returns
+    -------
+    shard_filename : str
+        full shard filename
+
+    """
+
+    return os.path.join(path, 'shard_fold' + str(fold) + '.' + extension)
+
+
+def load_training_shard(fold, path):
+    """Load training shard, the feature matrix is memory-mapped read-only
+
+    Parameters
+    ----------
+    fold : int >= 0
+        evaluation fold number
+
+    path :  str
+        shard path
+
+    Returns
+    -------
+    shard : dict
+        shard index with the feature matrix added as 'feat', see do_training_shard
+
+    """
+
+    shard = load_data(get_shard_filename(fold=fold, path=path, extension='cpickle'))
+    shard['feat'] = numpy.load(get_shard_filename(fold=fold, path=path), mmap_mode='r')
+    return shard
+
+
+def do_training_shard(dataset, fold, shard_path, feature_path, normalizer, feature_store='cpickle',
+                      clean_audio_errors=False, feature_params=None):
+    """Pack the normalized training data of a fold into one shard
+
+    Frames are written into one preallocated matrix on disk, grouped by class label, with the label of
+    each frame in label_ids. Frame counts are read from the feature statistics, so each feature file
+    is loaded once.
+
+    Shard index format:
+
+    {
+        'labels': class labels in order of first appearance in the training set
+        'label_offsets': {label: (first frame, last frame + 1)}
+        'label_ids': numpy.ndarray [shape=(frames,)], index into labels for each frame
+        'files': training files in shard order
+        'file_offsets': numpy.ndarray [shape=(files + 1,)], first frame of each file
+    }
+
+    Parameters
+    ----------
+    dataset : class
+        dataset class
+
+    fold : int >= 0
+        evaluation fold number
+
+    shard_path : str
+        path where the shards are saved
+
+    feature_path : str
+        path where the features are saved
+
+    normalizer : FeatureNormalizer
+        feature normalizer of the fold
+
+    feature_store : str {'cpickle', 'npy'}
+        feature file format, see save_feature_data
+        (Default value='cpickle')
+
+    clean_audio_errors : bool
+        Remove audio errors from the training data
+        (Default value=False)
+
+    feature_params : dict or None
+        parameter dict, hop_length_seconds is used to remove audio errors
+        (Default value=None)
+
+    Returns
+    -------
+    nothing
+
+    Raises
+    -------
+    IOError
+        Feature file not found.
+
+    ValueError
+        Feature statistics do not match the feature file.
+
+    """
+
+    # Check that target path exists, create if not
+    check_path(shard_path)
+
+    # Training files per class label
+    label_items = {}
+    labels = []
+    for item in dataset.train(fold):
+        if item['scene_label'] not in label_items:
+            label_items[item['scene_label']] = []
+            labels.append(item['scene_label'])
+        label_items[item['scene_label']].append(item)
+
+    # Frame counts, so the shard can be preallocated
+    items = []
+    frame_counts = []
+    label_offsets = {}
+    for label in label_items:
+        label_start = sum(frame_counts)
+        for item in label_items[label]:
+            feature_filename = get_feature_filename(audio_file=item['file'], path=feature_path,
+                                                    extension=feature_store)
+            if not os.path.isfile(feature_filename):
+                raise IOError("Features not found [%s]" % (item['file']))
+
+            frame_count = load_feature_data(feature_filename, part='stat')['N']
+            if clean_audio_errors:
+                removal_mask = get_audio_error_mask(dataset=dataset, item=item, frame_count=frame_count,
+                                                    hop_length_seconds=feature_params['hop_length_seconds'])
+                if removal_mask is not None:
+                    frame_count = int(numpy.sum(removal_mask))
+
+            items.append(item)
+            frame_counts.append(frame_count)
+        label_offsets[label] = (label_start, sum(frame_counts))
+
+    file_offsets = numpy.cumsum([0] + frame_counts)
+    label_ids = numpy.empty(file_offsets[-1], dtype=int)
+    for label in label_offsets:
+        label_ids[label_offsets[label][0]:label_offsets[label][1]] = labels.index(label)
+
+    # Index first, an existing shard matrix always has its index next to it
+    save_data(get_shard_filename(fold=fold, path=shard_path, extension='cpickle'), {
+        'labels': labels,
+        'label_offsets': label_offsets,
+        'label_ids': label_ids,
+        'files': [item['file'] for item in items],
+        'file_offsets': file_offsets,
+    })
+
+    shard_filename = get_shard_filename(fold=fold, path=shard_path)
+    temp_filename = shard_filename + '.' + str(os.getpid()) + '.tmp'
+    shard = None
+    for item_id, item in enumerate(items):
+        progress(title_text='Packing data',
+                 fold=fold,
+                 percentage=(float(item_id) / len(items)),
+                 note=os.path.split(item['file'])[1])
+
+        feature_filename = get_feature_filename(audio_file=item['file'], path=feature_path,
+                                                extension=feature_store)
+        feature_data = load_feature_data(feature_filename, part='feat')
+
+        # Audio error removal
+        if clean_audio_errors:
+            removal_mask = get_audio_error_mask(dataset=dataset, item=item, frame_count=feature_data.shape[0],
+                                                hop_length_seconds=feature_params['hop_length_seconds'])
+            if removal_mask is not None:
+                feature_data = feature_data[removal_mask, :]
+
+        if feature_data.shape[0] != frame_counts[item_id]:
+            raise ValueError("Feature statistics do not match features [%s]" % feature_filename)
+
+        if shard is None:
+            shard = numpy.lib.format.open_memmap(temp_filename,
+                                                 mode='w+',
+                                                 dtype=numpy.result_type(feature_data, normalizer.mean),
+                                                 shape=(file_offsets[-1], feature_data.shape[1]))
+        shard[file_offsets[item_id]:file_offsets[item_id + 1]] = feature_data
+
+        # Scale features in the shard itself
+        normalizer.normalize(shard[file_offsets[item_id]:file_offsets[item_id + 1]], in_place=True)
+
+    if shard is not None:
+        shard.flush()
+        del shard
+        os.rename(temp_filename, shard_filename)
+
+
 def get_result_filename(fold, path, extension='txt'):
     """Get result filename
 
@@ -486,9 +771,15 @@ def get_result_filename(fold, path, extension='txt'):
         return os.path.join(path, 'results_fold' + str(fold) + '.' + extension)
 
 
-def do_feature_extraction(files, dataset, feature_path, params, overwrite=False):
+def do_feature_extraction(files, dataset, feature_path, params, overwrite=False, n_jobs=1, feature_store='cpickle',
+                          audio_cache_path=None, audio_cache_size=0, block_frames=0):
     """Feature extraction
 
+    Files are independent, so they are processed by a pool of worker processes. Files with
+    existing feature files are skipped before any work is dispatched, and progress is reported
+    from the main process as workers finish. Statistics of the extracted files are added to the
+    statistics index of the feature path, see load_feature_stats.
+
     Parameters
     ----------
     files : list
@@ -500,6 +791,10 @@ def do_feature_extraction(files, dataset, feature_path, params, overwrite=False)
     feature_path : str
         path where the features are saved
 
+    feature_store : str {'cpickle', 'npy'}
+        feature file format, see save_feature_data
+        (Default value='cpickle')
+
     params : dict
         parameter dict
 
@@ -507,6 +802,23 @@ def do_feature_extraction(files, dataset, feature_path, params, overwrite=False)
         overwrite existing feature files
         (Default value=False)
 
+    n_jobs : int
+        number of worker processes, -1 uses all CPU cores, 1 extracts in the main process
+        (Default value=1)
+
+    audio_cache_path : str
+        path of the resampled audio cache shared by all runs, see load_audio
+        (Default value=None)
+
+    audio_cache_size : float
+        size limit of the resampled audio cache in GB, 0 disables the cache
+        (Default value=0)
+
+    block_frames : int
+        frames per extraction block, longer recordings are extracted and saved block by block,
+        0 extracts whole files at once
+        (Default value=0)
+
     Returns
     -------
     nothing
@@ -521,35 +833,100 @@ def do_feature_extraction(files, dataset, feature_path, params, overwrite=False)
     # Check that target path exists, create if not
     check_path(feature_path)
 
-    for file_id, audio_filename in enumerate(files):
-        # Get feature filename
-        current_feature_file = get_feature_filename(audio_file=os.path.split(audio_filename)[1], path=feature_path)
+    # Resampled audio cache, shared by the workers
+    if audio_cache_path and audio_cache_size > 0:
+        check_path(audio_cache_path)
+        audio_cache_size = int(audio_cache_size * 1024 ** 3)
+    else:
+        audio_cache_path = None
 
-        progress(title_text='Extracting',
-                 percentage=(float(file_id) / len(files)),
-                 note=os.path.split(audio_filename)[1])
+    # Collect files without features, make sure audio is there before starting the workers
+    jobs = []
+    for audio_filename in files:
+        # Get feature filename
+        current_feature_file = get_feature_filename(audio_file=os.path.split(audio_filename)[1], path=feature_path,
+                                                    extension=feature_store)
 
         if not os.path.isfile(current_feature_file) or overwrite:
-            # Load audio data
-            if os.path.isfile(dataset.relative_to_absolute_path(audio_filename)):
-                y, fs = load_audio(filename=dataset.relative_to_absolute_path(audio_filename), mono=True, fs=params['fs'])
-            else:
+            if not os.path.isfile(dataset.relative_to_absolute_path(audio_filename)):
                 raise IOError("Audio file not found [%s]" % audio_filename)
 
-            # Extract features
-            feature_data = feature_extraction(y=y,
-                                              fs=fs,
-                                              include_mfcc0=params['include_mfcc0'],
-                                              include_delta=params['include_delta'],
-                                              include_acceleration=params['include_acceleration'],
-                                              mfcc_params=params['mfcc'],
-                                              delta_params=params['mfcc_delta'],
-                                              acceleration_params=params['mfcc_acceleration'])
-            # Save
-            save_data(current_feature_file, feature_data)
+            jobs.append((dataset.relative_to_absolute_path(audio_filename), current_feature_file, feature_path, params,
+                         audio_cache_path, audio_cache_size, block_frames))
 
+    if n_jobs < 0:
+        n_jobs = max(multiprocessing.cpu_count() + 1 + n_jobs, 1)
 
-def do_feature_normalization(dataset, feature_normalizer_path, feature_path, dataset_evaluation_mode='folds', overwrite=False):
+    pool = None
+    if n_jobs > 1 and len(jobs) > 1:
+        pool = multiprocessing.Pool(processes=min(n_jobs, len(jobs)))
+        extracted = pool.imap_unordered(do_feature_extraction_file, jobs)
+    else:
+        extracted = (do_feature_extraction_file(job) for job in jobs)
+
+    stats = {}
+    try:
+        for job_id, (audio_filename, current_feature_file, stat) in enumerate(extracted):
+            stats[current_feature_file] = stat
+            progress(title_text='Extracting',
+                     percentage=(float(job_id + 1) / len(jobs)),
+                     note=os.path.split(audio_filename)[1])
+    finally:
+        if pool is not None:
+            pool.terminate()
+            pool.join()
+
+        # Statistics of the files extracted so far, also when interrupted
+        update_feature_stat_index(stats)
+
+
+def do_feature_extraction_file(job):
+    """Feature extraction for one audio file, run in a worker process
+
+    Parameters
+    ----------
+    job : tuple
+        absolute audio filename, feature filename, feature path, parameter dict, audio cache path,
+        audio cache size in bytes and frames per extraction block
+
+    Returns
+    -------
+    audio_filename : str
+        absolute audio filename
+
+    current_feature_file : str
+        feature filename
+
+    stat : dict or None
+        feature statistics, see save_feature_data
+
+    """
+
+    audio_filename, current_feature_file, feature_path, params, audio_cache_path, audio_cache_size, block_frames = job
+
+    # Load audio data
+    y, fs = load_audio(filename=audio_filename, mono=True, fs=params['fs'],
+                       cache_path=audio_cache_path, cache_size=audio_cache_size)
+
+    # Extract features
+    feature_data = feature_extraction(y=y,
+                                      fs=fs,
+                                      include_mfcc0=params['include_mfcc0'],
+                                      include_delta=params['include_delta'],
+                                      include_acceleration=params['include_acceleration'],
+                                      mfcc_params=params['mfcc'],
+                                      delta_params=params['mfcc_delta'],
+                                      acceleration_params=params['mfcc_acceleration'],
+                                      block_frames=block_frames)
+
+    # Save
+    stat = save_feature_data(current_feature_file, feature_data)
+
+    return audio_filename, current_feature_file, stat
+
+
+def do_feature_normalization(dataset, feature_normalizer_path, feature_path, dataset_evaluation_mode='folds', overwrite=False,
+                             feature_store='cpickle'):
     """Feature normalization
 
     Calculated normalization factors for each evaluation fold based on the training material available.
@@ -565,6 +942,10 @@ def do_feature_normalization(dataset, feature_normalizer_path, feature_path, dat
     feature_path : str
         path where the features are saved.
 
+    feature_store : str {'cpickle', 'npy'}
+        feature file format, see save_feature_data
+        (Default value='cpickle')
+
     dataset_evaluation_mode : str ['folds', 'full']
         evaluation mode, 'full' all material available is considered to belong to one fold.
         (Default value='folds')
@@ -591,24 +972,12 @@ def do_feature_normalization(dataset, feature_normalizer_path, feature_path, dat
         current_normalizer_file = get_feature_normalizer_filename(fold=fold, path=feature_normalizer_path)
 
         if not os.path.isfile(current_normalizer_file) or overwrite:
-            # Initialize statistics
-            file_count = len(dataset.train(fold))
+            # Statistics of the training files, taken from the statistics index of the feature path
+            feature_files = [get_feature_filename(audio_file=item['file'], path=feature_path, extension=feature_store)
+                             for item in dataset.train(fold)]
             normalizer = FeatureNormalizer()
+            normalizer.accumulate(load_feature_stats(feature_files))
 
-            for item_id, item in enumerate(dataset.train(fold)):
-                progress(title_text='Collecting data',
-                         fold=fold,
-                         percentage=(float(item_id) / file_count),
-                         note=os.path.split(item['file'])[1])
-                # Load features
-                if os.path.isfile(get_feature_filename(audio_file=item['file'], path=feature_path)):
-                    feature_data = load_data(get_feature_filename(audio_file=item['file'], path=feature_path))['stat']
-                else:
-                    raise IOError("Feature file not found [%s]" % (item['file']))
-
-                # Accumulate statistics
-                normalizer.accumulate(feature_data)
-            
             # Calculate normalization factors
             normalizer.finalize()
 
@@ -617,7 +986,8 @@ def do_feature_normalization(dataset, feature_normalizer_path, feature_path, dat
 
 
 def do_system_training(dataset, model_path, feature_normalizer_path, feature_path, feature_params, classifier_params,
-                       dataset_evaluation_mode='folds', classifier_method='gmm', clean_audio_errors=False, overwrite=False):
+                       dataset_evaluation_mode='folds', classifier_method='gmm', clean_audio_errors=False, overwrite=False,
+                       feature_store='cpickle', n_jobs=1, folds=None):
     """System training
 
     model container format:
@@ -646,6 +1016,10 @@ def do_system_training(dataset, model_path, feature_normalizer_path, feature_pat
     feature_path : str
         path where the features are saved.
 
+    feature_store : str {'cpickle', 'npy'}
+        feature file format, see save_feature_data
+        (Default value='cpickle')
+
     feature_params : dict
         parameter dict
 
@@ -668,6 +1042,14 @@ def do_system_training(dataset, model_path, feature_normalizer_path, feature_pat
         overwrite existing models
         (Default value=False)
 
+    n_jobs : int
+        number of worker processes for training the class models, -1 uses all CPU cores
+        (Default value=1)
+
+    folds : list of int or None
+        folds to process, None processes all folds of the evaluation mode
+        (Default value=None)
+
     Returns
     -------
     nothing
@@ -689,7 +1071,15 @@ def do_system_training(dataset, model_path, feature_normalizer_path, feature_pat
     # Check that target path exists, create if not
     check_path(model_path)
 
-    for fold in dataset.folds(mode=dataset_evaluation_mode):
+    # Shards depend on the features and the fold normalizer, keep them next to the normalizers
+    shard_path = feature_normalizer_path
+    if clean_audio_errors:
+        shard_path = os.path.join(feature_normalizer_path, 'clean_audio_errors')
+
+    if folds is None:
+        folds = dataset.folds(mode=dataset_evaluation_mode)
+
+    for fold in folds:
         current_model_file = get_model_filename(fold=fold, path=model_path)
         if not os.path.isfile(current_model_file) or overwrite:
             # Load normalizer
@@ -702,60 +1092,43 @@ def do_system_training(dataset, model_path, feature_normalizer_path, feature_pat
             # Initialize model container
             model_container = {'normalizer': normalizer, 'models': {}}
 
-            # Collect training examples
-            file_count = len(dataset.train(fold))
+            # Collect training examples, packed into one shard per fold and feature parameter hash
+            if not os.path.isfile(get_shard_filename(fold=fold, path=shard_path)) or \
+                    os.path.getmtime(get_shard_filename(fold=fold, path=shard_path)) < \
+                    os.path.getmtime(feature_normalizer_filename):
+                do_training_shard(dataset=dataset,
+                                  fold=fold,
+                                  shard_path=shard_path,
+                                  feature_path=feature_path,
+                                  normalizer=model_container['normalizer'],
+                                  feature_store=feature_store,
+                                  clean_audio_errors=clean_audio_errors,
+                                  feature_params=feature_params)
+            shard = load_training_shard(fold=fold, path=shard_path)
+
+            # Features per class label, views into the shard
             data = {}
-            for item_id, item in enumerate(dataset.train(fold)):
-                progress(title_text='Collecting data',
-                         fold=fold,
-                         percentage=(float(item_id) / file_count),
-                         note=os.path.split(item['file'])[1])
-
-                # Load features
-                feature_filename = get_feature_filename(audio_file=item['file'], path=feature_path)
-                if os.path.isfile(feature_filename):
-                    feature_data = load_data(feature_filename)['feat']
-                else:
-                    raise IOError("Features not found [%s]" % (item['file']))
-
-                # Scale features
-                feature_data = model_container['normalizer'].normalize(feature_data)
-
-                # Audio error removal
-                if clean_audio_errors:
-                    current_errors = dataset.file_error_meta(item['file'])
-                    if current_errors:
-                        removal_mask = numpy.ones((feature_data.shape[0]), dtype=bool)
-                        for error_event in current_errors:
-                            onset_frame = int(numpy.floor(error_event['event_onset'] / feature_params['hop_length_seconds']))
-                            offset_frame = int(numpy.ceil(error_event['event_offset'] / feature_params['hop_length_seconds']))
-                            if offset_frame > feature_data.shape[0]:
-                                offset_frame = feature_data.shape[0]
-                            removal_mask[onset_frame:offset_frame] = False
-                        feature_data = feature_data[removal_mask, :]
-
-                # Store features per class label
-                if item['scene_label'] not in data:
-                    data[item['scene_label']] = feature_data
-                else:
-                    data[item['scene_label']] = numpy.vstack((data[item['scene_label']], feature_data))
+            for label in shard['labels']:
+                data[label] = shard['feat'][shard['label_offsets'][label][0]:shard['label_offsets'][label][1]]
 
             # Train models for each class
-            for label in data:
+            if classifier_method == 'gmm':
                 progress(title_text='Train models',
                          fold=fold,
-                         note=label)
-                if classifier_method == 'gmm':
-                    model_container['models'][label] = mixture.GMM(**classifier_params).fit(data[label])
-                else:
-                    raise ValueError("Unknown classifier method ["+classifier_method+"]")
+                         note=str(len(data)) + ' classes')
+                model_container['models'] = fit_gmm_models(training_data=data,
+                                                           classifier_params=classifier_params,
+                                                           n_jobs=n_jobs)
+            else:
+                raise ValueError("Unknown classifier method [" + classifier_method + "]")
 
             # Save models
             save_data(current_model_file, model_container)
 
 
 def do_system_testing(dataset, result_path, feature_path, model_path, feature_params,
-                      dataset_evaluation_mode='folds', classifier_method='gmm', clean_audio_errors=False, overwrite=False):
+                      dataset_evaluation_mode='folds', classifier_method='gmm', clean_audio_errors=False, overwrite=False,
+                      streaming=None, feature_store='cpickle', folds=None):
     """System testing.
 
     If extracted features are not found from disk, they are extracted but not saved.
@@ -771,6 +1144,10 @@ def do_system_testing(dataset, result_path, feature_path, model_path, feature_pa
     feature_path : str
         path where the features are saved.
 
+    feature_store : str {'cpickle', 'npy'}
+        feature file format, see save_feature_data
+        (Default value='cpickle')
+
     model_path : str
         path where the models are saved.
 
@@ -793,6 +1170,16 @@ def do_system_testing(dataset, result_path, feature_path, model_path, feature_pa
         overwrite existing models
         (Default value=False)
 
+    streaming : dict or None
+        streaming classification, files are scored in blocks of block_frames frames with
+        StreamingSceneClassifier, which stops early once the best class leads by decision_margin
+        after minimum_frames, None or block_frames 0 classifies whole files
+        (Default value=None)
+
+    folds : list of int or None
+        folds to process, None processes all folds of the evaluation mode
+        (Default value=None)
+
     Returns
     -------
     nothing
@@ -814,7 +1201,10 @@ def do_system_testing(dataset, result_path, feature_path, model_path, feature_pa
     # Check that target path exists, create if not
     check_path(result_path)
 
-    for fold in dataset.folds(mode=dataset_evaluation_mode):
+    if folds is None:
+        folds = dataset.folds(mode=dataset_evaluation_mode)
+
+    for fold in folds:
         current_result_file = get_result_filename(fold=fold, path=result_path)
         if not os.path.isfile(current_result_file) or overwrite:
             results = []
@@ -826,6 +1216,17 @@ def do_system_testing(dataset, result_path, feature_path, model_path, feature_pa
             else:
                 raise IOError("Model file not found [%s]" % model_filename)
 
+            # Streaming classifier for the fold, files are classified block by block
+            streaming_classifier = None
+            if streaming and streaming.get('block_frames'):
+                block_frames = streaming['block_frames']
+                frame_scorer = get_gmm_frame_scorer(model_container['models'])
+                labels = list(model_container['models'])
+                streaming_classifier = StreamingSceneClassifier(frame_scorer=frame_scorer,
+                                                                labels=labels,
+                                                                decision_margin=streaming.get('decision_margin'),
+                                                                minimum_frames=streaming.get('minimum_frames', 0))
+
             file_count = len(dataset.test(fold))
             for file_id, item in enumerate(dataset.test(fold)):
                 progress(title_text='Testing',
@@ -834,10 +1235,11 @@ def do_system_testing(dataset, result_path, feature_path, model_path, feature_pa
                          note=os.path.split(item['file'])[1])
                 
                 # Load features
-                feature_filename = get_feature_filename(audio_file=item['file'], path=feature_path)
+                feature_filename = get_feature_filename(audio_file=item['file'], path=feature_path,
+                                                        extension=feature_store)
 
                 if os.path.isfile(feature_filename):
-                    feature_data = load_data(feature_filename)['feat']
+                    feature_data = load_feature_data(feature_filename, part='feat')
                 else:
                     # Load audio
                     if os.path.isfile(dataset.relative_to_absolute_path(item['file'])):
@@ -856,7 +1258,7 @@ def do_system_testing(dataset, result_path, feature_path, model_path, feature_pa
                                                       statistics=False)['feat']
 
                 # Scale features
-                feature_data = model_container['normalizer'].normalize(feature_data)
+                feature_data = model_container['normalizer'].normalize(feature_data, in_place=True)
 
                 if clean_audio_errors:
                     current_errors = dataset.file_error_meta(item['file'])
@@ -870,6 +1272,17 @@ def do_system_testing(dataset, result_path, feature_path, model_path, feature_pa
                             removal_mask[onset_frame:offset_frame] = False
                         feature_data = feature_data[removal_mask, :]
 
+                # Classify the file block by block
+                if streaming_classifier is not None:
+                    streaming_classifier.reset()
+                    for start in range(0, feature_data.shape[0], block_frames):
+                        block_data = feature_data[start:start + block_frames]
+                        if streaming_classifier.process(block_data)['stopped']:
+                            break
+                    decision = streaming_classifier.decision()
+                    results.append((dataset.absolute_to_relative(item['file']), decision['label']))
+                    continue
+
                 # Do classification for the block
                 if classifier_method == 'gmm':
                     current_result = do_classification_gmm(feature_data, model_container)
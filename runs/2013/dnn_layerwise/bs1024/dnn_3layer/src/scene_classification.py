@@ -0,0 +1,216 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import numpy
+
+
+def get_gmm_frame_scorer(models, labels=None):
+    """Frame scorer of GMM scene models, see StreamingSceneClassifier
+
+    Parameters
+    ----------
+    models : dict
+        mixture.GMM for each scene label, model container 'models' entry
+
+    labels : list of str or None
+        class order of the score columns, None uses the iteration order of models
+        (Default value=None)
+
+    Returns
+    -------
+    frame_scorer : function
+        maps a feature matrix [shape=(t, feature vector length)] to frame log-likelihoods [shape=(t, classes)]
+
+    """
+
+    if labels is None:
+        labels = list(models)
+
+    def frame_scorer(feature_data):
+        return numpy.column_stack([models[label].score(feature_data) for label in labels])
+
+    return frame_scorer
+
+
+def get_log_probabilities(probabilities, minimum_probability=1e-10):
+    """Log of frame class probabilities with a floor
+
+    A single frame with a zero probability would otherwise rule its class out with -inf. The batch DNN
+    classifiers and get_probability_frame_scorer take their logs here, so streaming and whole file
+    classification make the same decisions.
+
+    Parameters
+    ----------
+    probabilities : numpy.ndarray [shape=(t, classes)]
+        frame class probabilities
+
+    minimum_probability : float > 0.0
+        probabilities are clipped to this floor before the log
+        (Default value=1e-10)
+
+    Returns
+    -------
+    log_probabilities : numpy.ndarray [shape=(t, classes)]
+        frame log-probabilities
+
+    """
+
+    return numpy.log(numpy.clip(probabilities, minimum_probability, 1.0))
+
+
+def get_probability_frame_scorer(model, method='predict_proba', minimum_probability=1e-10):
+    """Frame scorer of a classifier with frame class probabilities (DNN, xgboost), see StreamingSceneClassifier
+
+    Parameters
+    ----------
+    model : object
+        fitted classifier
+
+    method : str
+        classifier method returning the class probabilities [shape=(t, classes)]
+        (Default value='predict_proba')
+
+    minimum_probability : float > 0.0
+        probability floor, see get_log_probabilities
+        (Default value=1e-10)
+
+    Returns
+    -------
+    frame_scorer : function
+        maps a feature matrix [shape=(t, feature vector length)] to frame log-probabilities [shape=(t, classes)]
+
+    """
+
+    def frame_scorer(feature_data):
+        return get_log_probabilities(getattr(model, method)(feature_data), minimum_probability=minimum_probability)
+
+    return frame_scorer
+
+
+class StreamingSceneClassifier(object):
+    """Online acoustic scene classifier
+
+    Accumulates class log-likelihoods block by block, the running decision is the argmax of the sums, the
+    same decision do_classification_gmm and do_classification_dnn make for the whole recording. With a
+    decision margin the classifier stops once the sum of the best class leads the second best by the
+    margin, later blocks are not scored.
+
+    Examples
+    --------
+
+    >>> classifier = StreamingSceneClassifier(frame_scorer=get_gmm_frame_scorer(model_container['models']),
+    >>>                                       labels=list(model_container['models']),
+    >>>                                       decision_margin=500.0)
+    >>> for feature_data in feature_blocks:
+    >>>     decision = classifier.process(model_container['normalizer'].normalize(feature_data))
+    >>>     if decision['stopped']:
+    >>>         break
+    >>>
+    >>> scene_label = decision['label']
+
+    """
+
+    def __init__(self, frame_scorer, labels, decision_margin=None, minimum_frames=0):
+        """__init__ method.
+
+        Parameters
+        ----------
+        frame_scorer : function
+            maps a feature matrix [shape=(t, feature vector length)] to frame log-likelihoods [shape=(t, classes)],
+            see get_gmm_frame_scorer and get_probability_frame_scorer
+
+        labels : list
+            class labels in the order of the score columns
+
+        decision_margin : float > 0.0 or None
+            log-likelihood lead of the best class over the second best for an early decision, None never stops
+            (Default value=None)
+
+        minimum_frames : int >= 0
+            frames accumulated before an early decision is allowed
+            (Default value=0)
+
+        """
+
+        self.frame_scorer = frame_scorer
+        self.labels = list(labels)
+        self.decision_margin = decision_margin
+        self.minimum_frames = minimum_frames
+        self.reset()
+
+    def reset(self):
+        """Start a new recording
+
+        Returns
+        -------
+        nothing
+
+        """
+
+        self.logls = numpy.zeros(len(self.labels))
+        self.frame_count = 0
+        self.stopped = False
+
+    def process(self, feature_data):
+        """Accumulate a block of feature frames
+
+        Blocks after an early decision are ignored.
+
+        Parameters
+        ----------
+        feature_data : numpy.ndarray [shape=(t, feature vector length)]
+            normalized feature frames following the previous block
+
+        Returns
+        -------
+        decision : dict
+            running decision, see decision
+
+        """
+
+        if not self.stopped and feature_data.shape[0]:
+            self.logls += numpy.sum(self.frame_scorer(feature_data), axis=0)
+            self.frame_count += feature_data.shape[0]
+
+            if (self.decision_margin is not None and self.frame_count >= self.minimum_frames and
+                    self.margin() >= self.decision_margin):
+                self.stopped = True
+
+        return self.decision()
+
+    def margin(self):
+        """Log-likelihood lead of the best class over the second best
+
+        Returns
+        -------
+        margin : float
+            lead, inf with a single class
+
+        """
+
+        if len(self.labels) < 2:
+            return numpy.inf
+
+        second, first = numpy.sort(self.logls)[-2:]
+        return first - second
+
+    def decision(self):
+        """Running decision
+
+        Returns
+        -------
+        decision : dict
+            'class_id' and 'label' of the best class, accumulated 'logls', decision 'margin', 'frames' accumulated
+            and whether the classifier 'stopped' early
+
+        """
+
+        class_id = numpy.argmax(self.logls)
+        return {
+            'class_id': class_id,
+            'label': self.labels[class_id],
+            'logls': self.logls.copy(),
+            'margin': self.margin(),
+            'frames': self.frame_count,
+            'stopped': self.stopped,
+        }
@@ -1,6 +1,8 @@
 #!/usr/bin/env python
 # -*- coding: utf-8 -*-
 
+import bisect
+import collections
 import sys
 import numpy
 import math
@@ -197,6 +199,11 @@ class EventDetectionMetrics(object):
     """Baseclass for sound event metric classes.
     """
 
+    # Event rolls of reference annotations, shared by all metric instances, see reference_roll
+    # Rolls of long files at a fine time resolution take megabytes each, so only a few are kept
+    roll_cache = collections.OrderedDict()
+    roll_cache_size = 16
+
     def __init__(self, class_list):
         """__init__ method.
 
@@ -208,6 +215,10 @@ class EventDetectionMetrics(object):
         """
 
         self.class_list = class_list
+        self.class_index = {}
+        for class_id, class_label in enumerate(class_list):
+            self.class_index.setdefault(class_label, class_id)
+
         self.eps = numpy.spacing(1)
 
     def max_event_offset(self, data):
@@ -246,23 +257,186 @@ class EventDetectionMetrics(object):
         -------
         event_roll : numpy.ndarray [shape=(math.ceil(data_length * 1 / time_resolution) + 1, amount of classes)]
             Event roll
+
+        Raises
+        -------
+        ValueError
+            Event label not in class list.
+
         """
 
         # Initialize
-        data_length = self.max_event_offset(data)
-        event_roll = numpy.zeros((math.ceil(data_length * 1 / time_resolution) + 1, len(self.class_list)))
+        pos = numpy.zeros(len(data), dtype=int)
+        for event_id, event in enumerate(data):
+            if event['event_label'].rstrip() not in self.class_index:
+                raise ValueError("Unknown event label [%s]" % event['event_label'])
+            pos[event_id] = self.class_index[event['event_label'].rstrip()]
 
-        # Fill-in event_roll
-        for event in data:
-            pos = self.class_list.index(event['event_label'].rstrip())
+        onsets = numpy.array([event['event_onset'] for event in data], dtype=float)
+        offsets = numpy.array([event['event_offset'] for event in data], dtype=float)
 
-            onset = math.floor(event['event_onset'] * 1 / time_resolution)
-            offset = math.ceil(event['event_offset'] * 1 / time_resolution) + 1
+        data_length = max(numpy.max(offsets), 0) if len(data) else 0
+        segment_count = int(math.ceil(data_length * 1 / time_resolution)) + 1
 
-            event_roll[onset:offset, pos] = 1
+        onset = numpy.clip(numpy.floor(onsets * 1 / time_resolution).astype(int), 0, segment_count)
+        offset = numpy.clip(numpy.ceil(offsets * 1 / time_resolution).astype(int) + 1, 0, segment_count)
+        length = numpy.maximum(offset - onset, 0)
+
+        # Fill-in event_roll, flat indices of onset:offset segments of all events at once
+        segments = numpy.arange(numpy.sum(length)) + numpy.repeat(onset - (numpy.cumsum(length) - length), length)
+
+        event_roll = numpy.zeros((segment_count, len(self.class_list)))
+        event_roll.ravel()[segments * len(self.class_list) + numpy.repeat(pos, length)] = 1
 
         return event_roll
 
+    def reference_roll(self, data, time_resolution=0.01, reference_file=None):
+        """Event roll of reference annotations, cached.
+
+        Rolls are cached by file, annotated events, time resolution and class list in a cache shared by
+        all metric instances, so evaluating several system outputs against the same annotations converts
+        them only once. Other annotations of the same file get their own roll. Cached rolls are read-only.
+
+        Parameters
+        ----------
+        data : list
+            Event list, list of event dicts
+
+        time_resolution : float > 0
+            Time resolution used when converting event into event roll.
+
+        reference_file : str
+            Annotated file, the roll is not cached if None.
+            (Default value = None)
+
+        Returns
+        -------
+        event_roll : numpy.ndarray [shape=(math.ceil(data_length * 1 / time_resolution) + 1, amount of classes)]
+            Event roll
+
+        """
+
+        if reference_file is None:
+            return self.list_to_roll(data=data, time_resolution=time_resolution)
+
+        key = (reference_file,
+               tuple((event['event_onset'], event['event_offset'], event['event_label']) for event in data),
+               time_resolution,
+               tuple(self.class_list))
+        if key in EventDetectionMetrics.roll_cache:
+            event_roll = EventDetectionMetrics.roll_cache.pop(key)
+        else:
+            event_roll = self.list_to_roll(data=data, time_resolution=time_resolution)
+            event_roll.flags.writeable = False
+
+            while len(EventDetectionMetrics.roll_cache) >= EventDetectionMetrics.roll_cache_size:
+                EventDetectionMetrics.roll_cache.popitem(last=False)
+
+        # Most recently used last
+        EventDetectionMetrics.roll_cache[key] = event_roll
+        return event_roll
+
+    def event_matches(self, annotated_ground_truth, system_output, t_collar=0.200, percentage_of_length=0.5,
+                      match_label=True, match_offset=True, reference_ids=None, system_ids=None):
+        """First matching system event for each reference event
+
+        Gives the same result as scanning the system events in list order for each reference event and
+        taking the first one fulfilling the conditions, but system events are indexed by label and sorted
+        by onset, so only the ones with onset within t_collar of the reference onset are compared.
+
+        Conditions:
+
+        - event labels are the same, if match_label is set
+        - event onsets are within t_collar each other
+        - event offsets are within t_collar each other or within percentage_of_length*annotated event length,
+          if match_offset is set
+
+        Parameters
+        ----------
+        annotated_ground_truth : list
+            Reference event list, list of event dicts
+
+        system_output : list
+            System event list, list of event dicts
+
+        t_collar : float > 0
+            Defines how close event onsets and offsets have to be in order to be considered match. In seconds.
+            (Default value = 0.2)
+
+        percentage_of_length : float [0-1]
+            Offset tolerance relative to the annotated event length.
+            (Default value = 0.5)
+
+        match_label : bool
+            Require same event label.
+            (Default value = True)
+
+        match_offset : bool
+            Require offset condition.
+            (Default value = True)
+
+        reference_ids : list of int
+            Reference events to be matched, all if None.
+            (Default value = None)
+
+        system_ids : list of int
+            System events taking part in matching, all if None.
+            (Default value = None)
+
+        Returns
+        -------
+        matches : numpy.ndarray [shape=(len(reference_ids),)]
+            Index of the first matching event in system_output, -1 if none
+
+        """
+
+        if reference_ids is None:
+            reference_ids = range(0, len(annotated_ground_truth))
+
+        if system_ids is None:
+            system_ids = range(0, len(system_output))
+
+        # Index system events by label, sorted by onset
+        index = {}
+        for i in system_ids:
+            key = system_output[i]['event_label'] if match_label else None
+            index.setdefault(key, []).append((system_output[i]['event_onset'], i))
+
+        for key in index:
+            events = sorted(index[key])
+            index[key] = ([onset for onset, i in events], [i for onset, i in events])
+
+        # Search window is widened to stay clear of rounding, conditions are checked as such inside it
+        window = t_collar + 1e-9
+
+        matches = -numpy.ones(len(reference_ids), dtype=int)
+        for match_id, j in enumerate(reference_ids):
+            annotated_event = annotated_ground_truth[j]
+            key = annotated_event['event_label'] if match_label else None
+            if key not in index:
+                continue
+
+            onsets, ids = index[key]
+            annotated_length = annotated_event['event_offset'] - annotated_event['event_onset']
+            offset_collar = max(t_collar, percentage_of_length * annotated_length)
+
+            for position in range(bisect.bisect_left(onsets, annotated_event['event_onset'] - window),
+                                  bisect.bisect_right(onsets, annotated_event['event_onset'] + window)):
+                i = ids[position]
+                if matches[match_id] != -1 and i > matches[match_id]:
+                    continue
+
+                if math.fabs(annotated_event['event_onset'] - system_output[i]['event_onset']) > t_collar:
+                    continue
+
+                if match_offset and (math.fabs(annotated_event['event_offset'] - system_output[i]['event_offset']) >
+                                     offset_collar):
+                    continue
+
+                matches[match_id] = i
+
+        return matches
+
 
 class DCASE2016_EventDetection_SegmentBasedMetrics(EventDetectionMetrics):
     """DCASE2016 Segment based metrics for sound event detection
@@ -357,7 +531,7 @@ class DCASE2016_EventDetection_SegmentBasedMetrics(EventDetectionMetrics):
         # Finalize evaluation and return results
         return self.results()
 
-    def evaluate(self, annotated_ground_truth, system_output):
+    def evaluate(self, annotated_ground_truth, system_output, reference_file=None):
         """Evaluate system output and annotated ground truth pair.
 
         Use results method to get results.
@@ -370,6 +544,10 @@ class DCASE2016_EventDetection_SegmentBasedMetrics(EventDetectionMetrics):
         system_output : numpy.array
             System output array, list of scene labels
 
+        reference_file : str
+            Annotated file, caches the ground truth event roll if given, see reference_roll.
+            (Default value = None)
+
         Returns
         -------
         nothing
@@ -378,7 +556,9 @@ class DCASE2016_EventDetection_SegmentBasedMetrics(EventDetectionMetrics):
 
         # Convert event list into frame-based representation
         system_event_roll = self.list_to_roll(data=system_output, time_resolution=self.time_resolution)
-        annotated_event_roll = self.list_to_roll(data=annotated_ground_truth, time_resolution=self.time_resolution)
+        annotated_event_roll = self.reference_roll(data=annotated_ground_truth,
+                                                   time_resolution=self.time_resolution,
+                                                   reference_file=reference_file)
 
         # Fix durations of both event_rolls to be equal
         if annotated_event_roll.shape[0] > system_event_roll.shape[0]:
@@ -389,53 +569,43 @@ class DCASE2016_EventDetection_SegmentBasedMetrics(EventDetectionMetrics):
             padding = numpy.zeros((system_event_roll.shape[0] - annotated_event_roll.shape[0], len(self.class_list)))
             annotated_event_roll = numpy.vstack((annotated_event_roll, padding))
 
+        # Segment activity for the counts, segments are rows and classes columns of the event rolls
+        true_positive = system_event_roll + annotated_event_roll > 1
+        true_negative = system_event_roll + annotated_event_roll == 0
+        false_positive = system_event_roll - annotated_event_roll > 0
+        false_negative = annotated_event_roll - system_event_roll > 0
+
         # Compute segment-based overall metrics
-        for segment_id in range(0, annotated_event_roll.shape[0]):
-            annotated_segment = annotated_event_roll[segment_id, :]
-            system_segment = system_event_roll[segment_id, :]
-
-            Ntp = sum(system_segment + annotated_segment > 1)
-            Ntn = sum(system_segment + annotated_segment == 0)
-            Nfp = sum(system_segment - annotated_segment > 0)
-            Nfn = sum(annotated_segment - system_segment > 0)
-
-            Nref = sum(annotated_segment)
-            Nsys = sum(system_segment)
-
-            S = min(Nref, Nsys) - Ntp
-            D = max(0, Nref - Nsys)
-            I = max(0, Nsys - Nref)
-            ER = max(Nref, Nsys) - Ntp
-
-            self.overall['Ntp'] += Ntp
-            self.overall['Ntn'] += Ntn
-            self.overall['Nfp'] += Nfp
-            self.overall['Nfn'] += Nfn
-            self.overall['Nref'] += Nref
-            self.overall['Nsys'] += Nsys
-            self.overall['S'] += S
-            self.overall['D'] += D
-            self.overall['I'] += I
-            self.overall['ER'] += ER
+        Ntp = numpy.sum(true_positive, axis=1)
+        Nref = numpy.sum(annotated_event_roll, axis=1)
+        Nsys = numpy.sum(system_event_roll, axis=1)
+
+        self.overall['Ntp'] += numpy.sum(Ntp)
+        self.overall['Ntn'] += numpy.sum(true_negative)
+        self.overall['Nfp'] += numpy.sum(false_positive)
+        self.overall['Nfn'] += numpy.sum(false_negative)
+        self.overall['Nref'] += numpy.sum(Nref)
+        self.overall['Nsys'] += numpy.sum(Nsys)
+        self.overall['S'] += numpy.sum(numpy.minimum(Nref, Nsys) - Ntp)
+        self.overall['D'] += numpy.sum(numpy.maximum(0, Nref - Nsys))
+        self.overall['I'] += numpy.sum(numpy.maximum(0, Nsys - Nref))
+        self.overall['ER'] += numpy.sum(numpy.maximum(Nref, Nsys) - Ntp)
+
+        # Compute segment-based class-wise metrics
+        Ntp = numpy.sum(true_positive, axis=0)
+        Ntn = numpy.sum(true_negative, axis=0)
+        Nfp = numpy.sum(false_positive, axis=0)
+        Nfn = numpy.sum(false_negative, axis=0)
+        Nref = numpy.sum(annotated_event_roll, axis=0)
+        Nsys = numpy.sum(system_event_roll, axis=0)
 
         for class_id, class_label in enumerate(self.class_list):
-            annotated_segment = annotated_event_roll[:, class_id]
-            system_segment = system_event_roll[:, class_id]
-
-            Ntp = sum(system_segment + annotated_segment > 1)
-            Ntn = sum(system_segment + annotated_segment == 0)
-            Nfp = sum(system_segment - annotated_segment > 0)
-            Nfn = sum(annotated_segment - system_segment > 0)
-
-            Nref = sum(annotated_segment)
-            Nsys = sum(system_segment)
-
-            self.class_wise[class_label]['Ntp'] += Ntp
-            self.class_wise[class_label]['Ntn'] += Ntn
-            self.class_wise[class_label]['Nfp'] += Nfp
-            self.class_wise[class_label]['Nfn'] += Nfn
-            self.class_wise[class_label]['Nref'] += Nref
-            self.class_wise[class_label]['Nsys'] += Nsys
+            self.class_wise[class_label]['Ntp'] += Ntp[class_id]
+            self.class_wise[class_label]['Ntn'] += Ntn[class_id]
+            self.class_wise[class_label]['Nfp'] += Nfp[class_id]
+            self.class_wise[class_label]['Nfn'] += Nfn[class_id]
+            self.class_wise[class_label]['Nref'] += Nref[class_id]
+            self.class_wise[class_label]['Nsys'] += Nsys[class_id]
 
         return self
 
@@ -656,21 +826,12 @@ class DCASE2016_EventDetection_EventBasedMetrics(EventDetectionMetrics):
         ref_correct = numpy.zeros(Nref, dtype=bool)
 
         # Number of correctly transcribed events, onset/offset within a t_collar range
-        for j in range(0, len(annotated_ground_truth)):
-            for i in range(0, len(system_output)):
-                label_condition = annotated_ground_truth[j]['event_label'] == system_output[i]['event_label']
-                onset_condition = self.onset_condition(annotated_event=annotated_ground_truth[j],
-                                                       system_event=system_output[i],
-                                                       t_collar=self.t_collar)
-
-                offset_condition = self.offset_condition(annotated_event=annotated_ground_truth[j],
-                                                         system_event=system_output[i],
-                                                         t_collar=self.t_collar)
-
-                if label_condition and onset_condition and offset_condition:
-                    ref_correct[j] = True
-                    sys_correct[i] = True
-                    break
+        matches = self.event_matches(annotated_ground_truth=annotated_ground_truth,
+                                     system_output=system_output,
+                                     t_collar=self.t_collar)
+
+        ref_correct[matches != -1] = True
+        sys_correct[matches[matches != -1]] = True
 
         Ntp = numpy.sum(sys_correct)
 
@@ -678,20 +839,12 @@ class DCASE2016_EventDetection_EventBasedMetrics(EventDetectionMetrics):
         ref_leftover = numpy.nonzero(numpy.negative(ref_correct))[0]
 
         # Substitutions
-        Nsubs = 0
-        for j in ref_leftover:
-            for i in sys_leftover:
-                onset_condition = self.onset_condition(annotated_event=annotated_ground_truth[j],
-                                                       system_event=system_output[i],
-                                                       t_collar=self.t_collar)
-
-                offset_condition = self.offset_condition(annotated_event=annotated_ground_truth[j],
-                                                         system_event=system_output[i],
-                                                         t_collar=self.t_collar)
-
-                if onset_condition and offset_condition:
-                    Nsubs += 1
-                    break
+        Nsubs = int(numpy.sum(self.event_matches(annotated_ground_truth=annotated_ground_truth,
+                                                 system_output=system_output,
+                                                 t_collar=self.t_collar,
+                                                 match_label=False,
+                                                 reference_ids=ref_leftover,
+                                                 system_ids=sys_leftover) != -1))
 
         Nfp = Nsys - Ntp - Nsubs
         Nfn = Nref - Ntp - Nsubs
@@ -703,36 +856,16 @@ class DCASE2016_EventDetection_EventBasedMetrics(EventDetectionMetrics):
         self.overall['Nfp'] += Nfp
         self.overall['Nfn'] += Nfn
 
-        # Class-wise metrics
+        # Class-wise metrics, a reference event is correct within its class if it was matched above
+        reference_labels = [event['event_label'] for event in annotated_ground_truth]
+        system_labels = [event['event_label'] for event in system_output]
+        correct_labels = [reference_labels[j] for j in numpy.nonzero(ref_correct)[0]]
+
         for class_id, class_label in enumerate(self.class_list):
-            Nref = 0.0
-            Nsys = 0.0
-            Ntp = 0.0
-
-            # Count event frequencies in the ground truth
-            for i in range(0, len(annotated_ground_truth)):
-                if annotated_ground_truth[i]['event_label'] == class_label:
-                    Nref += 1
-
-            # Count event frequencies in the system output
-            for i in range(0, len(system_output)):
-                if system_output[i]['event_label'] == class_label:
-                    Nsys += 1
-
-            for j in range(0, len(annotated_ground_truth)):
-                for i in range(0, len(system_output)):
-                    if annotated_ground_truth[j]['event_label'] == class_label and system_output[i]['event_label'] == class_label:
-                        onset_condition = self.onset_condition(annotated_event=annotated_ground_truth[j],
-                                                               system_event=system_output[i],
-                                                               t_collar=self.t_collar)
-
-                        offset_condition = self.offset_condition(annotated_event=annotated_ground_truth[j],
-                                                                 system_event=system_output[i],
-                                                                 t_collar=self.t_collar)
-
-                        if onset_condition and offset_condition:
-                            Ntp += 1
-                            break
+            # Count event frequencies in the ground truth and system output
+            Nref = float(reference_labels.count(class_label))
+            Nsys = float(system_labels.count(class_label))
+            Ntp = float(correct_labels.count(class_label))
 
             Nfp = Nsys - Ntp
             Nfn = Nref - Ntp
@@ -928,10 +1061,12 @@ class DCASE2013_EventDetection_Metrics(EventDetectionMetrics):
 
     #
 
-    def frame_based(self, annotated_ground_truth, system_output, resolution=0.01):
-        # Convert event list into frame-based representation
+    def frame_based(self, annotated_ground_truth, system_output, resolution=0.01, reference_file=None):
+        # Convert event list into frame-based representation, ground truth roll is cached if reference_file is given
         system_event_roll = self.list_to_roll(data=system_output, time_resolution=resolution)
-        annotated_event_roll = self.list_to_roll(data=annotated_ground_truth, time_resolution=resolution)
+        annotated_event_roll = self.reference_roll(data=annotated_ground_truth,
+                                                   time_resolution=resolution,
+                                                   reference_file=reference_file)
 
         # Fix durations of both event_rolls to be equal
         if annotated_event_roll.shape[0] > system_event_roll.shape[0]:
@@ -970,18 +1105,21 @@ class DCASE2013_EventDetection_Metrics(EventDetectionMetrics):
         Nref = len(annotated_ground_truth)
 
         # Number of correctly transcribed events, onset within a +/-100 ms range
+        matches = self.event_matches(annotated_ground_truth=annotated_ground_truth,
+                                     system_output=system_output,
+                                     t_collar=0.1,
+                                     match_offset=False)
         Ncorr = 0
         NcorrOff = 0
-        for j in range(0, len(annotated_ground_truth)):
-            for i in range(0, len(system_output)):
-                if annotated_ground_truth[j]['event_label'] == system_output[i]['event_label'] and (math.fabs(annotated_ground_truth[j]['event_onset'] - system_output[i]['event_onset']) <= 0.1):
-                    Ncorr += 1
-
-                    # If offset within a +/-100 ms range or within 50% of ground-truth event's duration
-                    if math.fabs(annotated_ground_truth[j]['event_offset'] - system_output[i]['event_offset']) <= max(0.1, 0.5 * (annotated_ground_truth[j]['event_offset'] - annotated_ground_truth[j]['event_onset'])):
-                        NcorrOff += 1
+        for j, i in enumerate(matches):
+            if i != -1:
+                Ncorr += 1
 
-                    break  # In order to not evaluate duplicates
+                # If offset within a +/-100 ms range or within 50% of ground-truth event's duration
+                if math.fabs(annotated_ground_truth[j]['event_offset'] - system_output[i]['event_offset']) <= max(
+                        0.1, 0.5 * (
+                            annotated_ground_truth[j]['event_offset'] - annotated_ground_truth[j]['event_onset'])):
+                    NcorrOff += 1
 
         # Compute onset-only event-based metrics
         eps = numpy.spacing(1)
@@ -1034,23 +1172,20 @@ class DCASE2013_EventDetection_Metrics(EventDetectionMetrics):
         Ncorr = numpy.zeros((len(self.class_list), 1))
         NcorrOff = numpy.zeros((len(self.class_list), 1))
 
-        for j in range(0, len(annotated_ground_truth)):
-            for i in range(0, len(system_output)):
-                if annotated_ground_truth[j]['event_label'] == system_output[i]['event_label'] and (
-                            math.fabs(
-                                    annotated_ground_truth[j]['event_onset'] - system_output[i]['event_onset']) <= 0.1):
-                    pos = self.class_list.index(system_output[i]['event_label'])
-                    Ncorr[pos] += 1
-
-                    # If offset within a +/-100 ms range or within 50% of ground-truth event's duration
-                    if math.fabs(annotated_ground_truth[j]['event_offset'] - system_output[i]['event_offset']) <= max(
-                            0.1, 0.5 * (
-                                        annotated_ground_truth[j]['event_offset'] - annotated_ground_truth[j][
-                                        'event_onset'])):
-                        pos = self.class_list.index(system_output[i]['event_label'])
-                        NcorrOff[pos] += 1
-
-                    break  # In order to not evaluate duplicates
+        matches = self.event_matches(annotated_ground_truth=annotated_ground_truth,
+                                     system_output=system_output,
+                                     t_collar=0.1,
+                                     match_offset=False)
+        for j, i in enumerate(matches):
+            if i != -1:
+                pos = self.class_list.index(system_output[i]['event_label'])
+                Ncorr[pos] += 1
+
+                # If offset within a +/-100 ms range or within 50% of ground-truth event's duration
+                if math.fabs(annotated_ground_truth[j]['event_offset'] - system_output[i]['event_offset']) <= max(
+                        0.1, 0.5 * (
+                            annotated_ground_truth[j]['event_offset'] - annotated_ground_truth[j]['event_onset'])):
+                    NcorrOff[pos] += 1
 
         # Compute onset-only class-wise event-based metrics
         eps = numpy.spacing(1)
@@ -1,9 +1,16 @@
 #!/usr/bin/env python
 # -*- coding: utf-8 -*-
 
+import ctypes
 import os
 import hashlib
 import json
+import multiprocessing
+import Queue
+import timeit
+import traceback
+
+from sklearn import mixture
 
 
 def check_path(path):
@@ -43,3 +50,370 @@ def get_parameter_hash(params):
     md5.update(str(json.dumps(params, sort_keys=True)))
     return md5.hexdigest()
 
+
+# Training matrices and parameters of the GMM workers, set in each worker when the pool starts
+gmm_training_state = {}
+
+
+def fit_gmm_models(training_data, classifier_params, n_jobs=1):
+    """Fit one GMM per training matrix, in parallel
+
+    Worker processes are forked when the pool starts and receive the training matrices with the fork,
+    so they read them from memory shared with the parent process (or from the memory-mapped training
+    shard) instead of getting pickled copies. Only the model keys and the fitted models are passed
+    between the processes.
+
+    Parameters
+    ----------
+    training_data : dict
+        training matrix [shape=(frames, feature vector length)] for each model key
+
+    classifier_params : dict
+        mixture.GMM parameters
+
+    n_jobs : int
+        number of worker processes, -1 uses all CPU cores, 1 fits in the main process
+        (Default value=1)
+
+    Returns
+    -------
+    models : dict
+        fitted mixture.GMM for each model key, in the iteration order of training_data
+
+    """
+
+    keys = list(training_data)
+
+    if n_jobs < 0:
+        n_jobs = max(get_cpu_count() + 1 + n_jobs, 1)
+
+    if n_jobs > 1 and len(keys) > 1:
+        pool = multiprocessing.Pool(processes=min(n_jobs, len(keys)),
+                                    initializer=init_gmm_worker,
+                                    initargs=(training_data, classifier_params))
+        try:
+            fitted = pool.map(fit_gmm_model, keys)
+        finally:
+            pool.terminate()
+            pool.join()
+    else:
+        init_gmm_worker(training_data, classifier_params)
+        try:
+            fitted = [fit_gmm_model(key) for key in keys]
+        finally:
+            gmm_training_state.clear()
+
+    models = {}
+    for key, model in zip(keys, fitted):
+        models[key] = model
+    return models
+
+
+def init_gmm_worker(training_data, classifier_params):
+    """Set the training state of a GMM worker, see fit_gmm_models
+
+    Parameters
+    ----------
+    training_data : dict
+        training matrix for each model key
+
+    classifier_params : dict
+        mixture.GMM parameters
+
+    Returns
+    -------
+    nothing
+
+    """
+
+    gmm_training_state['data'] = training_data
+    gmm_training_state['params'] = classifier_params
+
+
+def fit_gmm_model(key):
+    """Fit the GMM of one model key, run in a worker process
+
+    Parameters
+    ----------
+    key : hashable
+        model key in the training data
+
+    Returns
+    -------
+    model : mixture.GMM
+        fitted model
+
+    """
+
+    return mixture.GMM(**gmm_training_state['params']).fit(gmm_training_state['data'][key])
+
+
+# Core budget of the current fold worker, set by run_folds
+fold_worker_state = {}
+
+
+def get_cpu_count():
+    """Number of CPU cores available to the current process
+
+    Inside a fold worker of run_folds this is the core budget of the fold, otherwise all CPU cores.
+
+    Parameters
+    ----------
+    nothing
+
+    Returns
+    -------
+    cpu_count : int
+        number of CPU cores
+
+    """
+
+    return fold_worker_state.get('threads') or multiprocessing.cpu_count()
+
+
+def run_folds(function, folds, fold_jobs=1, fold_threads=0, result_container=None, **kwargs):
+    """Run a fold-wise system step with concurrent folds
+
+    function is called once per fold as function(folds=[fold], **kwargs). With fold_jobs > 1 each fold
+    runs in its own forked process, at most fold_jobs at a time. Folds share nothing but the read-only
+    features, models and results are written to the same per-fold files as in a sequential run. Inside
+    a worker the number of CPU cores is limited to the fold budget (see get_cpu_count), and so are the
+    threads of the BLAS and OpenMP libraries already loaded into the process (see set_library_threads).
+
+    Parameters
+    ----------
+    function : function
+        system step taking a folds argument, e.g. do_system_training
+
+    folds : list of int
+        folds to run
+
+    fold_jobs : int
+        number of folds run at the same time, -1 runs all folds at once, 1 runs the folds in the main process
+        (Default value=1)
+
+    fold_threads : int
+        CPU cores per fold, 0 splits the CPU cores evenly between the concurrent folds
+        (Default value=0)
+
+    result_container : dict or None
+        dict the function stores results into, entries stored by the workers are merged back fold by fold
+        (Default value=None)
+
+    **kwargs
+        arguments of the function
+
+    Returns
+    -------
+    timings : dict
+        wall clock time in seconds for each fold
+
+    Raises
+    -------
+    RuntimeError
+        Fold worker failed, the message holds the traceback of the worker.
+        Fold worker exited without a result.
+
+    """
+
+    folds = list(folds)
+
+    if fold_jobs < 0:
+        fold_jobs = max(get_cpu_count() + 1 + fold_jobs, 1)
+    fold_jobs = min(fold_jobs, len(folds))
+
+    timings = {}
+    if fold_jobs <= 1:
+        for fold in folds:
+            start = timeit.default_timer()
+            function(folds=[fold], **kwargs)
+            timings[fold] = timeit.default_timer() - start
+        return timings
+
+    if not fold_threads:
+        fold_threads = max(get_cpu_count() // fold_jobs, 1)
+
+    # Workers are plain processes rather than a pool, as they start process pools of their own
+    queue = multiprocessing.Queue()
+    pending = list(folds)
+    running = {}
+    try:
+        while pending or running:
+            while pending and len(running) < fold_jobs:
+                fold = pending.pop(0)
+                running[fold] = multiprocessing.Process(target=run_fold,
+                                                        args=(queue, function, fold, fold_threads, result_container,
+                                                              kwargs))
+                running[fold].start()
+
+            try:
+                fold, elapsed, fold_result, error = queue.get(timeout=1.0)
+            except Queue.Empty:
+                for fold in running:
+                    if not running[fold].is_alive() and queue.empty():
+                        raise RuntimeError("Fold worker exited without a result [%s]" % fold)
+                continue
+
+            running.pop(fold).join()
+            if error is not None:
+                raise RuntimeError("Fold worker failed [%s]\n%s" % (fold, error))
+
+            timings[fold] = elapsed
+            if result_container is not None:
+                for key in fold_result:
+                    if isinstance(fold_result[key], dict) and isinstance(result_container.get(key), dict):
+                        result_container[key].update(fold_result[key])
+                    else:
+                        result_container[key] = fold_result[key]
+    finally:
+        for fold in running:
+            running[fold].terminate()
+            running[fold].join()
+
+    return timings
+
+
+def run_fold(queue, function, fold, threads, result_container, kwargs):
+    """Run a system step for one fold, run in a worker process, see run_folds
+
+    Parameters
+    ----------
+    queue : multiprocessing.Queue
+        queue for the fold, elapsed time, result container entries changed by the fold and error traceback
+
+    function : function
+        system step taking a folds argument
+
+    fold : int
+        fold to run
+
+    threads : int
+        CPU cores of the fold
+
+    result_container : dict or None
+        dict the function stores results into
+
+    kwargs : dict
+        arguments of the function
+
+    Returns
+    -------
+    nothing
+
+    """
+
+    fold_worker_state['threads'] = threads
+    set_library_threads(threads)
+
+    # Entries inherited from the main process are not sent back, only what the fold changes
+    snapshot = get_result_snapshot(result_container)
+
+    start = timeit.default_timer()
+    try:
+        function(folds=[fold], **kwargs)
+    except Exception:
+        # Traceback as text, the exception itself may not pickle
+        queue.put((fold, None, None, traceback.format_exc()))
+        return
+
+    queue.put((fold, timeit.default_timer() - start, get_result_changes(result_container, snapshot), None))
+
+
+def get_result_snapshot(result_container):
+    """Shallow snapshot of a result container, see get_result_changes
+
+    Parameters
+    ----------
+    result_container : dict or None
+        dict a system step stores results into
+
+    Returns
+    -------
+    snapshot : dict
+        entry and, for dict entries, a copy of its items, indexed by key
+
+    """
+
+    if result_container is None:
+        return {}
+
+    return dict((key, (value, dict(value) if isinstance(value, dict) else None))
+                for key, value in result_container.items())
+
+
+def get_result_changes(result_container, snapshot):
+    """Result container entries added or replaced since the snapshot
+
+    Entries are compared by identity. Of a dict entry that was already there, only the items added or
+    replaced are returned, they are merged back into the entry by run_folds.
+
+    Parameters
+    ----------
+    result_container : dict or None
+        dict a system step stores results into
+
+    snapshot : dict
+        snapshot taken before the step, see get_result_snapshot
+
+    Returns
+    -------
+    changes : dict or None
+        changed entries, None without a result container
+
+    """
+
+    if result_container is None:
+        return None
+
+    changes = {}
+    for key, value in result_container.items():
+        if key not in snapshot or snapshot[key][0] is not value:
+            changes[key] = value
+        elif snapshot[key][1] is not None:
+            items = dict((item_key, item) for item_key, item in value.items()
+                         if item_key not in snapshot[key][1] or snapshot[key][1][item_key] is not item)
+            if items:
+                changes[key] = items
+    return changes
+
+
+def set_library_threads(threads):
+    """Limit the threads of the BLAS and OpenMP libraries of the process
+
+    The libraries read their OMP_NUM_THREADS, MKL_NUM_THREADS and OPENBLAS_NUM_THREADS environment
+    variables once, when they are loaded. numpy has loaded its BLAS by the time a fold worker is forked,
+    so the limit is set through the libraries themselves, found among the shared objects mapped into the
+    process. The environment variables are set as well, for libraries loaded later and for child processes.
+
+    Parameters
+    ----------
+    threads : int > 0
+        threads per library
+
+    Returns
+    -------
+    nothing
+
+    """
+
+    for name in ['OMP_NUM_THREADS', 'MKL_NUM_THREADS', 'OPENBLAS_NUM_THREADS']:
+        os.environ[name] = str(threads)
+
+    try:
+        with open('/proc/self/maps') as maps:
+            libraries = set(line.split()[-1] for line in maps if '.so' in line)
+    except IOError:
+        # No proc filesystem, only the environment variables apply
+        return
+
+    setters = [('openblas', 'openblas_set_num_threads'),
+               ('mkl_rt', 'MKL_Set_Num_Threads'),
+               ('gomp', 'omp_set_num_threads'),
+               ('iomp5', 'omp_set_num_threads')]
+    for library in libraries:
+        for library_name, setter in setters:
+            if library_name in os.path.basename(library):
+                try:
+                    getattr(ctypes.CDLL(library), setter)(ctypes.c_int(threads))
+                except (OSError, AttributeError):
+                    pass
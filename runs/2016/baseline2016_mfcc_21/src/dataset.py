@@ -76,12 +76,18 @@ class Dataset(object):
         # List of meta data dict
         self.meta_data = None
 
+        # Meta data indexed by file, built on first file_meta call
+        self.meta_index = None
+
         # Training meta data for folds
         self.evaluation_data_train = {}
 
         # Testing meta data for folds
         self.evaluation_data_test = {}
 
+        # Unique files for fold selections, see fold_files
+        self.evaluation_files = {}
+
         # Recognized audio extensions
         self.audio_extensions = {'wav', 'flac'}
 
@@ -739,11 +745,11 @@ class Dataset(object):
                         self.evaluation_data_test[fold].append({'file': self.relative_to_absolute_path(row[0])})
             else:
                 data = []
-                files = []
+                files = set()
                 for item in self.meta:
                     if self.relative_to_absolute_path(item['file']) not in files:
                         data.append({'file': self.relative_to_absolute_path(item['file'])})
-                        files.append(self.relative_to_absolute_path(item['file']))
+                        files.add(self.relative_to_absolute_path(item['file']))
 
                 self.evaluation_data_test[fold] = data
 
@@ -770,9 +776,63 @@ class Dataset(object):
         elif mode == 'full':
             return [0]
 
+    def fold_files(self, folds, train=True, test=True, scene_label=None):
+        """Unique files of the training and testing items in given folds.
+
+        Files are collected in order of first appearance, going through training and then testing items
+        of each fold, and cached next to the fold lists.
+
+        Parameters
+        ----------
+        folds : list of int
+            Fold ids, see folds method.
+
+        train : bool
+            Include training items.
+            (Default value=True)
+
+        test : bool
+            Include testing items.
+            (Default value=True)
+
+        scene_label : str
+            Scene label, passed to train and test, all items if None.
+            (Default value=None)
+
+        Returns
+        -------
+        list : list of str
+            Files, absolute paths.
+
+        """
+
+        key = (tuple(folds), train, test, scene_label)
+        if key not in self.evaluation_files:
+            files = []
+            seen = set()
+            for fold in folds:
+                items = []
+                if train:
+                    items += self.train(fold, scene_label=scene_label) if scene_label else self.train(fold)
+                if test:
+                    items += self.test(fold, scene_label=scene_label) if scene_label else self.test(fold)
+
+                for item in items:
+                    if item['file'] not in seen:
+                        seen.add(item['file'])
+                        files.append(item['file'])
+
+            self.evaluation_files[key] = files
+
+        return list(self.evaluation_files[key])
+
     def file_meta(self, file):
         """Meta data for given file
 
+        Lookups go through an index from relative file name to meta data items, built on first use and
+        rebuilt when meta_data is replaced or its length changes. File names given to the method are
+        converted with absolute_to_relative once and remembered in the index.
+
         Parameters
         ----------
         file : str
@@ -785,13 +845,23 @@ class Dataset(object):
 
         """
 
-        file = self.absolute_to_relative(file)
-        file_meta = []
-        for item in self.meta:
-            if item['file'] == file:
-                file_meta.append(item)
+        meta = self.meta
+        if self.meta_index is None or self.meta_index['meta'] is not meta or self.meta_index['count'] != len(meta):
+            files = {}
+            for item in meta:
+                files.setdefault(item['file'], []).append(item)
+
+            self.meta_index = {
+                'meta': meta,
+                'count': len(meta),
+                'files': files,
+                'relative': {},
+            }
 
-        return file_meta
+        if file not in self.meta_index['relative']:
+            self.meta_index['relative'][file] = self.absolute_to_relative(file)
+
+        return list(self.meta_index['files'].get(self.meta_index['relative'][file], []))
 
     def relative_to_absolute_path(self, path):
         """Converts relative path into absolute path.
@@ -1195,12 +1265,12 @@ class TUTSoundEvents_2016_DevelopmentSet(Dataset):
                                 {'file': self.relative_to_absolute_path(row[0])})
                 else:
                     data = []
-                    files = []
+                    files = set()
                     for item in self.meta:
-                        if scene_label_ in item:
+                        if item['scene_label'] == scene_label_:
                             if self.relative_to_absolute_path(item['file']) not in files:
                                 data.append({'file': self.relative_to_absolute_path(item['file'])})
-                                files.append(self.relative_to_absolute_path(item['file']))
+                                files.add(self.relative_to_absolute_path(item['file']))
 
                     self.evaluation_data_test[0][scene_label_] = data
 
@@ -1328,12 +1398,12 @@ class TUTSoundEvents_2016_EvaluationSet(Dataset):
                                 {'file': self.relative_to_absolute_path(row[0])})
                 else:
                     data = []
-                    files = []
+                    files = set()
                     for item in self.audio_files:
                         if scene_label_ in item:
                             if self.relative_to_absolute_path(item) not in files:
                                 data.append({'file': self.relative_to_absolute_path(item)})
-                                files.append(self.relative_to_absolute_path(item))
+                                files.add(self.relative_to_absolute_path(item))
 
                     self.evaluation_data_test[0][scene_label_] = data
 
@@ -1822,8 +1892,10 @@ class DCASE2013_Event_DevelopmentSet(Dataset):
                 os.makedirs(self.evaluation_setup_path)
 
             files = []
+            seen = set()
             for item in self.meta:
-                if item['file'] not in files:
+                if item['file'] not in seen:
+                    seen.add(item['file'])
                     files.append(item['file'])
             files = numpy.array(files)
             f = numpy.zeros(len(files))
@@ -1947,8 +2019,10 @@ class DCASE2013_Event_EvaluationSet(Dataset):
                 os.makedirs(self.evaluation_setup_path)
 
             files = []
+            seen = set()
             for item in self.meta:
-                if item['file'] not in files:
+                if item['file'] not in seen:
+                    seen.add(item['file'])
                     files.append(item['file'])
             files = numpy.array(files)
             f = numpy.zeros(len(files))
@@ -30,7 +30,9 @@ def feature_extraction_lfcc(audio_filename_with_path, statistics=True):
 
 
 def feature_extraction(y, fs=44100, statistics=True, include_mfcc0=True, include_delta=True,
-                       include_acceleration=True, mfcc_params=None, delta_params=None, acceleration_params=None):
+                       include_acceleration=True, mfcc_params=None, delta_params=None,
+                       acceleration_params=None, magnitude_spectrogram=None, max_power=None,
+                       block_frames=None):
     """Feature extraction, MFCC based features
 
     Outputs features in dict, format:
@@ -80,6 +82,22 @@ def feature_extraction(y, fs=44100, statistics=True, include_mfcc0=True, include
     acceleration_params: dict or None
         Parameters for extraction of acceleration MFCC coefficients.
 
+    magnitude_spectrogram: numpy.ndarray [shape=(1 + n_fft/2, frame count)] or None
+        Precalculated power spectrogram, see stft_spectrogram. Calculated from y if None.
+        (Default value=None)
+
+    max_power: float or None
+        Maximum of the mel power spectrum of the whole signal, sets the log amplitude floor when
+        magnitude_spectrogram covers only a part of the signal. Maximum of the given frames if None.
+        (Default value=None)
+
+    block_frames: int > 1 [scalar] or None
+        Extract signals longer than this many frames block by block, see feature_extraction_blocks.
+        The result then holds the frame count and a generator of feature blocks instead of the
+        feature matrix, save_feature_data writes the blocks as they are extracted. Whole signal at
+        once if None.
+        (Default value=None)
+
     Returns
     -------
     result: dict
@@ -87,6 +105,23 @@ def feature_extraction(y, fs=44100, statistics=True, include_mfcc0=True, include
 
     """
 
+    if block_frames and magnitude_spectrogram is None:
+        frame_count = stft_frame_count(signal_length=y.shape[0], mfcc_params=mfcc_params)
+        if frame_count > block_frames:
+            # Long signal, features are extracted block by block as the blocks are consumed
+            return {
+                'frames': frame_count,
+                'blocks': feature_extraction_blocks(y=y,
+                                                    fs=fs,
+                                                    block_frames=block_frames,
+                                                    include_mfcc0=include_mfcc0,
+                                                    include_delta=include_delta,
+                                                    include_acceleration=include_acceleration,
+                                                    mfcc_params=mfcc_params,
+                                                    delta_params=delta_params,
+                                                    acceleration_params=acceleration_params)
+            }
+
     eps = numpy.spacing(1)
 
     # Windowing function
@@ -102,12 +137,13 @@ def feature_extraction(y, fs=44100, statistics=True, include_mfcc0=True, include
         window = None
 
     # Calculate Static Coefficients
-    magnitude_spectrogram = numpy.abs(librosa.stft(y + eps,
-                                                   n_fft=mfcc_params['n_fft'],
-                                                   win_length=mfcc_params['win_length'],
-                                                   hop_length=mfcc_params['hop_length'],
-                                                   center=True,
-                                                   window=window)) ** 2
+    if magnitude_spectrogram is None:
+        magnitude_spectrogram = numpy.abs(librosa.stft(y + eps,
+                                                       n_fft=mfcc_params['n_fft'],
+                                                       win_length=mfcc_params['win_length'],
+                                                       hop_length=mfcc_params['hop_length'],
+                                                       center=True,
+                                                       window=window)) ** 2
     mel_basis = librosa.filters.mel(sr=fs,
                                     n_fft=mfcc_params['n_fft'],
                                     n_mels=mfcc_params['n_mels'],
@@ -115,7 +151,13 @@ def feature_extraction(y, fs=44100, statistics=True, include_mfcc0=True, include
                                     fmax=mfcc_params['fmax'],
                                     htk=mfcc_params['htk'])
     mel_spectrum = numpy.dot(mel_basis, magnitude_spectrogram)
-    mfcc = librosa.feature.mfcc(S=librosa.logamplitude(mel_spectrum),
+    if max_power is None:
+        log_mel_spectrum = librosa.logamplitude(mel_spectrum)
+    else:
+        # Log amplitude floor below the maximum of the whole signal, librosa.logamplitude default top_db
+        log_mel_spectrum = numpy.maximum(librosa.logamplitude(mel_spectrum, top_db=None),
+                                         librosa.logamplitude(numpy.array([max_power]), top_db=None).max() - 80.0)
+    mfcc = librosa.feature.mfcc(S=log_mel_spectrum,
                                     n_mfcc=mfcc_params['n_mfcc'])
 
     # Collect the feature matrix
@@ -157,10 +199,766 @@ def feature_extraction(y, fs=44100, statistics=True, include_mfcc0=True, include
             'feat': feature_matrix}
 
 
+def stft_spectrogram(y, mfcc_params, first_frame=None, last_frame=None):
+    """Power spectrogram, windowing and framing as used in the MFCC extraction
+
+    Parameters
+    ----------
+    y: numpy.array [shape=(signal_length, )]
+        Audio
+
+    mfcc_params: dict
+        Parameters for extraction of static MFCC coefficients, window, n_fft, win_length and
+        hop_length are used.
+
+    first_frame: int >= 0 [scalar] or None
+        Calculate only the frames first_frame ... last_frame - 1, from the samples under these frames.
+        Frames are the same as in the spectrogram of the whole signal. Whole signal if None.
+        (Default value=None)
+
+    last_frame: int > first_frame [scalar] or None
+        End of the frame range, see first_frame
+        (Default value=None)
+
+    Returns
+    -------
+    magnitude_spectrogram: numpy.ndarray [shape=(1 + n_fft/2, frame count)]
+        Power spectrogram
+
+    """
+
+    eps = numpy.spacing(1)
+
+    # Windowing function
+    if mfcc_params['window'] == 'hamming_asymmetric':
+        window = scipy.signal.hamming(mfcc_params['n_fft'], sym=False)
+    elif mfcc_params['window'] == 'hamming_symmetric':
+        window = scipy.signal.hamming(mfcc_params['n_fft'], sym=True)
+    elif mfcc_params['window'] == 'hann_asymmetric':
+        window = scipy.signal.hann(mfcc_params['n_fft'], sym=False)
+    elif mfcc_params['window'] == 'hann_symmetric':
+        window = scipy.signal.hann(mfcc_params['n_fft'], sym=True)
+    else:
+        window = None
+
+    center = True
+    if first_frame is not None:
+        # Samples under the frame range, reflect padded at the signal ends like librosa.stft with center=True
+        hop_length = mfcc_params['hop_length']
+        pad_length = int(mfcc_params['n_fft'] // 2)
+        positions = numpy.abs(numpy.arange(first_frame * hop_length - pad_length,
+                                           (last_frame - 1) * hop_length + mfcc_params['n_fft'] - pad_length))
+        y = y[numpy.where(positions < y.shape[0], positions, 2 * (y.shape[0] - 1) - positions)]
+        center = False
+
+    return numpy.abs(librosa.stft(y + eps,
+                                  n_fft=mfcc_params['n_fft'],
+                                  win_length=mfcc_params['win_length'],
+                                  hop_length=mfcc_params['hop_length'],
+                                  center=center,
+                                  window=window)) ** 2
+
+
+def stft_frame_count(signal_length, mfcc_params):
+    """Frame count of the spectrogram, see stft_spectrogram
+
+    Parameters
+    ----------
+    signal_length: int >= 0 [scalar]
+        Signal length in samples
+
+    mfcc_params: dict
+        Parameters for extraction of static MFCC coefficients, n_fft and hop_length are used.
+
+    Returns
+    -------
+    frame_count: int
+        Frame count
+
+    """
+
+    return 1 + (signal_length + 2 * int(mfcc_params['n_fft'] // 2) - mfcc_params['n_fft']) // mfcc_params['hop_length']
+
+
+def feature_extraction_blocks(y, fs=44100, block_frames=10000, include_mfcc0=True, include_delta=True,
+                              include_acceleration=True, mfcc_params=None, delta_params=None,
+                              acceleration_params=None):
+    """Feature extraction block by block, MFCC based features
+
+    Generator of the rows of the feature_extraction feature matrix in blocks of block_frames frames.
+    Only one block of the spectrogram is held at a time. Blocks are identical to the rows of the matrix
+    extracted from the whole signal:
+
+        - spectrogram frames are calculated from the samples under them, see stft_spectrogram
+        - the log amplitude floor is set by the maximum of the whole mel spectrum, a first pass over the
+          blocks finds it
+        - delta and acceleration coefficients are calculated with context frames on both sides of
+          the block, as in StreamingFeatureExtractor
+
+    Parameters
+    ----------
+    y: numpy.array [shape=(signal_length, )]
+        Audio
+
+    fs: int > 0 [scalar]
+        Sample rate
+        (Default value=44100)
+
+    block_frames: int > 1 [scalar]
+        Frames per block
+        (Default value=10000)
+
+    include_mfcc0: bool
+        Include 0th MFCC coefficient into static coefficients.
+        (Default value=True)
+
+    include_delta: bool
+        Include delta MFCC coefficients.
+        (Default value=True)
+
+    include_acceleration: bool
+        Include acceleration MFCC coefficients.
+        (Default value=True)
+
+    mfcc_params: dict or None
+        Parameters for extraction of static MFCC coefficients.
+
+    delta_params: dict or None
+        Parameters for extraction of delta MFCC coefficients.
+
+    acceleration_params: dict or None
+        Parameters for extraction of acceleration MFCC coefficients.
+
+    Yields
+    ------
+    feature_matrix: numpy.ndarray [shape=(block frame count, feature vector size)]
+        Feature block, same memory layout as the feature matrix of the whole signal
+
+    """
+
+    block_frames = max(int(block_frames), 2)
+    frame_count = stft_frame_count(signal_length=y.shape[0], mfcc_params=mfcc_params)
+
+    # Maximum of the mel spectrum
+    mel_basis = librosa.filters.mel(sr=fs,
+                                    n_fft=mfcc_params['n_fft'],
+                                    n_mels=mfcc_params['n_mels'],
+                                    fmin=mfcc_params['fmin'],
+                                    fmax=mfcc_params['fmax'],
+                                    htk=mfcc_params['htk'])
+    max_power = None
+    for first_frame in range(0, frame_count, block_frames):
+        last_frame = min(first_frame + block_frames, frame_count)
+
+        # BLAS sums single frames (matrix-vector products) in another order, keep at least two
+        spectrogram_start = max(min(first_frame, last_frame - 2), 0)
+
+        block_max = numpy.max(numpy.dot(mel_basis, stft_spectrogram(y=y,
+                                                                    mfcc_params=mfcc_params,
+                                                                    first_frame=spectrogram_start,
+                                                                    last_frame=last_frame)))
+        if max_power is None or block_max > max_power:
+            max_power = block_max
+
+    # Frames on both sides of a block needed for its delta and acceleration coefficients
+    context = 0
+    if include_delta:
+        context = max(context, 2 * (delta_params or {}).get('width', 9))
+    if include_acceleration:
+        context = max(context, 2 * (acceleration_params or {}).get('width', 9))
+
+    for first_frame in range(0, frame_count, block_frames):
+        last_frame = min(first_frame + block_frames, frame_count)
+        context_start = max(first_frame - context, 0)
+        context_stop = min(last_frame + context, frame_count)
+        context_start = max(min(context_start, context_stop - 2), 0)
+
+        feature_matrix = feature_extraction(y=y,
+                                            fs=fs,
+                                            statistics=False,
+                                            include_mfcc0=include_mfcc0,
+                                            include_delta=include_delta,
+                                            include_acceleration=include_acceleration,
+                                            mfcc_params=mfcc_params,
+                                            delta_params=delta_params,
+                                            acceleration_params=acceleration_params,
+                                            magnitude_spectrogram=stft_spectrogram(y=y,
+                                                                                   mfcc_params=mfcc_params,
+                                                                                   first_frame=context_start,
+                                                                                   last_frame=context_stop),
+                                            max_power=max_power)['feat']
+
+        # Same memory layout as the feature matrix of the whole signal
+        if numpy.isfortran(feature_matrix):
+            yield numpy.asfortranarray(feature_matrix[first_frame - context_start:last_frame - context_start])
+        else:
+            yield numpy.ascontiguousarray(feature_matrix[first_frame - context_start:last_frame - context_start])
+
+
+def linear_filterbank(fs, n_fft, n_filters=40, fmin=0.0, fmax=None):
+    """Triangular filters with linearly spaced center frequencies
+
+    Parameters
+    ----------
+    fs: int > 0 [scalar]
+        Sample rate
+
+    n_fft: int > 0 [scalar]
+        FFT length
+
+    n_filters: int > 0 [scalar]
+        Number of filters
+        (Default value=40)
+
+    fmin: float >= 0 [scalar]
+        Lower edge of the lowest filter
+        (Default value=0.0)
+
+    fmax: float > 0 [scalar] or None
+        Upper edge of the highest filter, fs / 2 if None
+        (Default value=None)
+
+    Returns
+    -------
+    basis: numpy.ndarray [shape=(n_filters, 1 + n_fft/2)]
+        Filterbank matrix
+
+    """
+
+    if fmax is None:
+        fmax = float(fs) / 2
+
+    fft_frequencies = numpy.linspace(0, float(fs) / 2, int(1 + n_fft // 2))
+    edges = numpy.linspace(fmin, fmax, n_filters + 2)
+
+    lower = (fft_frequencies - edges[:-2, None]) / (edges[1:-1] - edges[:-2])[:, None]
+    upper = (edges[2:, None] - fft_frequencies) / (edges[2:] - edges[1:-1])[:, None]
+
+    return numpy.maximum(0, numpy.minimum(lower, upper))
+
+
+def feature_extraction_chroma(y, fs=44100, statistics=True, include_delta=True, include_acceleration=True,
+                              mfcc_params=None, delta_params=None, acceleration_params=None,
+                              magnitude_spectrogram=None):
+    """Feature extraction, chromagram based features
+
+    Parameters
+    ----------
+    y: numpy.array [shape=(signal_length, )]
+        Audio
+
+    fs: int > 0 [scalar]
+        Sample rate
+        (Default value=44100)
+
+    statistics: bool
+        Calculate feature statistics for extracted matrix
+        (Default value=True)
+
+    include_delta: bool
+        Include delta coefficients.
+        (Default value=True)
+
+    include_acceleration: bool
+        Include acceleration coefficients.
+        (Default value=True)
+
+    mfcc_params: dict or None
+        Window parameters, shared with the MFCC extraction.
+
+    delta_params: dict or None
+        Parameters for extraction of delta coefficients.
+
+    acceleration_params: dict or None
+        Parameters for extraction of acceleration coefficients.
+
+    magnitude_spectrogram: numpy.ndarray [shape=(1 + n_fft/2, frame count)] or None
+        Precalculated power spectrogram, see stft_spectrogram. Calculated from y if None.
+        (Default value=None)
+
+    Returns
+    -------
+    result: dict
+        Feature dict
+
+    """
+
+    if magnitude_spectrogram is None:
+        magnitude_spectrogram = stft_spectrogram(y=y, mfcc_params=mfcc_params)
+
+    chroma = librosa.feature.chroma_stft(S=magnitude_spectrogram, sr=fs, n_fft=mfcc_params['n_fft'])
+
+    # Collect the feature matrix
+    feature_matrix = chroma
+    if include_delta:
+        # Delta coefficients
+        chroma_delta = librosa.feature.delta(chroma, **delta_params)
+
+        # Add Delta Coefficients to feature matrix
+        feature_matrix = numpy.vstack((feature_matrix, chroma_delta))
+
+    if include_acceleration:
+        # Acceleration coefficients (aka delta)
+        chroma_delta2 = librosa.feature.delta(chroma, order=2, **acceleration_params)
+
+        # Add Acceleration Coefficients to feature matrix
+        feature_matrix = numpy.vstack((feature_matrix, chroma_delta2))
+
+    feature_matrix = feature_matrix.T
+
+    # Collect into data structure
+    if statistics:
+        return {
+            'feat': feature_matrix,
+            'stat': {
+                'mean': numpy.mean(feature_matrix, axis=0),
+                'std': numpy.std(feature_matrix, axis=0),
+                'N': feature_matrix.shape[0],
+                'S1': numpy.sum(feature_matrix, axis=0),
+                'S2': numpy.sum(feature_matrix ** 2, axis=0),
+            }
+        }
+    else:
+        return {
+            'feat': feature_matrix}
+
+
+def feature_extraction_linear_cepstrum(y, fs=44100, statistics=True, include_delta=True, include_acceleration=True,
+                                       lfcc_params=None, mfcc_params=None, delta_params=None,
+                                       acceleration_params=None, magnitude_spectrogram=None):
+    """Feature extraction, linear frequency cepstral coefficients calculated from the audio
+
+    Same chain as the MFCC extraction with the mel filterbank replaced by linearly spaced
+    triangular filters. feature_extraction_lfcc loads externally extracted LFCCs instead.
+
+    Parameters
+    ----------
+    y: numpy.array [shape=(signal_length, )]
+        Audio
+
+    fs: int > 0 [scalar]
+        Sample rate
+        (Default value=44100)
+
+    statistics: bool
+        Calculate feature statistics for extracted matrix
+        (Default value=True)
+
+    include_delta: bool
+        Include delta coefficients.
+        (Default value=True)
+
+    include_acceleration: bool
+        Include acceleration coefficients.
+        (Default value=True)
+
+    lfcc_params: dict or None
+        Parameters for extraction of static coefficients, n_lfcc, n_filters, fmin and fmax.
+
+    mfcc_params: dict or None
+        Window parameters, shared with the MFCC extraction.
+
+    delta_params: dict or None
+        Parameters for extraction of delta coefficients.
+
+    acceleration_params: dict or None
+        Parameters for extraction of acceleration coefficients.
+
+    magnitude_spectrogram: numpy.ndarray [shape=(1 + n_fft/2, frame count)] or None
+        Precalculated power spectrogram, see stft_spectrogram. Calculated from y if None.
+        (Default value=None)
+
+    Returns
+    -------
+    result: dict
+        Feature dict
+
+    """
+
+    if magnitude_spectrogram is None:
+        magnitude_spectrogram = stft_spectrogram(y=y, mfcc_params=mfcc_params)
+
+    linear_basis = linear_filterbank(fs=fs,
+                                     n_fft=mfcc_params['n_fft'],
+                                     n_filters=lfcc_params['n_filters'],
+                                     fmin=lfcc_params['fmin'],
+                                     fmax=lfcc_params['fmax'])
+    linear_spectrum = numpy.dot(linear_basis, magnitude_spectrogram)
+    lfcc = librosa.feature.mfcc(S=librosa.logamplitude(linear_spectrum), n_mfcc=lfcc_params['n_lfcc'])
+
+    # Collect the feature matrix
+    feature_matrix = lfcc
+    if include_delta:
+        # Delta coefficients
+        lfcc_delta = librosa.feature.delta(lfcc, **delta_params)
+
+        # Add Delta Coefficients to feature matrix
+        feature_matrix = numpy.vstack((feature_matrix, lfcc_delta))
+
+    if include_acceleration:
+        # Acceleration coefficients (aka delta)
+        lfcc_delta2 = librosa.feature.delta(lfcc, order=2, **acceleration_params)
+
+        # Add Acceleration Coefficients to feature matrix
+        feature_matrix = numpy.vstack((feature_matrix, lfcc_delta2))
+
+    feature_matrix = feature_matrix.T
+
+    # Collect into data structure
+    if statistics:
+        return {
+            'feat': feature_matrix,
+            'stat': {
+                'mean': numpy.mean(feature_matrix, axis=0),
+                'std': numpy.std(feature_matrix, axis=0),
+                'N': feature_matrix.shape[0],
+                'S1': numpy.sum(feature_matrix, axis=0),
+                'S2': numpy.sum(feature_matrix ** 2, axis=0),
+            }
+        }
+    else:
+        return {
+            'feat': feature_matrix}
+
+
+def feature_extraction_shared(y, fs=44100, feature_types=('mfcc',), statistics=True, params=None):
+    """Feature extraction for several feature types from one analysis pass
+
+    The power spectrogram is calculated once and passed to every spectrogram based feature type
+    (mfcc, chroma, lfcc).
+
+    Outputs features in dict, one feature dict per feature type, format:
+
+        {
+            'mfcc': {
+                'feat': feature_matrix [shape=(frame count, feature vector size)],
+                'stat': {...}
+            },
+            ...
+        }
+
+    Parameters
+    ----------
+    y: numpy.array [shape=(signal_length, )]
+        Audio
+
+    fs: int > 0 [scalar]
+        Sample rate
+        (Default value=44100)
+
+    feature_types: list of str [mfcc, chroma, lfcc]
+        Feature types to extract
+        (Default value=('mfcc',))
+
+    statistics: bool
+        Calculate feature statistics for extracted matrices
+        (Default value=True)
+
+    params: dict
+        Feature parameters, features section of the parameter file
+
+    Returns
+    -------
+    result: dict
+        Feature dicts by feature type
+
+    Raises
+    -------
+    ValueError
+        Unknown feature type.
+
+    """
+
+    for feature_type in feature_types:
+        if feature_type not in ['mfcc', 'chroma', 'lfcc']:
+            raise ValueError("Unknown feature type [" + feature_type + "]")
+
+    # Power spectrogram shared by the spectrogram based feature types
+    magnitude_spectrogram = None
+    if set(feature_types) & set(['mfcc', 'chroma', 'lfcc']):
+        magnitude_spectrogram = stft_spectrogram(y=y, mfcc_params=params['mfcc'])
+
+    result = {}
+    for feature_type in feature_types:
+        if feature_type == 'mfcc':
+            result[feature_type] = feature_extraction(y=y,
+                                                      fs=fs,
+                                                      statistics=statistics,
+                                                      include_mfcc0=params['include_mfcc0'],
+                                                      include_delta=params['include_delta'],
+                                                      include_acceleration=params['include_acceleration'],
+                                                      mfcc_params=params['mfcc'],
+                                                      delta_params=params['mfcc_delta'],
+                                                      acceleration_params=params['mfcc_acceleration'],
+                                                      magnitude_spectrogram=magnitude_spectrogram)
+        elif feature_type == 'chroma':
+            result[feature_type] = feature_extraction_chroma(y=y,
+                                                             fs=fs,
+                                                             statistics=statistics,
+                                                             include_delta=params['include_delta'],
+                                                             include_acceleration=params['include_acceleration'],
+                                                             mfcc_params=params['mfcc'],
+                                                             delta_params=params['mfcc_delta'],
+                                                             acceleration_params=params['mfcc_acceleration'],
+                                                             magnitude_spectrogram=magnitude_spectrogram)
+        elif feature_type == 'lfcc':
+            result[feature_type] = feature_extraction_linear_cepstrum(y=y,
+                                                                      fs=fs,
+                                                                      statistics=statistics,
+                                                                      include_delta=params['include_delta'],
+                                                                      include_acceleration=params['include_acceleration'],
+                                                                      lfcc_params=params['lfcc'],
+                                                                      mfcc_params=params['mfcc'],
+                                                                      delta_params=params['mfcc_delta'],
+                                                                      acceleration_params=params['mfcc_acceleration'],
+                                                                      magnitude_spectrogram=magnitude_spectrogram)
+    return result
+
+
+class StreamingFeatureExtractor(object):
+    """Online MFCC feature extractor
+
+    Frame-synchronous counterpart of feature_extraction for live streams. Audio is fed in blocks of any size,
+    spectrogram frames are computed from a rolling sample buffer with the same centered (reflect padded)
+    STFT framing as feature_extraction, and delta and acceleration coefficients are computed once their
+    context frames have arrived. Frames equal the offline ones, except that the log amplitude floor follows
+    the running maximum instead of the maximum of the whole recording. Latency is one STFT window plus
+    the delta context.
+
+    Examples
+    --------
+
+    >>> extractor = StreamingFeatureExtractor(fs=fs, mfcc_params=params['mfcc'], ...)
+    >>> for audio_block in stream:
+    >>>     feature_matrix = extractor.process(audio_block)
+    >>>     # use the frames
+    >>>
+    >>> feature_matrix = extractor.flush()
+
+    """
+
+    def __init__(self, fs=44100, include_mfcc0=True, include_delta=True, include_acceleration=True,
+                 mfcc_params=None, delta_params=None, acceleration_params=None):
+        """__init__ method.
+
+        Parameters
+        ----------
+        fs: int > 0 [scalar]
+            Sample rate
+            (Default value=44100)
+
+        include_mfcc0: bool
+            Include 0th MFCC coefficient into static coefficients.
+            (Default value=True)
+
+        include_delta: bool
+            Include delta MFCC coefficients.
+            (Default value=True)
+
+        include_acceleration: bool
+            Include acceleration MFCC coefficients.
+            (Default value=True)
+
+        mfcc_params: dict or None
+            Parameters for extraction of static MFCC coefficients.
+
+        delta_params: dict or None
+            Parameters for extraction of delta MFCC coefficients.
+
+        acceleration_params: dict or None
+            Parameters for extraction of acceleration MFCC coefficients.
+
+        """
+
+        self.eps = numpy.spacing(1)
+
+        self.include_mfcc0 = include_mfcc0
+        self.include_delta = include_delta
+        self.include_acceleration = include_acceleration
+        self.mfcc_params = mfcc_params
+        self.delta_params = delta_params or {}
+        self.acceleration_params = acceleration_params or {}
+
+        # Windowing function
+        if mfcc_params['window'] == 'hamming_asymmetric':
+            self.window = scipy.signal.hamming(mfcc_params['n_fft'], sym=False)
+        elif mfcc_params['window'] == 'hamming_symmetric':
+            self.window = scipy.signal.hamming(mfcc_params['n_fft'], sym=True)
+        elif mfcc_params['window'] == 'hann_asymmetric':
+            self.window = scipy.signal.hann(mfcc_params['n_fft'], sym=False)
+        elif mfcc_params['window'] == 'hann_symmetric':
+            self.window = scipy.signal.hann(mfcc_params['n_fft'], sym=True)
+        else:
+            self.window = None
+
+        self.mel_basis = librosa.filters.mel(sr=fs,
+                                             n_fft=mfcc_params['n_fft'],
+                                             n_mels=mfcc_params['n_mels'],
+                                             fmin=mfcc_params['fmin'],
+                                             fmax=mfcc_params['fmax'],
+                                             htk=mfcc_params['htk'])
+
+        # Log amplitude floor below the maximum, librosa.logamplitude default
+        self.top_db = 80.0
+        self.log_max = -numpy.inf
+
+        # Frames on both sides of a frame needed for its delta and acceleration coefficients
+        self.context = 0
+        if include_delta:
+            self.context = max(self.context, 2 * self.delta_params.get('width', 9))
+        if include_acceleration:
+            self.context = max(self.context, 2 * self.acceleration_params.get('width', 9))
+
+        self.feature_count = mfcc_params['n_mfcc'] * (1 + int(include_delta) + int(include_acceleration))
+        if not include_mfcc0:
+            self.feature_count -= 1
+
+        # Padded samples not yet framed, and the last samples for the reflect padding at the end
+        self.pad_length = int(mfcc_params['n_fft'] // 2)
+        self.samples = numpy.zeros(0)
+        self.tail = numpy.zeros(0)
+        self.started = False
+
+        # Static coefficients from frame mfcc_start on [shape=(n_mfcc, frames)], frames seen and emitted
+        self.mfcc = numpy.zeros((mfcc_params['n_mfcc'], 0))
+        self.mfcc_start = 0
+        self.frame_count = 0
+        self.emitted = 0
+
+    def process(self, y):
+        """Process a block of audio
+
+        Parameters
+        ----------
+        y: numpy.array [shape=(block_length, )]
+            Audio following the previous block
+
+        Returns
+        -------
+        feature_matrix : numpy.ndarray [shape=(frames, number of feature values)]
+            Feature frames completed by the block, frames can be zero
+
+        """
+
+        y = numpy.asarray(y, dtype=numpy.float64) + self.eps
+        self.tail = numpy.concatenate((self.tail, y))[-(self.pad_length + 1):]
+        self.samples = numpy.concatenate((self.samples, y))
+
+        if not self.started:
+            if self.samples.shape[0] <= self.pad_length:
+                return self.feature_frames(final=False)
+
+            # Reflect padding at the start, like librosa.stft with center=True
+            self.samples = numpy.concatenate((self.samples[1:self.pad_length + 1][::-1], self.samples))
+            self.started = True
+
+        self.frame_samples()
+        return self.feature_frames(final=False)
+
+    def flush(self):
+        """End of stream, process the remaining audio
+
+        Returns
+        -------
+        feature_matrix : numpy.ndarray [shape=(frames, number of feature values)]
+            Remaining feature frames
+
+        """
+
+        if not self.started:
+            self.samples = numpy.pad(self.samples, self.pad_length, mode='reflect')
+            self.started = True
+        else:
+            # Reflect padding at the end
+            self.samples = numpy.concatenate((self.samples, self.tail[-(self.pad_length + 1):-1][::-1]))
+
+        self.frame_samples()
+        return self.feature_frames(final=True)
+
+    def frame_samples(self):
+        """Static coefficients of all complete frames in the sample buffer
+
+        Returns
+        -------
+        nothing
+
+        """
+
+        n_fft = self.mfcc_params['n_fft']
+        hop_length = self.mfcc_params['hop_length']
+        if self.samples.shape[0] < n_fft:
+            return
+
+        frame_count = 1 + (self.samples.shape[0] - n_fft) // hop_length
+        magnitude_spectrogram = numpy.abs(librosa.stft(self.samples[:(frame_count - 1) * hop_length + n_fft],
+                                                       n_fft=n_fft,
+                                                       win_length=self.mfcc_params['win_length'],
+                                                       hop_length=hop_length,
+                                                       center=False,
+                                                       window=self.window)) ** 2
+        self.samples = self.samples[frame_count * hop_length:]
+
+        log_mel_spectrum = librosa.logamplitude(numpy.dot(self.mel_basis, magnitude_spectrogram), top_db=None)
+        self.log_max = max(self.log_max, numpy.max(log_mel_spectrum))
+        log_mel_spectrum = numpy.maximum(log_mel_spectrum, self.log_max - self.top_db)
+
+        mfcc = librosa.feature.mfcc(S=log_mel_spectrum, n_mfcc=self.mfcc_params['n_mfcc'])
+        self.mfcc = numpy.hstack((self.mfcc, mfcc))
+        self.frame_count += mfcc.shape[1]
+
+    def feature_frames(self, final):
+        """Feature frames with complete delta context
+
+        Parameters
+        ----------
+        final : bool
+            End of stream, emit all frames
+
+        Returns
+        -------
+        feature_matrix : numpy.ndarray [shape=(frames, number of feature values)]
+            Feature frames
+
+        """
+
+        if final:
+            stop = self.frame_count
+        else:
+            stop = max(self.frame_count - self.context, self.emitted)
+
+        if stop <= self.emitted:
+            return numpy.zeros((0, self.feature_count))
+
+        # Static coefficients, frames before the emitted ones give the delta context
+        feature_matrix = self.mfcc
+        if self.include_delta:
+            feature_matrix = numpy.vstack((feature_matrix, librosa.feature.delta(self.mfcc, **self.delta_params)))
+
+        if self.include_acceleration:
+            feature_matrix = numpy.vstack((feature_matrix, librosa.feature.delta(self.mfcc, order=2,
+                                                                                 **self.acceleration_params)))
+
+        if not self.include_mfcc0:
+            feature_matrix = feature_matrix[1:, :]
+
+        feature_matrix = feature_matrix[:, self.emitted - self.mfcc_start:stop - self.mfcc_start].T
+        self.emitted = stop
+
+        # Keep the context of the next frames
+        keep_start = max(self.emitted - self.context, self.mfcc_start)
+        self.mfcc = self.mfcc[:, keep_start - self.mfcc_start:]
+        self.mfcc_start = keep_start
+
+        return feature_matrix
+
+
 class FeatureNormalizer(object):
     """Feature normalizer class
 
-    Accumulates feature statistics
+    Accumulates feature statistics as frame count, mean and sum of squared deviations from the mean, and
+    combines them with the pairwise update of Chan et al. Unlike the raw sums of values and squared values,
+    these do not lose the variance of features with a large offset, and statistics collected separately,
+    e.g. by parallel workers, can be merged in any order.
 
     Examples
     --------
@@ -175,8 +973,13 @@ class FeatureNormalizer(object):
     >>>     feature_matrix_normalized = normalizer.normalize(feature_matrix)
     >>>     # used the features
 
-    """
+    >>> normalizer = FeatureNormalizer()
+    >>> for worker_normalizer in worker_normalizers:
+    >>>     normalizer.merge(worker_normalizer)
+    >>>
+    >>> normalizer.finalize()
 
+    """
     def __init__(self, feature_matrix=None):
         """__init__ method.
 
@@ -189,23 +992,19 @@ class FeatureNormalizer(object):
         if feature_matrix is None:
             self.N = 0
             self.mean = 0
-            self.S1 = 0
-            self.S2 = 0
+            self.M2 = 0
             self.std = 0
         else:
-            self.mean = numpy.mean(feature_matrix, axis=0)
-            self.std = numpy.std(feature_matrix, axis=0)
             self.N = feature_matrix.shape[0]
-            self.S1 = numpy.sum(feature_matrix, axis=0)
-            self.S2 = numpy.sum(feature_matrix ** 2, axis=0)
+            self.mean = numpy.mean(feature_matrix, axis=0)
+            self.M2 = numpy.var(feature_matrix, axis=0) * self.N
             self.finalize()
 
     def __enter__(self):
         # Initialize Normalization class and return it
         self.N = 0
         self.mean = 0
-        self.S1 = 0
-        self.S2 = 0
+        self.M2 = 0
         self.std = 0
         return self
 
@@ -226,6 +1025,11 @@ class FeatureNormalizer(object):
                 'S2': numpy.sum(feature_matrix ** 2, axis=0),
             }
 
+        Only N, S1 and S2 are used, mean and std are not stored the same way by all feature extractors.
+        The sums are turned into the mean and squared deviations of the file before the update, so
+        cancellation is limited to the frames of one file. The dict can also hold the statistics of
+        several files as rows, see load_feature_stats.
+
         Parameters
         ----------
         stat : dict
@@ -236,10 +1040,63 @@ class FeatureNormalizer(object):
         nothing
 
         """
-        self.N += stat['N']
-        self.mean += stat['mean']
-        self.S1 += stat['S1']
-        self.S2 += stat['S2']
+
+        N = numpy.ravel(stat['N'])
+        S1 = numpy.reshape(stat['S1'], (len(N), -1))[N > 0]
+        S2 = numpy.reshape(stat['S2'], (len(N), -1))[N > 0]
+        N = N[N > 0]
+        if len(N):
+            mean = S1 / N[:, numpy.newaxis].astype(float)
+            M2 = numpy.maximum(S2 - S1 * mean, 0.0)
+
+            # Files combined with the deviations of their means from the mean of all of them
+            total_mean = numpy.sum(S1, axis=0) / float(numpy.sum(N))
+            self.update(N=numpy.sum(N),
+                        mean=total_mean,
+                        M2=numpy.sum(M2, axis=0) + numpy.sum(N[:, numpy.newaxis] * (mean - total_mean) ** 2, axis=0))
+
+    def merge(self, normalizer):
+        """Merge statistics accumulated by another normalizer
+
+        Parameters
+        ----------
+        normalizer : FeatureNormalizer
+            Normalizer with accumulated statistics, finalized or not
+
+        Returns
+        -------
+        nothing
+
+        """
+
+        if normalizer.N > 0:
+            self.update(N=normalizer.N, mean=numpy.ravel(normalizer.mean), M2=numpy.ravel(normalizer.M2))
+
+    def update(self, N, mean, M2):
+        """Add statistics of a set of frames
+
+        Parameters
+        ----------
+        N : int > 0
+            Frame count
+
+        mean : numpy.ndarray [shape=(number of feature values,)]
+            Mean of the frames
+
+        M2 : numpy.ndarray [shape=(number of feature values,)]
+            Sum of squared deviations of the frames from their mean
+
+        Returns
+        -------
+        nothing
+
+        """
+
+        total = self.N + N
+        delta = mean - numpy.ravel(self.mean)
+        self.mean = numpy.ravel(self.mean) + delta * (N / float(total))
+        self.M2 = numpy.ravel(self.M2) + M2 + delta * delta * (self.N * (N / float(total)))
+        self.N = total
 
     def finalize(self):
         """Finalize statistics calculation
@@ -256,17 +1113,16 @@ class FeatureNormalizer(object):
 
         """
 
-        # Finalize statistics
-        self.mean = self.S1 / self.N
-        self.std = numpy.sqrt((self.N * self.S2 - (self.S1 * self.S1)) / (self.N * (self.N - 1)))
-
-        # In case we have very brain-death material we get std = Nan => 0.0
-        self.std = numpy.nan_to_num(self.std)
+        # Finalize statistics, sample standard deviation, zero for a single frame
+        if self.N > 1:
+            self.std = numpy.sqrt(self.M2 / float(self.N - 1))
+        else:
+            self.std = numpy.zeros_like(self.M2)
 
         self.mean = numpy.reshape(self.mean, [1, -1])
         self.std = numpy.reshape(self.std, [1, -1])
 
-    def normalize(self, feature_matrix):
+    def normalize(self, feature_matrix, in_place=False, dtype=None):
         """Normalize feature matrix with internal statistics of the class
 
         Parameters
@@ -274,11 +1130,34 @@ class FeatureNormalizer(object):
         feature_matrix : numpy.ndarray [shape=(frames, number of feature values)]
             Feature matrix to be normalized
 
+        in_place : bool
+            Normalize the given matrix itself instead of a copy. A read-only matrix, e.g. a memory-mapped
+            npy feature file, or a matrix of another type than dtype is still copied.
+            (Default value=False)
+
+        dtype : numpy.dtype or None
+            Type of the normalized matrix, e.g. numpy.float32 to halve its size, None uses the type of
+            the feature matrix and the statistics combined.
+            (Default value=None)
+
         Returns
         -------
-        feature_matrix : numpy.ndarray [shape=(frames, number of feature values)]
+        normalized : numpy.ndarray [shape=(frames, number of feature values)]
             Normalized feature matrix
 
         """
 
-        return (feature_matrix - self.mean) / self.std
+        if dtype is None:
+            dtype = numpy.result_type(feature_matrix, self.mean)
+        else:
+            dtype = numpy.dtype(dtype)
+
+        if in_place and feature_matrix.dtype == dtype and feature_matrix.flags.writeable:
+            normalized = feature_matrix
+        else:
+            normalized = numpy.empty_like(feature_matrix, dtype=dtype, subok=False)
+
+        # Offset is removed at the precision of the features and statistics, before any rounding to dtype
+        numpy.subtract(feature_matrix, self.mean, out=normalized, casting='unsafe')
+        numpy.divide(normalized, self.std, out=normalized, casting='unsafe')
+        return normalized
@@ -4,6 +4,7 @@
 # DCASE 2016::Acoustic Scene Classification / Baseline System
 
 import argparse
+import multiprocessing
 import textwrap
 import timeit
 
@@ -16,6 +17,7 @@ from sklearn.metrics import confusion_matrix
 from src.dataset import *
 from src.evaluation import *
 from src.features import *
+from src.scene_classification import *
 
 __version_info__ = ('1', '0', '0')
 __version__ = '.'.join(__version_info__)
@@ -95,21 +97,19 @@ def main(argv):
         section_header('Feature extraction')
 
         # Collect files in train sets
-        files = []
-        for fold in dataset.folds(mode=dataset_evaluation_mode):
-            for item_id, item in enumerate(dataset.train(fold)):
-                if item['file'] not in files:
-                    files.append(item['file'])
-            for item_id, item in enumerate(dataset.test(fold)):
-                if item['file'] not in files:
-                    files.append(item['file'])
+        files = dataset.fold_files(folds=dataset.folds(mode=dataset_evaluation_mode))
         files = sorted(files)
 
         # Go through files and make sure all features are extracted
         do_feature_extraction(files=files,
                               dataset=dataset,
                               feature_path=params['path']['features'],
+                              feature_store=params['extraction']['store'],
                               params=params['features'],
+                              n_jobs=params['extraction']['n_jobs'],
+                              audio_cache_path=params['path']['audio_cache'],
+                              audio_cache_size=params['extraction']['audio_cache_size'],
+                              block_frames=params['extraction']['block_frames'],
                               overwrite=params['general']['overwrite'])
 
         foot()
@@ -122,11 +122,14 @@ def main(argv):
         do_feature_normalization(dataset=dataset,
                                  feature_normalizer_path=params['path']['feature_normalizers'],
                                  feature_path=params['path']['features'],
+                                 feature_store=params['extraction']['store'],
                                  dataset_evaluation_mode=dataset_evaluation_mode,
                                  overwrite=params['general']['overwrite'])
 
         foot()
 
+    fold_timings = {}
+
     # System training
     # ==================================================
     if params['flow']['train_system']:
@@ -134,15 +137,22 @@ def main(argv):
 
         train_start = timeit.default_timer()
 
-        do_system_training(dataset=dataset,
-                           model_path=params['path']['models'],
-                           feature_normalizer_path=params['path']['feature_normalizers'],
-                           feature_path=params['path']['features'],
-                           classifier_params=params['classifier']['parameters'],
-                           classifier_method=params['classifier']['method'],
-                           dataset_evaluation_mode=dataset_evaluation_mode,
-                           overwrite=params['general']['overwrite']
-                           )
+        fold_timings['train'] = run_folds(do_system_training,
+                                          folds=dataset.folds(mode=dataset_evaluation_mode),
+                                          fold_jobs=params['folds']['n_jobs'],
+                                          fold_threads=params['folds']['threads'],
+                                          result_container=final_result,
+                                          dataset=dataset,
+                                          model_path=params['path']['models'],
+                                          feature_normalizer_path=params['path']['feature_normalizers'],
+                                          feature_path=params['path']['features'],
+                                          feature_store=params['extraction']['store'],
+                                          n_jobs=params['training']['n_jobs'],
+                                          classifier_params=params['classifier']['parameters'],
+                                          classifier_method=params['classifier']['method'],
+                                          dataset_evaluation_mode=dataset_evaluation_mode,
+                                          overwrite=params['general']['overwrite']
+                                          )
 
         train_end = timeit.default_timer()
 
@@ -158,15 +168,23 @@ def main(argv):
 
             test_start = timeit.default_timer()
 
-            do_system_testing(dataset=dataset,
-                              feature_path=params['path']['features'],
-                              result_path=params['path']['results'],
-                              model_path=params['path']['models'],
-                              feature_params=params['features'],
-                              dataset_evaluation_mode=dataset_evaluation_mode,
-                              classifier_method=params['classifier']['method'],
-                              overwrite=params['general']['overwrite']
-                              )
+            fold_timings['test'] = run_folds(do_system_testing,
+                                             folds=dataset.folds(mode=dataset_evaluation_mode),
+                                             fold_jobs=params['folds']['n_jobs'],
+                                             fold_threads=params['folds']['threads'],
+                                             result_container=final_result,
+                                             dataset=dataset,
+                                             feature_path=params['path']['features'],
+                                             feature_store=params['extraction']['store'],
+                                             result_path=params['path']['results'],
+                                             model_path=params['path']['models'],
+                                             feature_params=params['features'],
+                                             dataset_evaluation_mode=dataset_evaluation_mode,
+                                             classifier_method=params['classifier']['method'],
+                                             test_batch_size=params['testing']['batch_size'],
+                                             streaming=params['testing']['streaming'],
+                                             overwrite=params['general']['overwrite']
+                                             )
 
             test_end = timeit.default_timer()
 
@@ -197,11 +215,14 @@ def main(argv):
 
             do_system_testing(dataset=challenge_dataset,
                               feature_path=params['path']['features'],
+                              feature_store=params['extraction']['store'],
                               result_path=params['path']['challenge_results'],
                               model_path=params['path']['models'],
                               feature_params=params['features'],
                               dataset_evaluation_mode=dataset_evaluation_mode,
                               classifier_method=params['classifier']['method'],
+                              test_batch_size=params['testing']['batch_size'],
+                              streaming=params['testing']['streaming'],
                               overwrite=True
                               )
 
@@ -210,6 +231,12 @@ def main(argv):
             print " "
             print "Your results for the challenge data are stored at [" + params['path']['challenge_results'] + "]"
             print " "
+    if fold_timings:
+        section_header('Fold timings')
+        fold_timing_summary(fold_timings)
+        foot()
+        final_result['fold_time'] = fold_timings
+
     tot_end = timeit.default_timer()
     print " "
     print "Train Time : " + str(train_end - train_start)
@@ -251,6 +278,28 @@ def process_parameters(params):
     # Copy parameters for current classifier method
     params['classifier']['parameters'] = params['classifier_parameters'][params['classifier']['method']]
 
+    # Testing batch size and streaming are not model parameters, keep them out of the classifier hash
+    params['testing'] = {'batch_size': params['classifier']['parameters'].pop('test_batch_size', 0),
+                         'streaming': params['classifier']['parameters'].pop('streaming', None)}
+
+    # Streaming changes the frame order in training, so it is part of the classifier hash when enabled
+    if not params['classifier']['parameters'].get('stream_buffer_size'):
+        params['classifier']['parameters'].pop('stream_buffer_size', None)
+
+    # Training worker count does not change the models, keep it out of the classifier hash
+    params['training'] = {'n_jobs': params['classifier']['parameters'].pop('n_jobs', 1)}
+
+    # Fold scheduling does not change the models or results, keep it out of the hashes
+    params['folds'] = {'n_jobs': params['general'].pop('fold_jobs', 1),
+                       'threads': params['general'].pop('fold_threads', 0)}
+
+    # Worker count, feature file format, audio cache and extraction blocks do not change the features, keep them
+    # out of the feature hash
+    params['extraction'] = {'n_jobs': params['features'].pop('n_jobs', 1),
+                            'store': params['features'].pop('store', 'cpickle'),
+                            'audio_cache_size': params['features'].pop('audio_cache_size', 0),
+                            'block_frames': params['features'].pop('block_frames', 0)}
+
     # Hash
     params['features']['hash'] = get_parameter_hash(params['features'])
     params['classifier']['hash'] = get_parameter_hash(params['classifier'])
@@ -282,6 +331,14 @@ def process_parameters(params):
                                              params['path']['results'],
                                              params['features']['hash'], params['classifier']['hash'])
 
+    # Early decisions change the results, streaming results are kept apart from whole file results
+    if params['testing']['streaming'] and params['testing']['streaming'].get('block_frames'):
+        params['path']['results'] = os.path.join(params['path']['results'], 'streaming_' +
+                                                 get_parameter_hash(params['testing']['streaming']))
+
+    # Resampled audio cache
+    params['path']['audio_cache'] = os.path.join(params['path']['base'], params['path']['audio_cache'])
+
     return params
 
 
@@ -430,6 +487,206 @@ def get_model_filename(fold, path, extension='cpickle'):
     return os.path.join(path, 'model_fold' + str(fold) + '.' + extension)
 
 
+def get_dnn_model_path(fold, path):
+    """Get DNN checkpoint path
+
+    Each fold has its own checkpoint next to its model container, so folds trained at the same time do
+    not overwrite each other's network.
+
+    Parameters
+    ----------
+    fold : int >= 0
+        evaluation fold number
+
+    path :  str
+        model path
+
+    Returns
+    -------
+    dnn_model_path : str
+        full checkpoint path
+
+    """
+
+    return os.path.join(path, 'dnn_model_fold' + str(fold))
+
+
+def get_shard_filename(fold, path, extension='npy'):
+    """Get training shard filename
+
+    Parameters
+    ----------
+    fold : int >= 0
+        evaluation fold number
+
+    path :  str
+        shard path
+
+    extension : str
+        file extension, npy for the feature matrix and cpickle for the shard index
+        (Default value='npy')
+
+    Returns
+    -------
+    shard_filename : str
+        full shard filename
+
+    """
+
+    return os.path.join(path, 'shard_fold' + str(fold) + '.' + extension)
+
+
+def load_training_shard(fold, path):
+    """Load training shard, the feature matrix is memory-mapped read-only
+
+    Parameters
+    ----------
+    fold : int >= 0
+        evaluation fold number
+
+    path :  str
+        shard path
+
+    Returns
+    -------
+    shard : dict
+        shard index with the feature matrix added as 'feat', see do_training_shard
+
+    """
+
+    shard = load_data(get_shard_filename(fold=fold, path=path, extension='cpickle'))
+    shard['feat'] = numpy.load(get_shard_filename(fold=fold, path=path), mmap_mode='r')
+    return shard
+
+
+def do_training_shard(dataset, fold, shard_path, feature_path, normalizer, feature_store='cpickle'):
+    """Pack the normalized training data of a fold into one shard
+
+    Frames are written into one preallocated matrix on disk, grouped by class label, with the label of
+    each frame in label_ids. Frame counts are read from the feature statistics, so each feature file
+    is loaded once.
+
+    Shard index format:
+
+    {
+        'labels': class labels in order of first appearance in the training set
+        'label_offsets': {label: (first frame, last frame + 1)}
+        'label_ids': numpy.ndarray [shape=(frames,)], index into labels for each frame
+        'files': training files in shard order
+        'file_offsets': numpy.ndarray [shape=(files + 1,)], first frame of each file
+    }
+
+    Parameters
+    ----------
+    dataset : class
+        dataset class
+
+    fold : int >= 0
+        evaluation fold number
+
+    shard_path : str
+        path where the shards are saved
+
+    feature_path : str
+        path where the features are saved
+
+    normalizer : FeatureNormalizer
+        feature normalizer of the fold
+
+    feature_store : str {'cpickle', 'npy'}
+        feature file format, see save_feature_data
+        (Default value='cpickle')
+
+    Returns
+    -------
+    nothing
+
+    Raises
+    -------
+    IOError
+        Feature file not found.
+
+    ValueError
+        Feature statistics do not match the feature file.
+
+    """
+
+    # Check that target path exists, create if not
+    check_path(shard_path)
+
+    # Training files per class label
+    label_items = {}
+    labels = []
+    for item in dataset.train(fold):
+        if item['scene_label'] not in label_items:
+            label_items[item['scene_label']] = []
+            labels.append(item['scene_label'])
+        label_items[item['scene_label']].append(item)
+
+    # Frame counts, so the shard can be preallocated
+    items = []
+    frame_counts = []
+    label_offsets = {}
+    for label in label_items:
+        label_start = sum(frame_counts)
+        for item in label_items[label]:
+            feature_filename = get_feature_filename(audio_file=item['file'], path=feature_path,
+                                                    extension=feature_store)
+            if not os.path.isfile(feature_filename):
+                raise IOError("Features not found [%s]" % (item['file']))
+
+            frame_count = load_feature_data(feature_filename, part='stat')['N']
+
+            items.append(item)
+            frame_counts.append(frame_count)
+        label_offsets[label] = (label_start, sum(frame_counts))
+
+    file_offsets = numpy.cumsum([0] + frame_counts)
+    label_ids = numpy.empty(file_offsets[-1], dtype=int)
+    for label in label_offsets:
+        label_ids[label_offsets[label][0]:label_offsets[label][1]] = labels.index(label)
+
+    # Index first, an existing shard matrix always has its index next to it
+    save_data(get_shard_filename(fold=fold, path=shard_path, extension='cpickle'), {
+        'labels': labels,
+        'label_offsets': label_offsets,
+        'label_ids': label_ids,
+        'files': [item['file'] for item in items],
+        'file_offsets': file_offsets,
+    })
+
+    shard_filename = get_shard_filename(fold=fold, path=shard_path)
+    temp_filename = shard_filename + '.' + str(os.getpid()) + '.tmp'
+    shard = None
+    for item_id, item in enumerate(items):
+        progress(title_text='Packing data',
+                 fold=fold,
+                 percentage=(float(item_id) / len(items)),
+                 note=os.path.split(item['file'])[1])
+
+        feature_filename = get_feature_filename(audio_file=item['file'], path=feature_path,
+                                                extension=feature_store)
+        feature_data = load_feature_data(feature_filename, part='feat')
+
+        if feature_data.shape[0] != frame_counts[item_id]:
+            raise ValueError("Feature statistics do not match features [%s]" % feature_filename)
+
+        if shard is None:
+            shard = numpy.lib.format.open_memmap(temp_filename,
+                                                 mode='w+',
+                                                 dtype=numpy.result_type(feature_data, normalizer.mean),
+                                                 shape=(file_offsets[-1], feature_data.shape[1]))
+        shard[file_offsets[item_id]:file_offsets[item_id + 1]] = feature_data
+
+        # Scale features in the shard itself
+        normalizer.normalize(shard[file_offsets[item_id]:file_offsets[item_id + 1]], in_place=True)
+
+    if shard is not None:
+        shard.flush()
+        del shard
+        os.rename(temp_filename, shard_filename)
+
+
 def get_result_filename(fold, path, extension='txt'):
     """Get result filename
 
@@ -458,9 +715,39 @@ def get_result_filename(fold, path, extension='txt'):
         return os.path.join(path, 'results_fold' + str(fold) + '.' + extension)
 
 
-def do_feature_extraction(files, dataset, feature_path, params, overwrite=False):
+def load_dnn_model(fold, path):
+    """Restore DNN model
+
+    The model is not cached, each restore builds its own TensorFlow graph. do_system_testing restores it
+    once per fold and drops it with the fold, so one fold model is held at a time.
+
+    Parameters
+    ----------
+    fold : int >= 0
+        evaluation fold number
+
+    path : str
+        model path, the checkpoint of the fold is restored from get_dnn_model_path
+
+    Returns
+    -------
+    model_clf : skflow.TensorFlowEstimator
+        restored model
+
+    """
+
+    return skflow.TensorFlowEstimator.restore(get_dnn_model_path(fold=fold, path=path))
+
+
+def do_feature_extraction(files, dataset, feature_path, params, overwrite=False, n_jobs=1, feature_store='cpickle',
+                          audio_cache_path=None, audio_cache_size=0, block_frames=0):
     """Feature extraction
 
+    Files are independent, so they are processed by a pool of worker processes. Files with
+    existing feature files are skipped before any work is dispatched, and progress is reported
+    from the main process as workers finish. Statistics of the extracted files are added to the
+    statistics index of the feature path, see load_feature_stats.
+
     Parameters
     ----------
     files : list
@@ -472,6 +759,10 @@ def do_feature_extraction(files, dataset, feature_path, params, overwrite=False)
     feature_path : str
         path where the features are saved
 
+    feature_store : str {'cpickle', 'npy'}
+        feature file format, see save_feature_data
+        (Default value='cpickle')
+
     params : dict
         parameter dict
 
@@ -479,6 +770,23 @@ def do_feature_extraction(files, dataset, feature_path, params, overwrite=False)
         overwrite existing feature files
         (Default value=False)
 
+    n_jobs : int
+        number of worker processes, -1 uses all CPU cores, 1 extracts in the main process
+        (Default value=1)
+
+    audio_cache_path : str
+        path of the resampled audio cache shared by all runs, see load_audio
+        (Default value=None)
+
+    audio_cache_size : float
+        size limit of the resampled audio cache in GB, 0 disables the cache
+        (Default value=0)
+
+    block_frames : int
+        frames per extraction block, longer recordings are extracted and saved block by block,
+        0 extracts whole files at once
+        (Default value=0)
+
     Returns
     -------
     nothing
@@ -493,45 +801,107 @@ def do_feature_extraction(files, dataset, feature_path, params, overwrite=False)
     # Check that target path exists, create if not
     check_path(feature_path)
 
-    for file_id, audio_filename in enumerate(files):
-        # Get feature filename
-        current_feature_file = get_feature_filename(audio_file=os.path.split(audio_filename)[1], path=feature_path)
+    # Resampled audio cache, shared by the workers
+    if audio_cache_path and audio_cache_size > 0:
+        check_path(audio_cache_path)
+        audio_cache_size = int(audio_cache_size * 1024 ** 3)
+    else:
+        audio_cache_path = None
 
-        progress(title_text='Extracting',
-                 percentage=(float(file_id) / len(files)),
-                 note=os.path.split(audio_filename)[1])
+    # Collect files without features, make sure audio is there before starting the workers
+    jobs = []
+    for audio_filename in files:
+        # Get feature filename
+        current_feature_file = get_feature_filename(audio_file=os.path.split(audio_filename)[1], path=feature_path,
+                                                    extension=feature_store)
 
         if not os.path.isfile(current_feature_file) or overwrite:
-            # Load audio data
-            if os.path.isfile(dataset.relative_to_absolute_path(audio_filename)):
-                y, fs = load_audio(filename=dataset.relative_to_absolute_path(audio_filename), mono=True,
-                                   fs=params['fs'])
-            else:
+            if not os.path.isfile(dataset.relative_to_absolute_path(audio_filename)):
                 raise IOError("Audio file not found [%s]" % audio_filename)
 
-            # Extract features
-            if params['method'] == 'lfcc':
-                feature_file_txt = get_feature_filename(audio_file=os.path.split(audio_filename)[1],
-                                                        path=feature_path,
-                                                        extension='txt')
-                feature_data = feature_extraction_lfcc(feature_file_txt)
-            else:
-                # feature_data['feat'].shape is  (1501, 60)
-                feature_data = feature_extraction(y=y,
-                                                  fs=fs,
-                                                  include_mfcc0=params['include_mfcc0'],
-                                                  include_delta=params['include_delta'],
-                                                  include_acceleration=params['include_acceleration'],
-                                                  mfcc_params=params['mfcc'],
-                                                  delta_params=params['mfcc_delta'],
-                                                  acceleration_params=params['mfcc_acceleration'])
+            jobs.append((dataset.relative_to_absolute_path(audio_filename), current_feature_file, feature_path, params,
+                         audio_cache_path, audio_cache_size, block_frames))
 
-            # Save
-            save_data(current_feature_file, feature_data)
+    if n_jobs < 0:
+        n_jobs = max(multiprocessing.cpu_count() + 1 + n_jobs, 1)
+
+    pool = None
+    if n_jobs > 1 and len(jobs) > 1:
+        pool = multiprocessing.Pool(processes=min(n_jobs, len(jobs)))
+        extracted = pool.imap_unordered(do_feature_extraction_file, jobs)
+    else:
+        extracted = (do_feature_extraction_file(job) for job in jobs)
+
+    stats = {}
+    try:
+        for job_id, (audio_filename, current_feature_file, stat) in enumerate(extracted):
+            stats[current_feature_file] = stat
+            progress(title_text='Extracting',
+                     percentage=(float(job_id + 1) / len(jobs)),
+                     note=os.path.split(audio_filename)[1])
+    finally:
+        if pool is not None:
+            pool.terminate()
+            pool.join()
+
+        # Statistics of the files extracted so far, also when interrupted
+        update_feature_stat_index(stats)
+
+
+def do_feature_extraction_file(job):
+    """Feature extraction for one audio file, run in a worker process
+
+    Parameters
+    ----------
+    job : tuple
+        absolute audio filename, feature filename, feature path, parameter dict, audio cache path,
+        audio cache size in bytes and frames per extraction block
+
+    Returns
+    -------
+    audio_filename : str
+        absolute audio filename
+
+    current_feature_file : str
+        feature filename
+
+    stat : dict or None
+        feature statistics, see save_feature_data
+
+    """
+
+    audio_filename, current_feature_file, feature_path, params, audio_cache_path, audio_cache_size, block_frames = job
+
+    # Load audio data
+    y, fs = load_audio(filename=audio_filename, mono=True, fs=params['fs'],
+                       cache_path=audio_cache_path, cache_size=audio_cache_size)
+
+    # Extract features
+    if params['method'] == 'lfcc':
+        feature_file_txt = get_feature_filename(audio_file=os.path.split(audio_filename)[1],
+                                                path=feature_path,
+                                                extension='txt')
+        feature_data = feature_extraction_lfcc(feature_file_txt)
+    else:
+        # feature_data['feat'].shape is  (1501, 60)
+        feature_data = feature_extraction(y=y,
+                                          fs=fs,
+                                          include_mfcc0=params['include_mfcc0'],
+                                          include_delta=params['include_delta'],
+                                          include_acceleration=params['include_acceleration'],
+                                          mfcc_params=params['mfcc'],
+                                          delta_params=params['mfcc_delta'],
+                                          acceleration_params=params['mfcc_acceleration'],
+                                          block_frames=block_frames)
+
+    # Save
+    stat = save_feature_data(current_feature_file, feature_data)
+
+    return audio_filename, current_feature_file, stat
 
 
 def do_feature_normalization(dataset, feature_normalizer_path, feature_path, dataset_evaluation_mode='folds',
-                             overwrite=False):
+                             overwrite=False, feature_store='cpickle'):
     """Feature normalization
 
     Calculated normalization factors for each evaluation fold based on the training material available.
@@ -547,6 +917,10 @@ def do_feature_normalization(dataset, feature_normalizer_path, feature_path, dat
     feature_path : str
         path where the features are saved.
 
+    feature_store : str {'cpickle', 'npy'}
+        feature file format, see save_feature_data
+        (Default value='cpickle')
+
     dataset_evaluation_mode : str ['folds', 'full']
         evaluation mode, 'full' all material available is considered to belong to one fold.
         (Default value='folds')
@@ -573,23 +947,11 @@ def do_feature_normalization(dataset, feature_normalizer_path, feature_path, dat
         current_normalizer_file = get_feature_normalizer_filename(fold=fold, path=feature_normalizer_path)
 
         if not os.path.isfile(current_normalizer_file) or overwrite:
-            # Initialize statistics
-            file_count = len(dataset.train(fold))
+            # Statistics of the training files, taken from the statistics index of the feature path
+            feature_files = [get_feature_filename(audio_file=item['file'], path=feature_path, extension=feature_store)
+                             for item in dataset.train(fold)]
             normalizer = FeatureNormalizer()
-
-            for item_id, item in enumerate(dataset.train(fold)):
-                progress(title_text='Collecting data',
-                         fold=fold,
-                         percentage=(float(item_id) / file_count),
-                         note=os.path.split(item['file'])[1])
-                # Load features
-                if os.path.isfile(get_feature_filename(audio_file=item['file'], path=feature_path)):
-                    feature_data = load_data(get_feature_filename(audio_file=item['file'], path=feature_path))['stat']
-                else:
-                    raise IOError("Feature file not found [%s]" % (item['file']))
-
-                # Accumulate statistics
-                normalizer.accumulate(feature_data)
+            normalizer.accumulate(load_feature_stats(feature_files))
 
             # Calculate normalization factors
             normalizer.finalize()
@@ -599,7 +961,8 @@ def do_feature_normalization(dataset, feature_normalizer_path, feature_path, dat
 
 
 def do_system_training(dataset, model_path, feature_normalizer_path, feature_path, classifier_params,
-                       dataset_evaluation_mode='folds', classifier_method='gmm', overwrite=False):
+                       dataset_evaluation_mode='folds', classifier_method='gmm', overwrite=False,
+                       feature_store='cpickle', n_jobs=1, folds=None):
     """System training
 
     model container format:
@@ -628,6 +991,10 @@ def do_system_training(dataset, model_path, feature_normalizer_path, feature_pat
     feature_path : str
         path where the features are saved.
 
+    feature_store : str {'cpickle', 'npy'}
+        feature file format, see save_feature_data
+        (Default value='cpickle')
+
     classifier_params : dict
         parameter dict
 
@@ -643,6 +1010,14 @@ def do_system_training(dataset, model_path, feature_normalizer_path, feature_pat
         overwrite existing models
         (Default value=False)
 
+    n_jobs : int
+        number of worker processes for training the class models, -1 uses all CPU cores
+        (Default value=1)
+
+    folds : list of int or None
+        folds to process, None processes all folds of the evaluation mode
+        (Default value=None)
+
     Returns
     -------
     nothing
@@ -651,6 +1026,7 @@ def do_system_training(dataset, model_path, feature_normalizer_path, feature_pat
     -------
     ValueError
         classifier_method is unknown.
+        stream_buffer_size is set for another classifier than dnn.
 
     IOError
         Feature normalizer not found.
@@ -664,9 +1040,23 @@ def do_system_training(dataset, model_path, feature_normalizer_path, feature_pat
     # Check that target path exists, create if not
     check_path(model_path)
 
-    for fold in dataset.folds(mode=dataset_evaluation_mode):
+    # Streaming loader settings are not estimator parameters
+    classifier_params = dict(classifier_params)
+    stream_buffer_size = classifier_params.pop('stream_buffer_size', 0)
+    if stream_buffer_size and classifier_method != 'dnn':
+        raise ValueError("Streaming training needs the dnn classifier [" + classifier_method + "]")
+
+    # Shards depend on the features and the fold normalizer, keep them next to the normalizers
+    shard_path = feature_normalizer_path
+
+    if folds is None:
+        folds = dataset.folds(mode=dataset_evaluation_mode)
+
+    for fold in folds:
         current_model_file = get_model_filename(fold=fold, path=model_path)
-        if not os.path.isfile(current_model_file) or overwrite:
+        if not os.path.isfile(current_model_file) or overwrite or \
+                (classifier_method == 'dnn' and
+                 not os.path.isdir(get_dnn_model_path(fold=fold, path=model_path))):
             # Load normalizer
             feature_normalizer_filename = get_feature_normalizer_filename(fold=fold, path=feature_normalizer_path)
             if os.path.isfile(feature_normalizer_filename):
@@ -677,63 +1067,78 @@ def do_system_training(dataset, model_path, feature_normalizer_path, feature_pat
             # Initialize model container
             model_container = {'normalizer': normalizer, 'models': {}}
 
-            # Collect training examples
-            file_count = len(dataset.train(fold))
+            # Collect training examples, packed into one shard per fold and feature parameter hash
+            # The streaming loader reads the feature files itself
             data = {}
-            for item_id, item in enumerate(dataset.train(fold)):
-                progress(title_text='Collecting data',
-                         fold=fold,
-                         percentage=(float(item_id) / file_count),
-                         note=os.path.split(item['file'])[1])
-
-                # Load features
-                feature_filename = get_feature_filename(audio_file=item['file'], path=feature_path)
-                if os.path.isfile(feature_filename):
-                    feature_data = load_data(feature_filename)['feat']
-                else:
-                    raise IOError("Features not found [%s]" % (item['file']))
-
-                # Scale features
-                feature_data = model_container['normalizer'].normalize(feature_data)
-
-                # Store features per class label
-                if item['scene_label'] not in data:
-                    data[item['scene_label']] = feature_data
-                else:
-                    data[item['scene_label']] = numpy.vstack((data[item['scene_label']], feature_data))
+            if not stream_buffer_size:
+                if not os.path.isfile(get_shard_filename(fold=fold, path=shard_path)) or \
+                        os.path.getmtime(get_shard_filename(fold=fold, path=shard_path)) < \
+                        os.path.getmtime(feature_normalizer_filename):
+                    do_training_shard(dataset=dataset,
+                                      fold=fold,
+                                      shard_path=shard_path,
+                                      feature_path=feature_path,
+                                      normalizer=model_container['normalizer'],
+                                      feature_store=feature_store)
+                shard = load_training_shard(fold=fold, path=shard_path)
+
+                # Features per class label, views into the shard
+                for label in shard['labels']:
+                    data[label] = shard['feat'][shard['label_offsets'][label][0]:shard['label_offsets'][label][1]]
 
             le = pp.LabelEncoder()
             tot_data = {}
 
             # Train models for each class
-            for label in data:
+            if classifier_method == 'gmm':
                 progress(title_text='Train models',
                          fold=fold,
-                         note=label)
-                if classifier_method == 'gmm':
-                    model_container['models'][label] = mixture.GMM(**classifier_params).fit(data[label])
-                elif classifier_method == 'dnn':
-                    if 'x' not in tot_data:
-                        tot_data['x'] = data[label]
-                        tot_data['y'] = numpy.repeat(label, len(data[label]), axis=0)
-                    else:
-                        tot_data['x'] = numpy.vstack((tot_data['x'], data[label]))
-                        tot_data['y'] = numpy.hstack((tot_data['y'], numpy.repeat(label, len(data[label]), axis=0)))
-                else:
-                    raise ValueError("Unknown classifier method [" + classifier_method + "]")
+                         note=str(len(data)) + ' classes')
+                model_container['models'] = fit_gmm_models(training_data=data,
+                                                           classifier_params=classifier_params,
+                                                           n_jobs=n_jobs)
+
+            # Collect the DNN training data, frames and their labels straight from the shard
+            if classifier_method == 'dnn':
+                if not stream_buffer_size:
+                    progress(title_text='Train models',
+                             fold=fold,
+                             note=str(len(shard['labels'])) + ' classes')
+                    tot_data['x'] = shard['feat']
+                    tot_data['y'] = numpy.array(shard['labels'])[shard['label_ids']]
+            elif classifier_method != 'gmm':
+                raise ValueError("Unknown classifier method [" + classifier_method + "]")
 
 	    if classifier_method == 'dnn':
                 clf = skflow.TensorFlowDNNClassifier(**classifier_params)
-                tot_data['y'] = le.fit_transform(tot_data['y'])
-                clf.fit(tot_data['x'], tot_data['y'])
-                clf.save('dnn/dnnmodel1')
+                if stream_buffer_size:
+                    # Stream normalized frames from the feature files, memory is bounded by the shuffle buffer
+                    train_items = dataset.train(fold)
+                    train_labels = [item['scene_label'] for item in train_items]
+                    feature_files = [get_feature_filename(audio_file=item['file'], path=feature_path,
+                                                          extension=feature_store) for item in train_items]
+                    le.fit(train_labels)
+                    batches = feature_minibatch_generator(feature_files=feature_files,
+                                                          labels=le.transform(train_labels),
+                                                          normalizer=model_container['normalizer'],
+                                                          batch_size=classifier_params.get('batch_size', 32),
+                                                          buffer_size=stream_buffer_size,
+                                                          random_state=fold,
+                                                          loop=True)
+                    x_stream, y_stream = split_frame_stream(batches)
+                    clf.fit(x_stream, y_stream)
+                else:
+                    tot_data['y'] = le.fit_transform(tot_data['y'])
+                    clf.fit(tot_data['x'], tot_data['y'])
+                clf.save(get_dnn_model_path(fold=fold, path=model_path))
 
             # Save models
             save_data(current_model_file, model_container)
 
 
 def do_system_testing(dataset, result_path, feature_path, model_path, feature_params,
-                      dataset_evaluation_mode='folds', classifier_method='gmm', overwrite=False):
+                      dataset_evaluation_mode='folds', classifier_method='gmm', overwrite=False,
+                      test_batch_size=0, streaming=None, feature_store='cpickle', folds=None):
     """System testing.
 
     If extracted features are not found from disk, they are extracted but not saved.
@@ -749,6 +1154,10 @@ def do_system_testing(dataset, result_path, feature_path, model_path, feature_pa
     feature_path : str
         path where the features are saved.
 
+    feature_store : str {'cpickle', 'npy'}
+        feature file format, see save_feature_data
+        (Default value='cpickle')
+
     model_path : str
         path where the models are saved.
 
@@ -767,6 +1176,21 @@ def do_system_testing(dataset, result_path, feature_path, model_path, feature_pa
         overwrite existing models
         (Default value=False)
 
+    test_batch_size : int
+        minimum number of frames classified with one forward pass, frames of consecutive
+        files are stacked until reached, 0 classifies files one by one
+        (Default value=0)
+
+    streaming : dict or None
+        streaming classification, files are scored in blocks of block_frames frames with
+        StreamingSceneClassifier, which stops early once the best class leads by decision_margin
+        after minimum_frames, None or block_frames 0 classifies whole files
+        (Default value=None)
+
+    folds : list of int or None
+        folds to process, None processes all folds of the evaluation mode
+        (Default value=None)
+
     Returns
     -------
     nothing
@@ -788,7 +1212,10 @@ def do_system_testing(dataset, result_path, feature_path, model_path, feature_pa
     # Check that target path exists, create if not
     check_path(result_path)
 
-    for fold in dataset.folds(mode=dataset_evaluation_mode):
+    if folds is None:
+        folds = dataset.folds(mode=dataset_evaluation_mode)
+
+    for fold in folds:
         current_result_file = get_result_filename(fold=fold, path=result_path)
         if not os.path.isfile(current_result_file) or overwrite:
             results = []
@@ -800,6 +1227,34 @@ def do_system_testing(dataset, result_path, feature_path, model_path, feature_pa
             else:
                 raise IOError("Model file not found [%s]" % model_filename)
 
+            # Restore DNN model once for the fold, the model of the previous fold is released first
+            model_clf = None
+            streaming_classifier = None
+            restore_time = 0.0
+            predict_time = 0.0
+            if classifier_method == 'dnn':
+                restore_start = timeit.default_timer()
+                model_clf = load_dnn_model(fold=fold, path=model_path)
+                restore_time = timeit.default_timer() - restore_start
+
+            # Streaming classifier for the fold, files are classified block by block
+            streaming_classifier = None
+            if streaming and streaming.get('block_frames'):
+                block_frames = streaming['block_frames']
+                if classifier_method == 'gmm':
+                    frame_scorer = get_gmm_frame_scorer(model_container['models'])
+                    labels = list(model_container['models'])
+                else:
+                    frame_scorer = get_probability_frame_scorer(model_clf)
+                    labels = dataset.scene_labels
+                streaming_classifier = StreamingSceneClassifier(frame_scorer=frame_scorer,
+                                                                labels=labels,
+                                                                decision_margin=streaming.get('decision_margin'),
+                                                                minimum_frames=streaming.get('minimum_frames', 0))
+
+            batch_items = []
+            batch_features = []
+            batch_frames = 0
             file_count = len(dataset.test(fold))
             for file_id, item in enumerate(dataset.test(fold)):
                 progress(title_text='Testing',
@@ -808,10 +1263,11 @@ def do_system_testing(dataset, result_path, feature_path, model_path, feature_pa
                          note=os.path.split(item['file'])[1])
 
                 # Load features
-                feature_filename = get_feature_filename(audio_file=item['file'], path=feature_path)
+                feature_filename = get_feature_filename(audio_file=item['file'], path=feature_path,
+                                                        extension=feature_store)
 
                 if os.path.isfile(feature_filename):
-                    feature_data = load_data(feature_filename)['feat']
+                    feature_data = load_feature_data(feature_filename, part='feat')
                 else:
                     # Load audio
                     if os.path.isfile(dataset.relative_to_absolute_path(item['file'])):
@@ -836,52 +1292,109 @@ def do_system_testing(dataset, result_path, feature_path, model_path, feature_pa
                                                           acceleration_params=feature_params['mfcc_acceleration'],
                                                           statistics=False)['feat']
 
+                # Classify the file block by block, normalizing only the blocks scored before a decision
+                if streaming_classifier is not None:
+                    predict_start = timeit.default_timer()
+                    streaming_classifier.reset()
+                    for start in range(0, feature_data.shape[0], block_frames):
+                        block_data = model_container['normalizer'].normalize(feature_data[start:start + block_frames])
+                        if streaming_classifier.process(block_data)['stopped']:
+                            break
+                    predict_time += timeit.default_timer() - predict_start
+
+                    decision = streaming_classifier.decision()
+                    if classifier_method == 'dnn':
+                        results.append((dataset.absolute_to_relative(item['file']),
+                                        decision['label']) + tuple(decision['logls']))
+                    else:
+                        results.append((dataset.absolute_to_relative(item['file']), decision['label']))
+                    continue
+
                 # Normalize features
-                feature_data = model_container['normalizer'].normalize(feature_data)
+                feature_data = model_container['normalizer'].normalize(feature_data, in_place=True)
+
+                # Collect files into the batch, classify once it holds test_batch_size frames
+                batch_items.append(item)
+                batch_features.append(feature_data)
+                batch_frames += feature_data.shape[0]
+                if batch_frames < test_batch_size and file_id < file_count - 1:
+                    continue
 
-                # Do classification for the block
+                # Do classification for the batch
                 if classifier_method == 'gmm':
-                    current_result = do_classification_gmm(feature_data, model_container)
-                    current_class = current_result['class']
-		elif classifier_method == 'dnn':
-                    current_result = do_classification_dnn(feature_data, model_container)
-		    current_class = dataset.scene_labels[current_result['class_id']]
+                    batch_results = do_classification_gmm(batch_features, model_container)
+                elif classifier_method == 'dnn':
+                    predict_start = timeit.default_timer()
+                    batch_results = do_classification_dnn(batch_features, model_clf)
+                    predict_time += timeit.default_timer() - predict_start
                 else:
                     raise ValueError("Unknown classifier method [" + classifier_method + "]")
 
-                # Store the result
-		if classifier_method == 'gmm':
-               	    results.append((dataset.absolute_to_relative(item['file']),
-                                current_class))
-		elif classifier_method == 'dnn':
-		    logs_in_tuple = tuple(lo for lo in current_result['logls'])
-		    results.append((dataset.absolute_to_relative(item['file']),
-				current_class) + logs_in_tuple)
-		else:
-		    raise ValueError("Unknown classifier method [" + classifier_method + "]")	
+                # Store the results
+                for batch_item, current_result in zip(batch_items, batch_results):
+                    if classifier_method == 'gmm':
+                        results.append((dataset.absolute_to_relative(batch_item['file']),
+                                        current_result['class']))
+                    elif classifier_method == 'dnn':
+                        logs_in_tuple = tuple(lo for lo in current_result['logls'])
+                        results.append((dataset.absolute_to_relative(batch_item['file']),
+                                        dataset.scene_labels[current_result['class_id']]) + logs_in_tuple)
+
+                batch_items = []
+                batch_features = []
+                batch_frames = 0
+
             # Save testing results
             with open(current_result_file, 'wt') as f:
                 writer = csv.writer(f, delimiter='\t')
                 for result_item in results:
                     writer.writerow(result_item)
 
+            if classifier_method == 'dnn':
+                final_result.setdefault('test_time_per_fold', {})[fold] = {'restore': restore_time,
+                                                                           'predict': predict_time}
+                print "  Fold[{:d}] model restore {:.2f} s, predict {:.2f} s                    ".format(fold,
+                                                                                                         restore_time,
+                                                                                                         predict_time)
 
-def do_classification_dnn(feature_data, model_container):
-    # Initialize log-likelihood matrix to -inf
-    logls = numpy.empty(15)
-    logls.fill(-numpy.inf)
 
-    model_clf = skflow.TensorFlowEstimator.restore('dnn/dnnmodel1')
+def do_classification_dnn(feature_batch, model_clf):
+    """DNN classification for a batch of feature matrices
 
-    logls = numpy.sum(numpy.log(model_clf.predict_proba(feature_data)), 0)
+    Frames of all matrices are stacked and passed through the network at once, frame probabilities
+    are split back per matrix with the frame offsets before summing the log-likelihoods. Probabilities
+    have the floor of get_log_probabilities, as in streaming classification.
 
-    classification_result_id = numpy.argmax(logls)
-    return {'class_id': classification_result_id,
-            'logls': logls}
+    Parameters
+    ----------
+    feature_batch : list of numpy.ndarray [shape=(t, feature vector length)]
+        feature matrices, one per file
 
+    model_clf : skflow.TensorFlowEstimator
+        restored DNN model, see load_dnn_model
+
+    Returns
+    -------
+    results : list of dict
+        classification result id and log-likelihoods for each feature matrix
+
+    """
 
-def do_classification_gmm(feature_data, model_container):
-    """GMM classification for give feature matrix
+    offsets = numpy.cumsum([0] + [feature_data.shape[0] for feature_data in feature_batch])
+    frame_probabilities = model_clf.predict_proba(numpy.vstack(feature_batch))
+
+    results = []
+    for start, stop in zip(offsets[:-1], offsets[1:]):
+        logls = numpy.sum(get_log_probabilities(frame_probabilities[start:stop]), 0)
+
+        classification_result_id = numpy.argmax(logls)
+        results.append({'class_id': classification_result_id,
+                        'logls': logls})
+    return results
+
+
+def do_classification_gmm(feature_batch, model_container):
+    """GMM classification for a batch of feature matrices
 
     model container format:
 
@@ -895,31 +1408,39 @@ def do_classification_gmm(feature_data, model_container):
             }
     }
 
+    Frames of all matrices are stacked and scored once per class model, frame log-likelihoods
+    are split back per matrix with the frame offsets before summing.
+
     Parameters
     ----------
-    feature_data : numpy.ndarray [shape=(t, feature vector length)]
-        feature matrix
+    feature_batch : list of numpy.ndarray [shape=(t, feature vector length)]
+        feature matrices, one per file
 
     model_container : dict
         model container
 
     Returns
     -------
-    result : str
-        classification result as scene label
+    results : list of dict
+        classification result as scene label and log-likelihoods for each feature matrix
 
     """
 
-    # Initialize log-likelihood matrix to -inf
-    logls = numpy.empty(len(model_container['models']))
-    logls.fill(-numpy.inf)
+    offsets = numpy.cumsum([0] + [feature_data.shape[0] for feature_data in feature_batch])
+    feature_data = numpy.vstack(feature_batch)
 
+    frame_logls = numpy.empty((feature_data.shape[0], len(model_container['models'])))
     for label_id, label in enumerate(model_container['models']):
-        logls[label_id] = numpy.sum(model_container['models'][label].score(feature_data))
+        frame_logls[:, label_id] = model_container['models'][label].score(feature_data)
+
+    results = []
+    for start, stop in zip(offsets[:-1], offsets[1:]):
+        logls = numpy.sum(frame_logls[start:stop], 0)
 
-    classification_result_id = numpy.argmax(logls)
-    return {'class': model_container['models'].keys()[classification_result_id],
-            'logls': logls}
+        classification_result_id = numpy.argmax(logls)
+        results.append({'class': model_container['models'].keys()[classification_result_id],
+                        'logls': logls})
+    return results
 
 
 def do_system_evaluation(dataset, result_path, dataset_evaluation_mode='folds'):
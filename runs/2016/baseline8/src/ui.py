@@ -115,3 +115,33 @@ def progress(title_text=None, fold=None, percentage=None, note=None, label=None)
         print "  {:2s} {:20s} fold[{:1d}] [{:10s}]                                               \r".format(spinner.next(), title_text, fold, label),
 
     sys.stdout.flush()
+
+
+def fold_timing_summary(timings):
+    """Prints wall clock time of each fold
+
+    Parameters
+    ----------
+    timings : dict
+        seconds for each fold (dict), keyed by system step name ('train', 'test')
+
+    Returns
+    -------
+    Nothing
+
+    """
+
+    steps = [step for step in ['train', 'test'] if step in timings]
+    steps += sorted([step for step in timings if step not in steps])
+
+    folds = sorted(set(fold for step in steps for fold in timings[step]))
+
+    print "  {:10s} | ".format('Fold') + " | ".join(["{:>10s}".format(step + ' (s)') for step in steps])
+    print "  {:10s} + ".format('-' * 10) + " + ".join(['-' * 10 for step in steps])
+    for fold in folds:
+        print "  {:10s} | ".format(str(fold)) + " | ".join(
+            ["{:10.1f}".format(timings[step][fold]) if fold in timings[step] else "{:>10s}".format('-')
+             for step in steps])
+    print "  {:10s} + ".format('-' * 10) + " + ".join(['-' * 10 for step in steps])
+    print "  {:10s} | ".format('Sum') + " | ".join(["{:10.1f}".format(sum(timings[step].values()))
+                                                   for step in steps])
@@ -6,6 +6,7 @@
 import argparse
 import csv
 import math
+import multiprocessing
 import numpy
 import textwrap
 import warnings
@@ -20,6 +21,8 @@ from src.sound_event_detection import *
 __version_info__ = ('1', '0', '1')
 __version__ = '.'.join(__version_info__)
 
+final_result = {}
+
 
 def main(argv):
     numpy.random.seed(123456)  # let's make randomization predictable
@@ -87,20 +90,18 @@ def main(argv):
         section_header('Feature extraction [Development data]')
 
         # Collect files from evaluation sets
-        files = []
-        for fold in dataset.folds(mode=dataset_evaluation_mode):
-            for item_id, item in enumerate(dataset.train(fold)):
-                if item['file'] not in files:
-                    files.append(item['file'])
-            for item_id, item in enumerate(dataset.test(fold)):
-                if item['file'] not in files:
-                    files.append(item['file'])
+        files = dataset.fold_files(folds=dataset.folds(mode=dataset_evaluation_mode))
 
         # Go through files and make sure all features are extracted
         do_feature_extraction(files=files,
                               dataset=dataset,
                               feature_path=params['path']['features'],
+                              feature_store=params['extraction']['store'],
                               params=params['features'],
+                              n_jobs=params['extraction']['n_jobs'],
+                              audio_cache_path=params['path']['audio_cache'],
+                              audio_cache_size=params['extraction']['audio_cache_size'],
+                              block_frames=params['extraction']['block_frames'],
                               overwrite=params['general']['overwrite'])
 
         foot()
@@ -113,26 +114,36 @@ def main(argv):
         do_feature_normalization(dataset=dataset,
                                  feature_normalizer_path=params['path']['feature_normalizers'],
                                  feature_path=params['path']['features'],
+                                 feature_store=params['extraction']['store'],
                                  dataset_evaluation_mode=dataset_evaluation_mode,
                                  overwrite=params['general']['overwrite'])
 
         foot()
 
+    fold_timings = {}
+
     # System training
     # ==================================================
     if params['flow']['train_system']:
         section_header('System training    [Development data]')
 
-        do_system_training(dataset=dataset,
-                           model_path=params['path']['models'],
-                           feature_normalizer_path=params['path']['feature_normalizers'],
-                           feature_path=params['path']['features'],
-                           hop_length_seconds=params['features']['hop_length_seconds'],
-                           classifier_params=params['classifier']['parameters'],
-                           dataset_evaluation_mode=dataset_evaluation_mode,
-                           classifier_method=params['classifier']['method'],
-                           overwrite=params['general']['overwrite']
-                           )
+        fold_timings['train'] = run_folds(do_system_training,
+                                          folds=dataset.folds(mode=dataset_evaluation_mode),
+                                          fold_jobs=params['folds']['n_jobs'],
+                                          fold_threads=params['folds']['threads'],
+                                          result_container=final_result,
+                                          dataset=dataset,
+                                          model_path=params['path']['models'],
+                                          feature_normalizer_path=params['path']['feature_normalizers'],
+                                          feature_path=params['path']['features'],
+                                          feature_store=params['extraction']['store'],
+                                          n_jobs=params['training']['n_jobs'],
+                                          hop_length_seconds=params['features']['hop_length_seconds'],
+                                          classifier_params=params['classifier']['parameters'],
+                                          dataset_evaluation_mode=dataset_evaluation_mode,
+                                          classifier_method=params['classifier']['method'],
+                                          overwrite=params['general']['overwrite']
+                                          )
 
         foot()
 
@@ -144,16 +155,22 @@ def main(argv):
         if params['flow']['test_system']:
             section_header('System testing     [Development data]')
 
-            do_system_testing(dataset=dataset,
-                              result_path=params['path']['results'],
-                              feature_path=params['path']['features'],
-                              model_path=params['path']['models'],
-                              feature_params=params['features'],
-                              detector_params=params['detector'],
-                              dataset_evaluation_mode=dataset_evaluation_mode,
-                              classifier_method=params['classifier']['method'],
-                              overwrite=params['general']['overwrite']
-                              )
+            fold_timings['test'] = run_folds(do_system_testing,
+                                             folds=dataset.folds(mode=dataset_evaluation_mode),
+                                             fold_jobs=params['folds']['n_jobs'],
+                                             fold_threads=params['folds']['threads'],
+                                             result_container=final_result,
+                                             dataset=dataset,
+                                             result_path=params['path']['results'],
+                                             feature_path=params['path']['features'],
+                                             feature_store=params['extraction']['store'],
+                                             model_path=params['path']['models'],
+                                             feature_params=params['features'],
+                                             detector_params=params['detector'],
+                                             dataset_evaluation_mode=dataset_evaluation_mode,
+                                             classifier_method=params['classifier']['method'],
+                                             overwrite=params['general']['overwrite']
+                                             )
             foot()
 
         # System evaluation
@@ -182,6 +199,7 @@ def main(argv):
             do_system_testing(dataset=challenge_dataset,
                               result_path=params['path']['challenge_results'],
                               feature_path=params['path']['features'],
+                              feature_store=params['extraction']['store'],
                               model_path=params['path']['models'],
                               feature_params=params['features'],
                               detector_params=params['detector'],
@@ -195,6 +213,13 @@ def main(argv):
             print "Your results for the challenge data are stored at [" + params['path']['challenge_results'] + "]"
             print " "
 
+    if fold_timings:
+        section_header('Fold timings')
+        fold_timing_summary(fold_timings)
+        foot()
+        final_result['fold_time'] = fold_timings
+        save_data(os.path.join(params['path']['results'], 'final_result.cpickle'), final_result)
+
 
 def process_parameters(params):
     """Parameter post-processing.
@@ -217,6 +242,20 @@ def process_parameters(params):
     # Copy parameters for current classifier method
     params['classifier']['parameters'] = params['classifier_parameters'][params['classifier']['method']]
 
+    # Training worker count does not change the models, keep it out of the classifier hash
+    params['training'] = {'n_jobs': params['classifier']['parameters'].pop('n_jobs', 1)}
+
+    # Fold scheduling does not change the models or results, keep it out of the hashes
+    params['folds'] = {'n_jobs': params['general'].pop('fold_jobs', 1),
+                       'threads': params['general'].pop('fold_threads', 0)}
+
+    # Worker count, feature file format, audio cache and extraction blocks do not change the features, keep them
+    # out of the feature hash
+    params['extraction'] = {'n_jobs': params['features'].pop('n_jobs', 1),
+                            'store': params['features'].pop('store', 'cpickle'),
+                            'audio_cache_size': params['features'].pop('audio_cache_size', 0),
+                            'block_frames': params['features'].pop('block_frames', 0)}
+
     # Hash
     params['features']['hash'] = get_parameter_hash(params['features'])
     params['classifier']['hash'] = get_parameter_hash(params['classifier'])
@@ -253,6 +292,9 @@ def process_parameters(params):
                                              params['features']['hash'],
                                              params['classifier']['hash'],
                                              params['detector']['hash'])
+    # Resampled audio cache
+    params['path']['audio_cache'] = os.path.join(params['path']['base'], params['path']['audio_cache'])
+
     return params
 
 
@@ -446,9 +488,15 @@ def get_result_filename(fold, scene_label, path, extension='txt'):
         return os.path.join(path, 'results_fold' + str(fold) + '_' + str(scene_label) + '.' + extension)
 
 
-def do_feature_extraction(files, dataset, feature_path, params, overwrite=False):
+def do_feature_extraction(files, dataset, feature_path, params, overwrite=False, n_jobs=1, feature_store='cpickle',
+                          audio_cache_path=None, audio_cache_size=0, block_frames=0):
     """Feature extraction
 
+    Files are independent, so they are processed by a pool of worker processes. Files with
+    existing feature files are skipped before any work is dispatched, and progress is reported
+    from the main process as workers finish. Statistics of the extracted files are added to the
+    statistics index of the feature path, see load_feature_stats.
+
     Parameters
     ----------
     files : list
@@ -460,6 +508,10 @@ def do_feature_extraction(files, dataset, feature_path, params, overwrite=False)
     feature_path : str
         path where the features are saved
 
+    feature_store : str {'cpickle', 'npy'}
+        feature file format, see save_feature_data
+        (Default value='cpickle')
+
     params : dict
         parameter dict
 
@@ -467,6 +519,23 @@ def do_feature_extraction(files, dataset, feature_path, params, overwrite=False)
         overwrite existing feature files
         (Default value=False)
 
+    n_jobs : int
+        number of worker processes, -1 uses all CPU cores, 1 extracts in the main process
+        (Default value=1)
+
+    audio_cache_path : str
+        path of the resampled audio cache shared by all runs, see load_audio
+        (Default value=None)
+
+    audio_cache_size : float
+        size limit of the resampled audio cache in GB, 0 disables the cache
+        (Default value=0)
+
+    block_frames : int
+        frames per extraction block, longer recordings are extracted and saved block by block,
+        0 extracts whole files at once
+        (Default value=0)
+
     Returns
     -------
     nothing
@@ -478,37 +547,103 @@ def do_feature_extraction(files, dataset, feature_path, params, overwrite=False)
 
     """
 
-    for file_id, audio_filename in enumerate(files):
-        # Get feature filename
-        current_feature_file = get_feature_filename(audio_file=os.path.split(audio_filename)[1], path=feature_path)
+    # Check that target path exists, create if not
+    check_path(feature_path)
 
-        progress(title_text='Extracting [sequences]',
-                 percentage=(float(file_id) / len(files)),
-                 note=os.path.split(audio_filename)[1])
+    # Resampled audio cache, shared by the workers
+    if audio_cache_path and audio_cache_size > 0:
+        check_path(audio_cache_path)
+        audio_cache_size = int(audio_cache_size * 1024 ** 3)
+    else:
+        audio_cache_path = None
+
+    # Collect files without features, make sure audio is there before starting the workers
+    jobs = []
+    for audio_filename in files:
+        # Get feature filename
+        current_feature_file = get_feature_filename(audio_file=os.path.split(audio_filename)[1], path=feature_path,
+                                                    extension=feature_store)
 
         if not os.path.isfile(current_feature_file) or overwrite:
-            # Load audio
-            if os.path.isfile(dataset.relative_to_absolute_path(audio_filename)):
-                y, fs = load_audio(filename=dataset.relative_to_absolute_path(audio_filename), mono=True,
-                                   fs=params['fs'])
-            else:
+            if not os.path.isfile(dataset.relative_to_absolute_path(audio_filename)):
                 raise IOError("Audio file not found [%s]" % audio_filename)
 
-            # Extract features
-            feature_data = feature_extraction(y=y,
-                                              fs=fs,
-                                              include_mfcc0=params['include_mfcc0'],
-                                              include_delta=params['include_delta'],
-                                              include_acceleration=params['include_acceleration'],
-                                              mfcc_params=params['mfcc'],
-                                              delta_params=params['mfcc_delta'],
-                                              acceleration_params=params['mfcc_acceleration'])
-            # Save
-            save_data(current_feature_file, feature_data)
+            jobs.append((dataset.relative_to_absolute_path(audio_filename), current_feature_file, feature_path, params,
+                         audio_cache_path, audio_cache_size, block_frames))
+
+    if n_jobs < 0:
+        n_jobs = max(multiprocessing.cpu_count() + 1 + n_jobs, 1)
+
+    pool = None
+    if n_jobs > 1 and len(jobs) > 1:
+        pool = multiprocessing.Pool(processes=min(n_jobs, len(jobs)))
+        extracted = pool.imap_unordered(do_feature_extraction_file, jobs)
+    else:
+        extracted = (do_feature_extraction_file(job) for job in jobs)
+
+    stats = {}
+    try:
+        for job_id, (audio_filename, current_feature_file, stat) in enumerate(extracted):
+            stats[current_feature_file] = stat
+            progress(title_text='Extracting [sequences]',
+                     percentage=(float(job_id + 1) / len(jobs)),
+                     note=os.path.split(audio_filename)[1])
+    finally:
+        if pool is not None:
+            pool.terminate()
+            pool.join()
+
+        # Statistics of the files extracted so far, also when interrupted
+        update_feature_stat_index(stats)
+
+
+def do_feature_extraction_file(job):
+    """Feature extraction for one audio file, run in a worker process
+
+    Parameters
+    ----------
+    job : tuple
+        absolute audio filename, feature filename, feature path, parameter dict, audio cache path,
+        audio cache size in bytes and frames per extraction block
+
+    Returns
+    -------
+    audio_filename : str
+        absolute audio filename
+
+    current_feature_file : str
+        feature filename
+
+    stat : dict or None
+        feature statistics, see save_feature_data
+
+    """
+
+    audio_filename, current_feature_file, feature_path, params, audio_cache_path, audio_cache_size, block_frames = job
+
+    # Load audio data
+    y, fs = load_audio(filename=audio_filename, mono=True, fs=params['fs'],
+                       cache_path=audio_cache_path, cache_size=audio_cache_size)
+
+    # Extract features
+    feature_data = feature_extraction(y=y,
+                                      fs=fs,
+                                      include_mfcc0=params['include_mfcc0'],
+                                      include_delta=params['include_delta'],
+                                      include_acceleration=params['include_acceleration'],
+                                      mfcc_params=params['mfcc'],
+                                      delta_params=params['mfcc_delta'],
+                                      acceleration_params=params['mfcc_acceleration'],
+                                      block_frames=block_frames)
+
+    # Save
+    stat = save_feature_data(current_feature_file, feature_data)
+
+    return audio_filename, current_feature_file, stat
 
 
 def do_feature_normalization(dataset, feature_normalizer_path, feature_path, dataset_evaluation_mode='folds',
-                             overwrite=False):
+                             overwrite=False, feature_store='cpickle'):
     """Feature normalization
 
     Calculated normalization factors for each evaluation fold based on the training material available.
@@ -524,6 +659,10 @@ def do_feature_normalization(dataset, feature_normalizer_path, feature_path, dat
     feature_path : str
         path where the features are saved.
 
+    feature_store : str {'cpickle', 'npy'}
+        feature file format, see save_feature_data
+        (Default value='cpickle')
+
     dataset_evaluation_mode : str ['folds', 'full']
         evaluation mode, 'full' all material available is considered to belong to one fold.
         (Default value='folds')
@@ -550,32 +689,14 @@ def do_feature_normalization(dataset, feature_normalizer_path, feature_path, dat
 
             if not os.path.isfile(current_normalizer_file) or overwrite:
                 # Collect sequence files from scene class
-                files = []
-                for item_id, item in enumerate(dataset.train(fold, scene_label=scene_label)):
-                    if item['file'] not in files:
-                        files.append(item['file'])
+                files = dataset.fold_files(folds=[fold], test=False, scene_label=scene_label)
 
-                file_count = len(files)
-
-                # Initialize statistics
+                # Statistics of the training files, taken from the statistics index of the feature path
+                feature_files = [get_feature_filename(audio_file=os.path.split(audio_filename)[1], path=feature_path,
+                                                      extension=feature_store)
+                                 for audio_filename in files]
                 normalizer = FeatureNormalizer()
-
-                for file_id, audio_filename in enumerate(files):
-                    progress(title_text='Collecting data',
-                             fold=fold,
-                             percentage=(float(file_id) / file_count),
-                             note=os.path.split(audio_filename)[1])
-
-                    # Load features
-                    feature_filename = get_feature_filename(audio_file=os.path.split(audio_filename)[1],
-                                                            path=feature_path)
-                    if os.path.isfile(feature_filename):
-                        feature_data = load_data(feature_filename)['stat']
-                    else:
-                        raise IOError("Feature file not found [%s]" % audio_filename)
-
-                    # Accumulate statistics
-                    normalizer.accumulate(feature_data)
+                normalizer.accumulate(load_feature_stats(feature_files))
 
                 # Calculate normalization factors
                 normalizer.finalize()
@@ -586,7 +707,8 @@ def do_feature_normalization(dataset, feature_normalizer_path, feature_path, dat
 
 def do_system_training(dataset, model_path, feature_normalizer_path, feature_path, hop_length_seconds,
                        classifier_params,
-                       dataset_evaluation_mode='folds', classifier_method='gmm', overwrite=False):
+                       dataset_evaluation_mode='folds', classifier_method='gmm', overwrite=False,
+                       feature_store='cpickle', n_jobs=1, folds=None):
     """System training
 
     Train a model pair for each sound event class, one for activity and one for inactivity.
@@ -625,6 +747,10 @@ def do_system_training(dataset, model_path, feature_normalizer_path, feature_pat
     feature_path : str
         path where the features are saved.
 
+    feature_store : str {'cpickle', 'npy'}
+        feature file format, see save_feature_data
+        (Default value='cpickle')
+
     hop_length_seconds : float > 0
         feature frame hop length in seconds
 
@@ -643,6 +769,14 @@ def do_system_training(dataset, model_path, feature_normalizer_path, feature_pat
         overwrite existing models
         (Default value=False)
 
+    n_jobs : int
+        number of worker processes for training the class models, -1 uses all CPU cores
+        (Default value=1)
+
+    folds : list of int or None
+        folds to process, None processes all folds of the evaluation mode
+        (Default value=None)
+
     Returns
     -------
     nothing
@@ -661,7 +795,10 @@ def do_system_training(dataset, model_path, feature_normalizer_path, feature_pat
     if classifier_method != 'gmm':
         raise ValueError("Unknown classifier method [" + classifier_method + "]")
 
-    for fold in dataset.folds(mode=dataset_evaluation_mode):
+    if folds is None:
+        folds = dataset.folds(mode=dataset_evaluation_mode)
+
+    for fold in folds:
         for scene_id, scene_label in enumerate(dataset.scene_labels):
             current_model_file = get_model_filename(fold=fold, scene_label=scene_label, path=model_path)
             if not os.path.isfile(current_model_file) or overwrite:
@@ -698,14 +835,15 @@ def do_system_training(dataset, model_path, feature_normalizer_path, feature_pat
                              note=scene_label + " / " + os.path.split(audio_filename)[1])
 
                     # Load features
-                    feature_filename = get_feature_filename(audio_file=audio_filename, path=feature_path)
+                    feature_filename = get_feature_filename(audio_file=audio_filename, path=feature_path,
+                                                            extension=feature_store)
                     if os.path.isfile(feature_filename):
-                        feature_data = load_data(feature_filename)['feat']
+                        feature_data = load_feature_data(feature_filename, part='feat')
                     else:
                         raise IOError("Feature file not found [%s]" % feature_filename)
 
                     # Normalize features
-                    feature_data = model_container['normalizer'].normalize(feature_data)
+                    feature_data = model_container['normalizer'].normalize(feature_data, in_place=True)
 
                     for event_label in ann[audio_filename]:
                         positive_mask = numpy.zeros((feature_data.shape[0]), dtype=bool)
@@ -733,26 +871,33 @@ def do_system_training(dataset, model_path, feature_normalizer_path, feature_pat
                             data_negative[event_label] = numpy.vstack(
                                 (data_negative[event_label], feature_data[~positive_mask, :]))
 
-                # Train models for each class
-                for event_label in data_positive:
+                # Train models for each class, a model pair per event
+                if classifier_method == 'gmm':
                     progress(title_text='Train models',
                              fold=fold,
-                             note=scene_label + " / " + event_label)
-                    if classifier_method == 'gmm':
+                             note=scene_label + " / " + str(len(data_positive)) + " events")
+                    training_data = {}
+                    for event_label in data_positive:
+                        training_data[(event_label, 'positive')] = data_positive[event_label]
+                        training_data[(event_label, 'negative')] = data_negative[event_label]
+
+                    models = fit_gmm_models(training_data=training_data,
+                                            classifier_params=classifier_params,
+                                            n_jobs=n_jobs)
+                    for event_label in data_positive:
                         model_container['models'][event_label] = {}
-                        model_container['models'][event_label]['positive'] = mixture.GMM(**classifier_params).fit(
-                            data_positive[event_label])
-                        model_container['models'][event_label]['negative'] = mixture.GMM(**classifier_params).fit(
-                            data_negative[event_label])
-                    else:
-                        raise ValueError("Unknown classifier method [" + classifier_method + "]")
+                        model_container['models'][event_label]['positive'] = models[(event_label, 'positive')]
+                        model_container['models'][event_label]['negative'] = models[(event_label, 'negative')]
+                else:
+                    raise ValueError("Unknown classifier method [" + classifier_method + "]")
 
                 # Save models
                 save_data(current_model_file, model_container)
 
 
 def do_system_testing(dataset, result_path, feature_path, model_path, feature_params, detector_params,
-                      dataset_evaluation_mode='folds', classifier_method='gmm', overwrite=False):
+                      dataset_evaluation_mode='folds', classifier_method='gmm', overwrite=False,
+                      feature_store='cpickle', folds=None):
     """System testing.
 
     If extracted features are not found from disk, they are extracted but not saved.
@@ -768,6 +913,10 @@ def do_system_testing(dataset, result_path, feature_path, model_path, feature_pa
     feature_path : str
         path where the features are saved.
 
+    feature_store : str {'cpickle', 'npy'}
+        feature file format, see save_feature_data
+        (Default value='cpickle')
+
     model_path : str
         path where the models are saved.
 
@@ -786,6 +935,10 @@ def do_system_testing(dataset, result_path, feature_path, model_path, feature_pa
         overwrite existing models
         (Default value=False)
 
+    folds : list of int or None
+        folds to process, None processes all folds of the evaluation mode
+        (Default value=None)
+
     Returns
     -------
     nothing
@@ -804,7 +957,10 @@ def do_system_testing(dataset, result_path, feature_path, model_path, feature_pa
     if classifier_method != 'gmm':
         raise ValueError("Unknown classifier method [" + classifier_method + "]")
 
-    for fold in dataset.folds(mode=dataset_evaluation_mode):
+    if folds is None:
+        folds = dataset.folds(mode=dataset_evaluation_mode)
+
+    for fold in folds:
         for scene_id, scene_label in enumerate(dataset.scene_labels):
             current_result_file = get_result_filename(fold=fold, scene_label=scene_label, path=result_path)
             if not os.path.isfile(current_result_file) or overwrite:
@@ -825,10 +981,11 @@ def do_system_testing(dataset, result_path, feature_path, model_path, feature_pa
                              note=scene_label + " / " + os.path.split(item['file'])[1])
 
                     # Load features
-                    feature_filename = get_feature_filename(audio_file=item['file'], path=feature_path)
+                    feature_filename = get_feature_filename(audio_file=item['file'], path=feature_path,
+                                                            extension=feature_store)
 
                     if os.path.isfile(feature_filename):
-                        feature_data = load_data(feature_filename)['feat']
+                        feature_data = load_feature_data(feature_filename, part='feat')
                     else:
                         # Load audio
                         if os.path.isfile(dataset.relative_to_absolute_path(item['file'])):
@@ -848,13 +1005,14 @@ def do_system_testing(dataset, result_path, feature_path, model_path, feature_pa
                                                           statistics=False)['feat']
 
                     # Normalize features
-                    feature_data = model_container['normalizer'].normalize(feature_data)
+                    feature_data = model_container['normalizer'].normalize(feature_data, in_place=True)
 
                     current_results = event_detection(feature_data=feature_data,
                                                       model_container=model_container,
                                                       hop_length_seconds=feature_params['hop_length_seconds'],
                                                       smoothing_window_length_seconds=detector_params[
                                                           'smoothing_window_length'],
+                                                      smoothing_window_type=detector_params['smoothing_window_type'],
                                                       decision_threshold=detector_params['decision_threshold'],
                                                       minimum_event_length=detector_params['minimum_event_length'],
                                                       minimum_event_gap=detector_params['minimum_event_gap'])
@@ -912,30 +1070,34 @@ def do_system_evaluation(dataset, result_path, dataset_evaluation_mode='folds'):
             class_list=dataset.event_labels(scene_label=scene_label))
 
         for fold in dataset.folds(mode=dataset_evaluation_mode):
-            results = []
+            # Result rows grouped by file, read once per fold
+            results = {}
             result_filename = get_result_filename(fold=fold, scene_label=scene_label, path=result_path)
 
             if os.path.isfile(result_filename):
                 with open(result_filename, 'rt') as f:
                     for row in csv.reader(f, delimiter='\t'):
-                        results.append(row)
+                        if len(row) != 0:
+                            results.setdefault(row[0], []).append(row)
             else:
                 raise IOError("Result file not found [%s]" % result_filename)
 
             for file_id, item in enumerate(dataset.test(fold, scene_label=scene_label)):
+                current_file = dataset.absolute_to_relative(item['file'])
                 current_file_results = []
-                for result_line in results:
-                    if len(result_line) != 0 and result_line[0] == dataset.absolute_to_relative(item['file']):
-                        current_file_results.append(
-                            {'file': result_line[0],
-                             'event_onset': float(result_line[1]),
-                             'event_offset': float(result_line[2]),
-                             'event_label': result_line[3].rstrip()
-                             }
-                        )
-                meta = dataset.file_meta(dataset.absolute_to_relative(item['file']))
-
-                dcase2016_segment_based_metric.evaluate(system_output=current_file_results, annotated_ground_truth=meta)
+                for result_line in results.get(current_file, []):
+                    current_file_results.append(
+                        {'file': result_line[0],
+                         'event_onset': float(result_line[1]),
+                         'event_offset': float(result_line[2]),
+                         'event_label': result_line[3].rstrip()
+                         }
+                    )
+                meta = dataset.file_meta(current_file)
+
+                dcase2016_segment_based_metric.evaluate(system_output=current_file_results,
+                                                        annotated_ground_truth=meta,
+                                                        reference_file=current_file)
                 dcase2016_event_based_metric.evaluate(system_output=current_file_results, annotated_ground_truth=meta)
 
         overall_metrics_per_scene[scene_label]['segment_based_metrics'] = dcase2016_segment_based_metric.results()
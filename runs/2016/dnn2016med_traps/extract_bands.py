@@ -0,0 +1,263 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# DCASE 2016::Acoustic Scene Classification / TRAPS band runs
+#
+# Extracts TRAPS features for all band runs (traps0 ... traps39) with one mel spectrogram per audio file
+# and writes them into the feature path of each run. The runs have flow extract_features off, so they
+# use these features instead of extracting their band again.
+
+import argparse
+import multiprocessing
+import os
+import sys
+import textwrap
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.realpath(__file__)), 'traps0'))
+from task1_scene_classification import *
+
+
+def get_band_parameters(band_count):
+    """Processed parameters of the band runs
+
+    Band runs are sibling copies of traps0 (see run_bands.sh), so paths are resolved the same way as
+    in the runs themselves.
+
+    Parameters
+    ----------
+    band_count : int
+        number of band runs, traps0 ... traps[band_count - 1]
+
+    Returns
+    -------
+    band_params : list of dict
+        processed parameters, indexed by band
+
+    Raises
+    -------
+    IOError
+        Parameter file of a band run not found.
+
+    ValueError
+        Parameter file of a band run is set up for another band.
+
+    """
+
+    band_params = []
+    for band in range(band_count):
+        parameter_file = os.path.join(os.path.dirname(os.path.realpath(__file__)),
+                                      'traps' + str(band),
+                                      'task1_scene_classification.yaml')
+        if not os.path.isfile(parameter_file):
+            raise IOError("Parameter file not found [%s]" % parameter_file)
+
+        params = process_parameters(load_parameters(parameter_file))
+        if params['features']['traps']['band'] != band:
+            raise ValueError("Band mismatch in parameter file [%s]" % parameter_file)
+
+        band_params.append(params)
+    return band_params
+
+
+def do_band_extraction(files, dataset, band_params, overwrite=False, n_jobs=1, audio_cache_path=None,
+                       audio_cache_size=0, block_frames=0):
+    """TRAPS feature extraction for all band runs
+
+    Feature files are written in the feature store of each band run, see save_feature_data.
+
+    Parameters
+    ----------
+    files : list
+        file list
+
+    dataset : class
+        dataset class
+
+    band_params : list of dict
+        processed parameters of the band runs, indexed by band
+
+    overwrite : bool
+        overwrite existing feature files
+        (Default value=False)
+
+    n_jobs : int
+        number of worker processes, -1 uses all CPU cores, 1 extracts in the main process
+        (Default value=1)
+
+    audio_cache_path : str
+        path of the resampled audio cache shared by all runs, see load_audio
+        (Default value=None)
+
+    audio_cache_size : float
+        size limit of the resampled audio cache in GB, 0 disables the cache
+        (Default value=0)
+
+    block_frames : int
+        frames per extraction block, TRAPS features are extracted from whole files only, so it must be 0
+        (Default value=0)
+
+    Returns
+    -------
+    nothing
+
+    Raises
+    -------
+    IOError
+        Audio file not found.
+
+    ValueError
+        block_frames is set.
+
+    """
+
+    if block_frames:
+        raise ValueError("Block extraction is not supported for TRAPS features [" + str(block_frames) + "]")
+
+    for params in band_params:
+        check_path(params['path']['features'])
+
+    # Resampled audio cache, shared by the workers
+    if audio_cache_path and audio_cache_size > 0:
+        check_path(audio_cache_path)
+        audio_cache_size = int(audio_cache_size * 1024 ** 3)
+    else:
+        audio_cache_path = None
+
+    # Collect files without features in some band run
+    jobs = []
+    for audio_filename in files:
+        feature_files = [get_feature_filename(audio_file=os.path.split(audio_filename)[1],
+                                              path=params['path']['features'],
+                                              extension=params['extraction']['store'])
+                         for params in band_params]
+
+        if overwrite or not all(os.path.isfile(feature_file) for feature_file in feature_files):
+            if not os.path.isfile(dataset.relative_to_absolute_path(audio_filename)):
+                raise IOError("Audio file not found [%s]" % audio_filename)
+
+            jobs.append((dataset.relative_to_absolute_path(audio_filename), feature_files,
+                         band_params[0]['features'], audio_cache_path, audio_cache_size))
+
+    if n_jobs < 0:
+        n_jobs = max(multiprocessing.cpu_count() + 1 + n_jobs, 1)
+
+    pool = None
+    if n_jobs > 1 and len(jobs) > 1:
+        pool = multiprocessing.Pool(processes=min(n_jobs, len(jobs)))
+        extracted = pool.imap_unordered(do_band_extraction_file, jobs)
+    else:
+        extracted = (do_band_extraction_file(job) for job in jobs)
+
+    stats = {}
+    try:
+        for job_id, (audio_filename, band_stats) in enumerate(extracted):
+            stats.update(band_stats)
+            progress(title_text='Extracting',
+                     percentage=(float(job_id + 1) / len(jobs)),
+                     note=os.path.split(audio_filename)[1])
+    finally:
+        if pool is not None:
+            pool.terminate()
+            pool.join()
+
+        # Statistics of the files extracted so far go into the statistics index of each band run
+        update_feature_stat_index(stats)
+
+
+def do_band_extraction_file(job):
+    """TRAPS feature extraction for one audio file and all bands, run in a worker process
+
+    Parameters
+    ----------
+    job : tuple
+        absolute audio filename, feature filenames indexed by band, feature parameter dict, audio cache path
+        and audio cache size in bytes
+
+    Returns
+    -------
+    audio_filename : str
+        absolute audio filename
+
+    stats : dict
+        feature statistics, indexed by feature filename
+
+    """
+
+    audio_filename, feature_files, params, audio_cache_path, audio_cache_size = job
+
+    # Load audio data
+    y, fs = load_audio(filename=audio_filename, mono=True, fs=params['fs'],
+                       cache_path=audio_cache_path, cache_size=audio_cache_size)
+
+    # Extract features
+    feature_data = feature_extraction_traps_bands(y=y,
+                                                  fs=fs,
+                                                  traps_params=params['traps'],
+                                                  mfcc_params=params['mfcc'])
+
+    # Save, one feature dict per band run
+    stats = {}
+    for band, feature_file in enumerate(feature_files):
+        stats[feature_file] = save_feature_data(feature_file, {
+            'feat': feature_data['feat'][band],
+            'stat': {
+                'mean': feature_data['stat']['mean'][band],
+                'std': feature_data['stat']['std'][band],
+                'N': feature_data['stat']['N'],
+                'S1': feature_data['stat']['S1'][band],
+                'S2': feature_data['stat']['S2'][band],
+            }
+        })
+
+    return audio_filename, stats
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(
+        prefix_chars='-+',
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        description=textwrap.dedent('''\
+            DCASE 2016
+            Task 1: Acoustic Scene Classification
+            TRAPS feature extraction for all band runs
+        '''))
+
+    parser.add_argument("-bands", help="Number of band runs", type=int, default=40, dest='bands')
+    parser.add_argument("-n_jobs", help="Worker processes, -1 uses all CPU cores", type=int, default=-1,
+                        dest='n_jobs')
+    parser.add_argument("-overwrite", help="Overwrite existing feature files", action='store_true',
+                        default=False, dest='overwrite')
+    args = parser.parse_args()
+
+    band_params = get_band_parameters(args.bands)
+    params = band_params[0]
+
+    title("DCASE 2016::Acoustic Scene Classification / TRAPS band extraction")
+
+    dataset = eval(params['general']['development_dataset'])(data_path=params['path']['data'])
+
+    section_header('Feature extraction')
+
+    # Collect files in train and test sets
+    files = dataset.fold_files(folds=dataset.folds(mode='folds'))
+    files = sorted(files)
+
+    do_band_extraction(files=files,
+                       dataset=dataset,
+                       band_params=band_params,
+                       overwrite=args.overwrite,
+                       n_jobs=args.n_jobs,
+                       audio_cache_path=params['path']['audio_cache'],
+                       audio_cache_size=params['extraction']['audio_cache_size'],
+                       block_frames=params['extraction']['block_frames'])
+
+    foot()
+
+    return 0
+
+
+if __name__ == "__main__":
+    try:
+        sys.exit(main(sys.argv))
+    except (ValueError, IOError) as e:
+        sys.exit(e)
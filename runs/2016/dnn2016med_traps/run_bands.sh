@@ -7,6 +7,9 @@ do
   p=$i  
 done
 
+# Extract the features of all bands at once, the runs have extract_features off and use them in place
+python extract_bands.py
+
 for (( i=0 ; i<=39 ; i=i+1))
 do
   nohup python traps$i/task1_scene_classification.py > traps$i/out.txt &
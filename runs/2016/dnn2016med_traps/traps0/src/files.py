@@ -3,18 +3,24 @@
 
 import cPickle as pickle
 import csv
+import hashlib
+import itertools
 import numpy
 import os
-import wave
+import struct
 
 import librosa
 import yaml
 
 
-def load_audio(filename, mono=True, fs=44100):
+def load_audio(filename, mono=True, fs=44100, start=None, stop=None, cache_path=None, cache_size=None):
     """Load audio file into numpy array
 
-    Supports 24-bit wav-format, and flac audio through librosa.
+    Supports 24-bit wav-format, and flac audio through librosa. Wav files are decoded with load_wav.
+
+    With cache_path set, audio that has to be resampled or decoded through librosa is stored in an
+    on-disk cache after the first load, see get_audio_cache_filename. Wav files already at the target
+    sample rate are read from the memory-mapped file directly, caching them would only copy the data.
 
     Parameters
     ----------
@@ -29,6 +35,24 @@ def load_audio(filename, mono=True, fs=44100):
         Target sample rate, if input audio does not fulfil this, audio is resampled.
         (Default value=44100)
 
+    start : float >= 0 [scalar]
+        Start of the returned time range in seconds, beginning of the file if None. The range is cut
+        before resampling.
+        (Default value=None)
+
+    stop : float > 0 [scalar]
+        End of the returned time range in seconds, end of the file if None.
+        (Default value=None)
+
+    cache_path : str
+        Path of the audio cache, None disables the cache
+        (Default value=None)
+
+    cache_size : int > 0 [scalar]
+        Size limit of the audio cache in bytes, least recently used files are removed when exceeded.
+        None leaves the cache unbounded.
+        (Default value=None)
+
     Returns
     -------
     audio_data : numpy.ndarray [shape=(signal_length, channel)]
@@ -40,45 +64,26 @@ def load_audio(filename, mono=True, fs=44100):
     """
 
     file_base, file_extension = os.path.splitext(filename)
-    if file_extension == '.wav':
-        audio_file = wave.open(filename)
-
-        # Audio info
-        sample_rate = audio_file.getframerate()
-        sample_width = audio_file.getsampwidth()
-        number_of_channels = audio_file.getnchannels()
-        number_of_frames = audio_file.getnframes()
-
-        # Read raw bytes
-        data = audio_file.readframes(number_of_frames)
-        audio_file.close()
-
-        # Convert bytes based on sample_width
-        num_samples, remainder = divmod(len(data), sample_width * number_of_channels)
-        if remainder > 0:
-            raise ValueError('The length of data is not a multiple of sample size * number of channels.')
-        if sample_width > 4:
-            raise ValueError('Sample size cannot be bigger than 4 bytes.')
-
-        if sample_width == 3:
-            # 24 bit audio
-            a = numpy.empty((num_samples, number_of_channels, 4), dtype=numpy.uint8)
-            raw_bytes = numpy.fromstring(data, dtype=numpy.uint8)
-            a[:, :, :sample_width] = raw_bytes.reshape(-1, number_of_channels, sample_width)
-            a[:, :, sample_width:] = (a[:, :, sample_width - 1:sample_width] >> 7) * 255
-            audio_data = a.view('<i4').reshape(a.shape[:-1]).T
-        else:
-            # 8 bit samples are stored as unsigned ints; others as signed ints.
-            dt_char = 'u' if sample_width == 1 else 'i'
-            a = numpy.fromstring(data, dtype='<%s%d' % (dt_char, sample_width))
-            audio_data = a.reshape(-1, number_of_channels).T
+    if cache_path is not None and (file_extension == '.flac' or
+                                   (file_extension == '.wav' and get_wav_info(filename)['sample_rate'] != fs)):
+        cache_filename = get_audio_cache_filename(filename=filename, fs=fs, mono=mono, start=start, stop=stop,
+                                                  path=cache_path)
+        try:
+            audio_data = numpy.load(cache_filename)
 
-        if mono:
-            # Down-mix audio
-            audio_data = numpy.mean(audio_data, axis=0)
+            # Mark as recently used
+            os.utime(cache_filename, None)
 
-        # Convert int values into float
-        audio_data = audio_data / float(2 ** (sample_width * 8 - 1) + 1)
+        except (IOError, OSError, ValueError):
+            # Not cached yet, or removed by another process in the meantime
+            audio_data, sample_rate = load_audio(filename=filename, mono=mono, fs=fs, start=start, stop=stop)
+            audio_data = numpy.asarray(audio_data, dtype=numpy.float32)
+            save_audio_cache(cache_filename, audio_data, cache_size=cache_size)
+
+        return audio_data, fs
+
+    if file_extension == '.wav':
+        audio_data, sample_rate = load_wav(filename=filename, mono=mono, start=start, stop=stop)
 
         # Resample
         if fs != sample_rate:
@@ -88,13 +93,278 @@ def load_audio(filename, mono=True, fs=44100):
         return audio_data, sample_rate
 
     elif file_extension == '.flac':
-        audio_data, sample_rate = librosa.load(filename, sr=fs, mono=mono)
+        if start is None:
+            start = 0.0
+
+        audio_data, sample_rate = librosa.load(filename, sr=fs, mono=mono, offset=start,
+                                               duration=None if stop is None else stop - start)
 
         return audio_data, sample_rate
 
     return None, None
 
 
+def get_audio_cache_filename(filename, fs, mono=True, start=None, stop=None, path=''):
+    """Audio cache filename
+
+    Cached audio is keyed by the absolute path, modification time and size of the audio file, and the
+    load_audio arguments, so edited audio files and other sample rates get a new entry.
+
+    Parameters
+    ----------
+    filename:  str
+        Path to audio file
+
+    fs : int > 0 [scalar]
+        Target sample rate
+
+    mono : bool
+        Channels averaged into single channel
+        (Default value=True)
+
+    start : float >= 0 [scalar]
+        Start of the time range in seconds
+        (Default value=None)
+
+    stop : float > 0 [scalar]
+        End of the time range in seconds
+        (Default value=None)
+
+    path : str
+        Path of the audio cache
+        (Default value='')
+
+    Returns
+    -------
+    cache_filename : str
+        Path to the cached audio, npy-format
+
+    """
+
+    file_stat = os.stat(filename)
+    key = repr((os.path.abspath(filename), file_stat.st_mtime, file_stat.st_size, int(fs), bool(mono), start, stop))
+    return os.path.join(path, hashlib.md5(key).hexdigest() + '.npy')
+
+
+def save_audio_cache(filename, audio_data, cache_size=None):
+    """Store audio into the audio cache and keep the cache within its size limit
+
+    Parameters
+    ----------
+    filename: str
+        Path to cache file, see get_audio_cache_filename
+
+    audio_data : numpy.ndarray
+        Audio
+
+    cache_size : int > 0 [scalar]
+        Size limit of the audio cache in bytes, None leaves the cache unbounded
+        (Default value=None)
+
+    Returns
+    -------
+    nothing
+
+    """
+
+    # Write next to the target and rename, concurrent workers never load a partially written file
+    temp_filename = filename + '.' + str(os.getpid()) + '.tmp'
+    with open(temp_filename, 'wb') as f:
+        numpy.save(f, audio_data)
+    os.rename(temp_filename, filename)
+
+    if cache_size is not None:
+        prune_audio_cache(path=os.path.dirname(filename), cache_size=cache_size)
+
+
+def prune_audio_cache(path, cache_size):
+    """Remove least recently used files from the audio cache until it fits the size limit
+
+    Files are marked as used by their modification time, load_audio updates it on every cache hit.
+
+    Parameters
+    ----------
+    path: str
+        Path of the audio cache
+
+    cache_size : int >= 0 [scalar]
+        Size limit of the audio cache in bytes
+
+    Returns
+    -------
+    nothing
+
+    """
+
+    cache_files = []
+    for cache_filename in os.listdir(path):
+        if cache_filename.endswith('.npy'):
+            try:
+                file_stat = os.stat(os.path.join(path, cache_filename))
+            except OSError:
+                # Removed by another process
+                continue
+
+            cache_files.append((file_stat.st_mtime, file_stat.st_size, os.path.join(path, cache_filename)))
+
+    total_size = sum(file_size for file_time, file_size, cache_filename in cache_files)
+    for file_time, file_size, cache_filename in sorted(cache_files):
+        if total_size <= cache_size:
+            break
+
+        try:
+            os.remove(cache_filename)
+        except OSError:
+            pass
+
+        total_size -= file_size
+
+
+def get_wav_info(filename):
+    """Format and data chunk position of a PCM wav file
+
+    Parameters
+    ----------
+    filename:  str
+        Path to wav file
+
+    Returns
+    -------
+    info : dict
+        'sample_rate', 'sample_width' in bytes, 'channels', 'frames' and 'data_offset' in bytes
+
+    Raises
+    -------
+    ValueError
+        Not a PCM wav file.
+
+    """
+
+    info = {}
+    with open(filename, 'rb') as f:
+        riff, riff_size, wave_id = struct.unpack('<4sI4s', f.read(12))
+        if riff != 'RIFF' or wave_id != 'WAVE':
+            raise ValueError("Not a wav file [%s]" % filename)
+
+        while 'data_offset' not in info:
+            chunk_header = f.read(8)
+            if len(chunk_header) < 8:
+                raise ValueError("Data chunk not found [%s]" % filename)
+
+            chunk_id, chunk_size = struct.unpack('<4sI', chunk_header)
+            if chunk_id == 'fmt ':
+                chunk = f.read(chunk_size)
+                audio_format, channels, sample_rate, byte_rate, block_align, bits = struct.unpack(
+                    '<HHIIHH', chunk[:16])
+                if audio_format == 0xFFFE and len(chunk) >= 26:
+                    # WAVE_FORMAT_EXTENSIBLE, format code in the first bytes of the sub format GUID
+                    audio_format = struct.unpack('<H', chunk[24:26])[0]
+
+                if audio_format != 1 or channels == 0 or block_align != channels * ((bits + 7) // 8):
+                    raise ValueError("Unsupported wav format [%s]" % filename)
+
+                info['sample_rate'] = sample_rate
+                info['sample_width'] = (bits + 7) // 8
+                info['channels'] = channels
+            elif chunk_id == 'data':
+                if 'channels' not in info:
+                    raise ValueError("Format chunk not found [%s]" % filename)
+
+                info['data_offset'] = f.tell()
+                data_size = min(chunk_size, os.fstat(f.fileno()).st_size - f.tell())
+                info['frames'] = data_size // (info['sample_width'] * info['channels'])
+            else:
+                f.seek(chunk_size, 1)
+
+            # Chunks are word aligned
+            if chunk_size % 2 and 'data_offset' not in info:
+                f.seek(1, 1)
+
+    if info['sample_width'] > 4:
+        raise ValueError("Sample size cannot be bigger than 4 bytes [%s]" % filename)
+
+    return info
+
+
+def load_wav(filename, mono=True, start=None, stop=None):
+    """Load PCM wav file into float32 numpy array
+
+    The data chunk is memory-mapped and only the frames in the requested time range are read. 16 and 32 bit
+    samples are mapped as integers, 24 bit samples as 32 bit integers starting one byte before each sample,
+    and shifted down. Samples are converted to float in one pass, channels are summed in the same pass
+    when down-mixing. Scaling is the same as in earlier versions of load_audio, 8 bit samples are read
+    unsigned as before.
+
+    Parameters
+    ----------
+    filename:  str
+        Path to wav file
+
+    mono : bool
+        In case of multi-channel audio, channels are averaged into single channel.
+        (Default value=True)
+
+    start : float >= 0 [scalar]
+        Start of the time range in seconds, beginning of the file if None.
+        (Default value=None)
+
+    stop : float > 0 [scalar]
+        End of the time range in seconds, end of the file if None.
+        (Default value=None)
+
+    Returns
+    -------
+    audio_data : numpy.ndarray [shape=(signal_length,) or (channel, signal_length)]
+        Audio
+
+    sample_rate : integer
+        Sample rate
+
+    """
+
+    info = get_wav_info(filename)
+    sample_width = info['sample_width']
+    channels = info['channels']
+
+    # Frame range
+    first_frame = 0
+    last_frame = info['frames']
+    if start is not None:
+        first_frame = min(max(int(round(start * info['sample_rate'])), 0), info['frames'])
+    if stop is not None:
+        last_frame = min(max(int(round(stop * info['sample_rate'])), first_frame), info['frames'])
+    frame_count = last_frame - first_frame
+
+    if frame_count == 0:
+        samples = numpy.zeros((0, channels), dtype=numpy.int32)
+    elif sample_width == 3:
+        # 24 bit audio, the byte before each sample ends up in the low byte and is shifted out
+        offset = info['data_offset'] + first_frame * channels * 3 - 1
+        raw_bytes = numpy.memmap(filename, dtype=numpy.uint8, mode='r', offset=offset,
+                                 shape=(frame_count * channels * 3 + 1,))
+        samples = numpy.lib.stride_tricks.as_strided(raw_bytes.view(numpy.uint8)[:4].view('<i4'),
+                                                     shape=(frame_count, channels),
+                                                     strides=(channels * 3, 3))
+        samples = numpy.right_shift(samples, 8)
+    else:
+        # 8 bit samples are stored as unsigned ints; others as signed ints.
+        dt_char = 'u' if sample_width == 1 else 'i'
+        samples = numpy.memmap(filename, dtype='<%s%d' % (dt_char, sample_width), mode='r',
+                               offset=info['data_offset'] + first_frame * channels * sample_width,
+                               shape=(frame_count, channels))
+
+    if mono:
+        # Down-mix audio
+        audio_data = numpy.sum(samples, axis=1, dtype=numpy.float32)
+        audio_data /= channels * float(2 ** (sample_width * 8 - 1) + 1)
+    else:
+        audio_data = numpy.empty((channels, frame_count), dtype=numpy.float32)
+        audio_data[:] = samples.T
+        audio_data /= float(2 ** (sample_width * 8 - 1) + 1)
+
+    return audio_data, info['sample_rate']
+
+
 def load_event_list(file):
     """Load event list from tab delimited text file (csv-formated)
 
@@ -173,7 +443,12 @@ def save_data(filename, data):
 
     """
 
-    pickle.dump(data, open(filename, 'wb'), protocol=pickle.HIGHEST_PROTOCOL)
+    # Write next to the target and rename, so readers and concurrent extraction workers never see
+    # a partially written file
+    temp_filename = filename + '.' + str(os.getpid()) + '.tmp'
+    with open(temp_filename, 'wb') as f:
+        pickle.dump(data, f, protocol=pickle.HIGHEST_PROTOCOL)
+    os.rename(temp_filename, filename)
 
 
 def load_data(filename):
@@ -194,6 +469,447 @@ def load_data(filename):
     return pickle.load(open(filename, "rb"))
 
 
+def get_feature_stat_filename(filename):
+    """Statistics sidecar filename of a npy feature file
+
+    Parameters
+    ----------
+    filename: str
+        Path to npy feature file
+
+    Returns
+    -------
+    stat_filename: str
+        Path to statistics file
+
+    """
+
+    return os.path.splitext(filename)[0] + '.stat.cpickle'
+
+
+def save_feature_data(filename, data):
+    """Save feature dict, file format selected by the file extension
+
+    With extension npy the feature matrix is written as a raw NumPy array and the statistics into a
+    pickle sidecar next to it (see get_feature_stat_filename). Any other extension pickles the whole
+    dict with save_data.
+
+    Features extracted block by block (feature dict with 'frames' and 'blocks', see feature_extraction)
+    are collected with collect_feature_blocks, straight into the memory-mapped npy file.
+
+    Parameters
+    ----------
+    filename: str
+        Path to file
+
+    data: dict
+        Feature dict, 'feat' and optional 'stat', or 'frames' and 'blocks'
+
+    Returns
+    -------
+    stat: dict or None
+        Statistics of the saved features, None if the feature dict has none
+
+    """
+
+    if os.path.splitext(filename)[1] == '.npy':
+        temp_filename = filename + '.' + str(os.getpid()) + '.tmp'
+        if 'blocks' in data:
+            # Blocks go into the temporary file as they are extracted
+            data = collect_feature_blocks(data, filename=temp_filename)
+        else:
+            with open(temp_filename, 'wb') as f:
+                numpy.save(f, data['feat'])
+
+        # Sidecar before the rename, an existing npy file always has its statistics next to it
+        if 'stat' in data:
+            save_data(get_feature_stat_filename(filename), data['stat'])
+
+        os.rename(temp_filename, filename)
+    else:
+        if 'blocks' in data:
+            data = collect_feature_blocks(data)
+
+        save_data(filename, data)
+
+    return data.get('stat')
+
+
+def collect_feature_blocks(data, filename=None):
+    """Feature dict from features extracted block by block
+
+    Blocks are written into the feature matrix as they are generated, so only one block is held at a
+    time besides the matrix. The matrix gets the memory layout of the blocks, like the matrix extracted
+    from the whole signal, and the statistics are calculated from the complete matrix the same way as
+    in feature_extraction. With filename given, the matrix is a memory-mapped npy file, written with the
+    same header as numpy.save.
+
+    Parameters
+    ----------
+    data: dict
+        'frames' total frame count and 'blocks' iterable of feature blocks
+
+    filename: str or None
+        Path to npy file for the feature matrix, matrix is kept in memory if None
+        (Default value=None)
+
+    Returns
+    -------
+    data: dict
+        Feature dict, 'feat' and 'stat'
+
+    Raises
+    -------
+    ValueError
+        Blocks do not add up to the frame count.
+
+    """
+
+    feature_matrix = None
+    frame_id = 0
+    for block in data['blocks']:
+        if feature_matrix is None:
+            if filename is not None:
+                feature_matrix = numpy.lib.format.open_memmap(filename,
+                                                              mode='w+',
+                                                              dtype=block.dtype,
+                                                              shape=(data['frames'], block.shape[1]),
+                                                              fortran_order=numpy.isfortran(block))
+            else:
+                feature_matrix = numpy.empty((data['frames'], block.shape[1]),
+                                             dtype=block.dtype,
+                                             order='F' if numpy.isfortran(block) else 'C')
+
+        feature_matrix[frame_id:frame_id + block.shape[0]] = block
+        frame_id += block.shape[0]
+
+    if feature_matrix is None or frame_id != data['frames']:
+        raise ValueError("Feature blocks do not match frame count [%s]" % data['frames'])
+
+    if filename is not None:
+        feature_matrix.flush()
+
+    feature_matrix = numpy.asarray(feature_matrix)
+    return {
+        'feat': feature_matrix,
+        'stat': {
+            'mean': numpy.mean(feature_matrix, axis=0),
+            'std': numpy.std(feature_matrix, axis=0),
+            'N': feature_matrix.shape[0],
+            'S1': numpy.sum(feature_matrix, axis=0),
+            'S2': numpy.sum(feature_matrix ** 2, axis=0),
+        }
+    }
+
+
+def load_feature_data(filename, part=None):
+    """Load feature dict saved with save_feature_data
+
+    Feature matrices of npy files are memory-mapped read-only, frames are read from disk when accessed.
+    Loading only the statistics of a npy file reads the sidecar.
+
+    Parameters
+    ----------
+    filename: str
+        Path to file
+
+    part: str {'feat', 'stat'} or None
+        Return only this item of the feature dict, None returns the dict
+        (Default value=None)
+
+    Returns
+    -------
+    data: dict or numpy.ndarray
+        Feature dict, feature matrix or statistics
+
+    """
+
+    if os.path.splitext(filename)[1] == '.npy':
+        if part == 'stat':
+            return load_data(get_feature_stat_filename(filename))
+
+        feature_matrix = numpy.load(filename, mmap_mode='r')
+        if part == 'feat':
+            return feature_matrix
+
+        return {
+            'feat': feature_matrix,
+            'stat': load_data(get_feature_stat_filename(filename))
+        }
+    else:
+        data = load_data(filename)
+        if part is not None:
+            return data[part]
+        return data
+
+
+def get_feature_stat_index_filename(path):
+    """Statistics index filename of a feature path
+
+    Parameters
+    ----------
+    path: str
+        Feature path
+
+    Returns
+    -------
+    index_filename: str
+        Path to statistics index
+
+    """
+
+    return os.path.join(path, 'stat_index.cpickle')
+
+
+def load_feature_stat_index(path):
+    """Load statistics index of a feature path
+
+    The index holds the statistics N, S1 and S2 of the feature files in the path as one row per file,
+    together with the modification time of the file they were taken from, format:
+
+        {
+            'files': list of feature file basenames,
+            'mtime': numpy.ndarray [shape=(files,)],
+            'N': numpy.ndarray [shape=(files,)],
+            'S1': numpy.ndarray [shape=(files, number of feature values)],
+            'S2': numpy.ndarray [shape=(files, number of feature values)],
+        }
+
+    Parameters
+    ----------
+    path: str
+        Feature path
+
+    Returns
+    -------
+    index: dict
+        Statistics index, without files if the path has no index
+
+    """
+
+    index_filename = get_feature_stat_index_filename(path)
+    if os.path.isfile(index_filename):
+        return load_data(index_filename)
+
+    return {
+        'files': [],
+        'mtime': numpy.empty(0),
+        'N': numpy.empty(0, dtype=int),
+        'S1': numpy.empty((0, 0)),
+        'S2': numpy.empty((0, 0)),
+    }
+
+
+def update_feature_stat_index(stats):
+    """Add feature statistics to the statistics index of their feature path
+
+    Parameters
+    ----------
+    stats: dict
+        Statistics dict (see save_feature_data) of each feature file, indexed by feature filename. Files
+        can be in several feature paths, each path has its own index.
+
+    Returns
+    -------
+    nothing
+
+    """
+
+    paths = {}
+    for feature_file in stats:
+        if stats[feature_file] is not None:
+            paths.setdefault(os.path.dirname(feature_file), []).append(feature_file)
+
+    for path in paths:
+        index = load_feature_stat_index(path)
+        entries = dict((basename, (index['mtime'][row], index['N'][row], index['S1'][row], index['S2'][row]))
+                       for row, basename in enumerate(index['files']))
+
+        # Statistics of a file extracted again replace the old ones
+        for feature_file in paths[path]:
+            entries[os.path.basename(feature_file)] = (os.path.getmtime(feature_file),
+                                                       stats[feature_file]['N'],
+                                                       numpy.ravel(stats[feature_file]['S1']),
+                                                       numpy.ravel(stats[feature_file]['S2']))
+
+        files = sorted(entries)
+        save_data(get_feature_stat_index_filename(path), {
+            'files': files,
+            'mtime': numpy.array([entries[basename][0] for basename in files]),
+            'N': numpy.array([entries[basename][1] for basename in files]),
+            'S1': numpy.vstack([entries[basename][2] for basename in files]),
+            'S2': numpy.vstack([entries[basename][3] for basename in files]),
+        })
+
+
+def load_feature_stats(feature_files):
+    """Statistics of feature files as rows, taken from the statistics index of their feature path
+
+    Files missing from the index, or changed since their statistics were indexed, are read with
+    load_feature_data and added to the index, so each feature file is read once for all folds.
+
+    Parameters
+    ----------
+    feature_files: list of str
+        Paths to feature files, see load_feature_data
+
+    Returns
+    -------
+    stat: dict
+        Statistics dict with one row per feature file in 'N', 'S1' and 'S2', see FeatureNormalizer.accumulate
+
+    Raises
+    -------
+    IOError
+        Feature file not found.
+
+    """
+
+    paths = set(os.path.dirname(feature_file) for feature_file in feature_files)
+    indexes = dict((path, load_feature_stat_index(path)) for path in paths)
+    rows = dict((path, dict((basename, row) for row, basename in enumerate(indexes[path]['files']))) for path in paths)
+
+    missing = {}
+    for feature_file in feature_files:
+        if not os.path.isfile(feature_file):
+            raise IOError("Feature file not found [%s]" % feature_file)
+
+        path, basename = os.path.split(feature_file)
+        if basename not in rows[path] or indexes[path]['mtime'][rows[path][basename]] != os.path.getmtime(feature_file):
+            missing[feature_file] = load_feature_data(feature_file, part='stat')
+
+    if missing:
+        update_feature_stat_index(missing)
+        indexes = dict((path, load_feature_stat_index(path)) for path in paths)
+        rows = dict((path, dict((basename, row) for row, basename in enumerate(indexes[path]['files'])))
+                    for path in paths)
+
+    stat = {'N': [], 'S1': [], 'S2': []}
+    for feature_file in feature_files:
+        path, basename = os.path.split(feature_file)
+        for field in stat:
+            stat[field].append(indexes[path][field][rows[path][basename]])
+
+    return {
+        'N': numpy.array(stat['N']),
+        'S1': numpy.vstack(stat['S1']),
+        'S2': numpy.vstack(stat['S2']),
+    }
+
+
+def feature_minibatch_generator(feature_files, labels, normalizer=None, batch_size=128, buffer_size=100000,
+                                random_state=None, loop=False):
+    """Minibatches of frames streamed from feature files
+
+    Files are read in random order and their frames collected into a shuffle buffer. Once the buffer
+    holds buffer_size frames it is shuffled and emptied in batches, frames left over from the last
+    full batch are carried over into the next buffer. Memory use is bounded by the shuffle buffer and
+    one feature file, not by the number of files.
+
+    Parameters
+    ----------
+    feature_files: list of str
+        Paths to feature files, see load_feature_data
+
+    labels: list or numpy.ndarray
+        Label of each feature file, used for all of its frames
+
+    normalizer: FeatureNormalizer or None
+        Normalizer applied to each feature matrix after loading
+        (Default value=None)
+
+    batch_size: int > 0
+        Frames per batch
+        (Default value=128)
+
+    buffer_size: int > 0
+        Frames in the shuffle buffer
+        (Default value=100000)
+
+    random_state: int or None
+        Seed for the file and frame order
+        (Default value=None)
+
+    loop: bool
+        Go through the files again in a new order after the last one, the generator never stops.
+        Otherwise the last batch can hold less than batch_size frames.
+        (Default value=False)
+
+    Returns
+    -------
+    batches: generator
+        Yields batches as (feature matrix [shape=(batch_size, feature vector length)], labels [shape=(batch_size,)])
+
+    """
+
+    random = numpy.random.RandomState(random_state)
+    labels = numpy.asarray(labels)
+
+    buffer_x = []
+    buffer_y = []
+    buffer_frames = 0
+    while len(feature_files):
+        for file_id in random.permutation(len(feature_files)):
+            feature_data = numpy.asarray(load_feature_data(feature_files[file_id], part='feat'))
+            if normalizer is not None:
+                feature_data = normalizer.normalize(feature_data, in_place=True)
+
+            buffer_x.append(feature_data)
+            buffer_y.append(numpy.repeat(labels[file_id:file_id + 1], feature_data.shape[0]))
+            buffer_frames += feature_data.shape[0]
+
+            if buffer_frames >= buffer_size:
+                x = numpy.vstack(buffer_x)
+                y = numpy.concatenate(buffer_y)
+                order = random.permutation(buffer_frames)
+                batch_count = buffer_frames // batch_size
+                for batch_id in range(batch_count):
+                    batch = order[batch_id * batch_size:(batch_id + 1) * batch_size]
+                    yield x[batch], y[batch]
+
+                # Carry the rest over
+                rest = order[batch_count * batch_size:]
+                buffer_x = [x[rest]]
+                buffer_y = [y[rest]]
+                buffer_frames = len(rest)
+
+        if not loop:
+            break
+
+    if buffer_frames:
+        x = numpy.vstack(buffer_x)
+        y = numpy.concatenate(buffer_y)
+        order = random.permutation(buffer_frames)
+        for batch_start in range(0, buffer_frames, batch_size):
+            batch = order[batch_start:batch_start + batch_size]
+            yield x[batch], y[batch]
+
+
+def split_frame_stream(batches):
+    """Frame and label iterators over minibatches
+
+    For estimators that draw training samples one by one from separate feature and label iterators,
+    like the streaming data feeder of skflow.
+
+    Parameters
+    ----------
+    batches: iterator
+        Batches as (feature matrix, labels), see feature_minibatch_generator
+
+    Returns
+    -------
+    x_stream: generator
+        Feature vectors
+
+    y_stream: generator
+        Labels
+
+    """
+
+    x_frames, y_frames = itertools.tee((x, y) for batch_x, batch_y in batches for x, y in zip(batch_x, batch_y))
+    return (x for x, y in x_frames), (y for x, y in y_frames)
+
+
 def save_parameters(filename, parameters):
     """Save parameters to YAML-file
 
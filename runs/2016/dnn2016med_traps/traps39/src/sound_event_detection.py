@@ -2,10 +2,12 @@
 # -*- coding: utf-8 -*-
 
 import numpy
+import scipy.signal
 
 
 def event_detection(feature_data, model_container, hop_length_seconds=0.01, smoothing_window_length_seconds=1.0,
-                    decision_threshold=0.0, minimum_event_length=0.1, minimum_event_gap=0.1):
+                    decision_threshold=0.0, minimum_event_length=0.1, minimum_event_gap=0.1,
+                    smoothing_window_type='causal'):
     """Sound event detection
 
     Parameters
@@ -36,6 +38,10 @@ def event_detection(feature_data, model_container, hop_length_seconds=0.01, smoo
         Minimum allowed gap between events in seconds from same event label class.
         (Default value=0.1)
 
+    smoothing_window_type : str
+        Accumulation window type [causal, centered, exponential], see smooth_likelihood.
+        (Default value='causal')
+
     Returns
     -------
     results : list (event dicts)
@@ -45,20 +51,15 @@ def event_detection(feature_data, model_container, hop_length_seconds=0.01, smoo
 
     smoothing_window = int(smoothing_window_length_seconds / hop_length_seconds)
 
+    # Score all model pairs at once, [shape=(t, number of events, 2)]
+    scores = score_event_models(feature_data, model_container)
+
     results = []
-    for event_label in model_container['models']:
-        positive = model_container['models'][event_label]['positive'].score_samples(feature_data)[0]
-        negative = model_container['models'][event_label]['negative'].score_samples(feature_data)[0]
-
-        # Lets keep the system causal and use look-back while smoothing (accumulating) likelihoods
-        for stop_id in range(0, feature_data.shape[0]):
-            start_id = stop_id - smoothing_window
-            if start_id < 0:
-                start_id = 0
-            positive[start_id] = sum(positive[start_id:stop_id])
-            negative[start_id] = sum(negative[start_id:stop_id])
-
-        likelihood_ratio = positive - negative
+    for event_id, event_label in enumerate(model_container['models']):
+        # Accumulate likelihood ratios within the smoothing window, causal windows only look back
+        likelihood_ratio = smooth_likelihood(scores[:, event_id, 0] - scores[:, event_id, 1],
+                                             window_length=smoothing_window,
+                                             window_type=smoothing_window_type)
         event_activity = likelihood_ratio > decision_threshold
 
         # Find contiguous segments and convert frame-ids into times
@@ -75,6 +76,163 @@ def event_detection(feature_data, model_container, hop_length_seconds=0.01, smoo
     return results
 
 
+def smooth_likelihood(likelihood, window_length, window_type='causal'):
+    """Accumulate frame likelihoods within a sliding window
+
+    Rectangular windows are computed as differences of cumulative sums, the exponential window with a
+    first order recursive filter, both in O(t) array operations.
+
+    Parameters
+    ----------
+    likelihood : numpy.ndarray [shape=(t)]
+        Frame likelihoods
+
+    window_length : int > 0
+        Window length in frames
+
+    window_type : str
+        Window type, 'causal' accumulates the current frame and window_length - 1 frames before it (look-back),
+        'centered' accumulates window_length frames around the current frame, 'exponential' accumulates
+        all past frames with exponentially decaying weights, weights sum up to window_length.
+        (Default value='causal')
+
+    Returns
+    -------
+    accumulated : numpy.ndarray [shape=(t)]
+        Accumulated likelihoods
+
+    Raises
+    -------
+    ValueError
+        Unknown window type.
+
+    """
+
+    likelihood = numpy.asarray(likelihood, dtype=numpy.float64)
+    window_length = max(int(window_length), 1)
+
+    if window_type == 'exponential':
+        # y[t] = x[t] + decay * y[t - 1]
+        decay = 1.0 - 1.0 / window_length
+        return scipy.signal.lfilter([1.0], [1.0, -decay], likelihood)
+
+    frame_ids = numpy.arange(likelihood.shape[0])
+    if window_type == 'causal':
+        start_ids = numpy.maximum(frame_ids - window_length + 1, 0)
+        stop_ids = frame_ids + 1
+    elif window_type == 'centered':
+        start_ids = numpy.maximum(frame_ids - (window_length - 1) // 2, 0)
+        stop_ids = numpy.minimum(frame_ids + window_length // 2 + 1, likelihood.shape[0])
+    else:
+        raise ValueError("Unknown smoothing window type [%s]" % window_type)
+
+    cumulative = numpy.concatenate(([0.0], numpy.cumsum(likelihood)))
+    return cumulative[stop_ids] - cumulative[start_ids]
+
+
+def score_event_models(feature_data, model_container, block_size=16384):
+    """Frame log-likelihoods of all event model pairs
+
+    Parameters
+    ----------
+    feature_data : numpy.ndarray [shape=(t, n_features)]
+        Feature matrix
+
+    model_container : dict
+        Sound event model pairs [positive and negative] in dict
+
+    block_size : int > 0
+        Frames scored at a time, bounds the size of the intermediate (frames x components) matrix
+        (Default value=16384)
+
+    Returns
+    -------
+    scores : numpy.ndarray [shape=(t, number of events, 2)]
+        Frame log-likelihoods, events in the iteration order of model_container['models'], positive model
+        first in the last dimension
+
+    """
+
+    models = []
+    for event_label in model_container['models']:
+        models.append(model_container['models'][event_label]['positive'])
+        models.append(model_container['models'][event_label]['negative'])
+
+    scores = score_gmm_models(feature_data, models, block_size=block_size)
+    return scores.reshape((scores.shape[0], -1, 2))
+
+
+def score_gmm_models(feature_data, models, block_size=16384):
+    """Frame log-likelihoods of several GMMs at once
+
+    Components of all diagonal covariance models are stacked into one parameter block, so the Gaussian
+    terms of every component are computed for a block of frames with two matrix products. The
+    log-likelihood of each model is then a log-sum-exp over its own components. Models with other
+    covariance types are scored one by one with score_samples.
+
+    Parameters
+    ----------
+    feature_data : numpy.ndarray [shape=(t, n_features)]
+        Feature matrix
+
+    models : list of mixture.GMM
+        Fitted models
+
+    block_size : int > 0
+        Frames scored at a time, bounds the size of the intermediate (frames x components) matrix
+        (Default value=16384)
+
+    Returns
+    -------
+    scores : numpy.ndarray [shape=(t, number of models)]
+        Frame log-likelihoods, one column per model
+
+    """
+
+    feature_data = numpy.asarray(feature_data, dtype=numpy.float64)
+    scores = numpy.empty((feature_data.shape[0], len(models)))
+
+    diag_ids = [model_id for model_id, model in enumerate(models) if model.covariance_type == 'diag']
+    for model_id, model in enumerate(models):
+        if model.covariance_type != 'diag':
+            scores[:, model_id] = model.score_samples(feature_data)[0]
+
+    if not diag_ids:
+        return scores
+
+    means = numpy.vstack([models[model_id].means_ for model_id in diag_ids])
+    precisions = 1.0 / numpy.vstack([models[model_id].covars_ for model_id in diag_ids])
+    log_weights = numpy.concatenate([numpy.log(models[model_id].weights_) for model_id in diag_ids])
+
+    # Component counts and offsets of each model in the stacked block
+    component_counts = [models[model_id].means_.shape[0] for model_id in diag_ids]
+    component_offsets = numpy.cumsum([0] + component_counts[:-1])
+
+    # Frame independent part of the log-densities, log-weights included
+    constant = log_weights - 0.5 * (feature_data.shape[1] * numpy.log(2 * numpy.pi) -
+                                    numpy.sum(numpy.log(precisions), 1) +
+                                    numpy.sum(means ** 2 * precisions, 1))
+    weighted_means = (means * precisions).T
+    precisions = precisions.T
+
+    for start in range(0, feature_data.shape[0], block_size):
+        block = feature_data[start:start + block_size]
+
+        # Weighted log-densities [shape=(frames, components)]
+        log_density = numpy.dot(block, weighted_means)
+        log_density -= 0.5 * numpy.dot(block ** 2, precisions)
+        log_density += constant
+
+        # Log-sum-exp over the components of each model
+        peak = numpy.maximum.reduceat(log_density, component_offsets, axis=1)
+        log_density -= numpy.repeat(peak, component_counts, axis=1)
+        numpy.exp(log_density, out=log_density)
+        summed = numpy.add.reduceat(log_density, component_offsets, axis=1)
+        scores[start:start + block_size, diag_ids] = peak + numpy.log(summed)
+
+    return scores
+
+
 def contiguous_regions(activity_array):
     """Find contiguous regions from bool valued numpy.array.
     Transforms boolean values for each frame into pairs of onsets and offsets.
@@ -163,3 +321,290 @@ def postprocess_event_segments(event_segments, minimum_event_length=0.1, minimum
         return event_results_2
     else:
         return event_results_1
+
+
+class StreamingEventDetector(object):
+    """Online sound event detector
+
+    Frame-synchronous counterpart of event_detection for live streams. Feature frames are fed in blocks of
+    any size, the causal smoothing state, the open event and the event waiting for a gap merge are kept
+    between the blocks. Detection output is a list of onset and offset messages, an onset is reported once
+    the event is longer than minimum_event_length and an offset once no event within minimum_event_gap can
+    extend it, so the latency is bounded by these two lengths. Paired onsets and offsets are the events
+    event_detection finds on the whole recording.
+
+    Examples
+    --------
+
+    >>> extractor = StreamingFeatureExtractor(fs=fs, ...)
+    >>> detector = StreamingEventDetector(model_container=model_container, ...)
+    >>> for audio_block in stream:
+    >>>     feature_data = model_container['normalizer'].normalize(extractor.process(audio_block))
+    >>>     for event_type, event_time, event_label in detector.process(feature_data):
+    >>>         # use the messages
+    >>>
+    >>> feature_data = model_container['normalizer'].normalize(extractor.flush())
+    >>> messages = detector.process(feature_data) + detector.flush()
+
+    """
+
+    def __init__(self, model_container, hop_length_seconds=0.01, smoothing_window_length_seconds=1.0,
+                 decision_threshold=0.0, minimum_event_length=0.1, minimum_event_gap=0.1,
+                 smoothing_window_type='causal'):
+        """__init__ method.
+
+        Parameters
+        ----------
+        model_container : dict
+            Sound event model pairs [positive and negative] in dict
+
+        hop_length_seconds : float > 0.0
+            Feature hop length in seconds, used to convert feature index into time-stamp
+            (Default value=0.01)
+
+        smoothing_window_length_seconds : float > 0.0
+            Accumulation window (look-back) length, withing the window likelihoods are accumulated.
+            (Default value=1.0)
+
+        decision_threshold : float > 0.0
+            Likelihood ratio threshold for making the decision.
+            (Default value=0.0)
+
+        minimum_event_length : float > 0.0
+            Minimum event length in seconds, shorten than given are filtered out from the output.
+            (Default value=0.1)
+
+        minimum_event_gap : float > 0.0
+            Minimum allowed gap between events in seconds from same event label class.
+            (Default value=0.1)
+
+        smoothing_window_type : str
+            Accumulation window type [causal, exponential], see smooth_likelihood.
+            (Default value='causal')
+
+        Raises
+        -------
+        ValueError
+            Window type needs future frames.
+
+        """
+
+        if smoothing_window_type not in ['causal', 'exponential']:
+            raise ValueError("Smoothing window type is not causal [%s]" % smoothing_window_type)
+
+        self.model_container = model_container
+        self.hop_length_seconds = hop_length_seconds
+        self.smoothing_window = max(int(smoothing_window_length_seconds / hop_length_seconds), 1)
+        self.smoothing_window_type = smoothing_window_type
+        self.decision_threshold = decision_threshold
+        self.minimum_event_length = minimum_event_length
+        self.minimum_event_gap = minimum_event_gap
+
+        self.event_labels = list(model_container['models'])
+
+        # Frames processed so far
+        self.frame_count = 0
+
+        # Causal smoothing state, look-back likelihood ratios or the last filter output [shape=(frames, events)]
+        self.history = numpy.zeros((0, len(self.event_labels)))
+
+        # Onset frame of the active segment, onset and offset frames of the reported event waiting for
+        # a gap merge, and whether the active segment already extends the reported event
+        self.segment_onset = dict((event_label, None) for event_label in self.event_labels)
+        self.reported = dict((event_label, None) for event_label in self.event_labels)
+        self.extending = dict((event_label, False) for event_label in self.event_labels)
+
+    def process(self, feature_data):
+        """Process a block of feature frames
+
+        Parameters
+        ----------
+        feature_data : numpy.ndarray [shape=(t, n_features)]
+            Normalized feature frames following the previous block
+
+        Returns
+        -------
+        messages : list of tuples
+            Detector messages ('onset' or 'offset', time in seconds, event label), sorted by time
+
+        """
+
+        if feature_data.shape[0] == 0:
+            return []
+
+        scores = score_event_models(feature_data, self.model_container)
+        likelihood_ratio = scores[:, :, 0] - scores[:, :, 1]
+
+        if self.smoothing_window_type == 'exponential':
+            decay = 1.0 - 1.0 / self.smoothing_window
+            if self.history.shape[0]:
+                initial = decay * self.history[-1:]
+            else:
+                initial = numpy.zeros((1, len(self.event_labels)))
+            likelihood_ratio = scipy.signal.lfilter([1.0], [1.0, -decay], likelihood_ratio, axis=0, zi=initial)[0]
+            self.history = likelihood_ratio[-1:]
+        else:
+            context = numpy.vstack((self.history, likelihood_ratio))
+            accumulated = numpy.cumsum(numpy.vstack((numpy.zeros((1, context.shape[1])), context)), axis=0)
+            stop_ids = numpy.arange(self.history.shape[0], context.shape[0]) + 1
+            start_ids = numpy.maximum(stop_ids - self.smoothing_window, 0)
+            likelihood_ratio = accumulated[stop_ids] - accumulated[start_ids]
+            self.history = context[max(context.shape[0] - self.smoothing_window + 1, 0):]
+
+        event_activity = likelihood_ratio > self.decision_threshold
+
+        messages = []
+        for event_id, event_label in enumerate(self.event_labels):
+            activity = event_activity[:, event_id]
+            previous = self.segment_onset[event_label] is not None
+            changes = numpy.diff(numpy.r_[previous, activity].astype(int)).nonzero()[0]
+            for change in changes:
+                frame_id = self.frame_count + change
+                if activity[change]:
+                    self.segment_onset[event_label] = frame_id
+                else:
+                    self.close_segment(event_label, frame_id, messages)
+            self.update(event_label, self.frame_count + feature_data.shape[0], messages)
+
+        self.frame_count += feature_data.shape[0]
+        return sorted(messages, key=lambda message: message[1])
+
+    def flush(self):
+        """End of stream, close the active events
+
+        Returns
+        -------
+        messages : list of tuples
+            Detector messages ('onset' or 'offset', time in seconds, event label), sorted by time
+
+        """
+
+        messages = []
+        for event_label in self.event_labels:
+            if self.segment_onset[event_label] is not None:
+                self.close_segment(event_label, self.frame_count, messages)
+            if self.reported[event_label] is not None:
+                messages.append(('offset', self.reported[event_label][1] * self.hop_length_seconds, event_label))
+                self.reported[event_label] = None
+        return sorted(messages, key=lambda message: message[1])
+
+    def close_segment(self, event_label, frame_id, messages):
+        """Close the active segment of an event label
+
+        Parameters
+        ----------
+        event_label : str
+            Event label
+
+        frame_id : int
+            Offset frame of the segment
+
+        messages : list
+            Detector messages, appended in place
+
+        Returns
+        -------
+        nothing
+
+        """
+
+        onset = self.segment_onset[event_label]
+        self.segment_onset[event_label] = None
+        if self.gap(onset, frame_id) < self.minimum_event_length:
+            # Short segments are dropped, they do not bridge gaps either
+            return
+
+        self.report_segment(event_label, onset, messages)
+        self.reported[event_label] = (self.reported[event_label][0], frame_id)
+        self.extending[event_label] = False
+
+    def report_segment(self, event_label, onset, messages):
+        """Report the onset of a segment long enough to be an event, or merge it into the reported event
+
+        Parameters
+        ----------
+        event_label : str
+            Event label
+
+        onset : int
+            Onset frame of the segment
+
+        messages : list
+            Detector messages, appended in place
+
+        Returns
+        -------
+        nothing
+
+        """
+
+        if self.extending[event_label]:
+            return
+
+        reported = self.reported[event_label]
+        if reported is not None and self.gap(reported[1], onset) > self.minimum_event_gap:
+            messages.append(('offset', reported[1] * self.hop_length_seconds, event_label))
+            reported = None
+
+        if reported is None:
+            messages.append(('onset', onset * self.hop_length_seconds, event_label))
+            self.reported[event_label] = (onset, onset)
+        self.extending[event_label] = True
+
+    def update(self, event_label, frame_id, messages):
+        """Report events that are known at the end of a block
+
+        Parameters
+        ----------
+        event_label : str
+            Event label
+
+        frame_id : int
+            Frames processed, including the current block
+
+        messages : list
+            Detector messages, appended in place
+
+        Returns
+        -------
+        nothing
+
+        """
+
+        onset = self.segment_onset[event_label]
+        if onset is not None and self.gap(onset, frame_id) >= self.minimum_event_length:
+            # Active segment is long enough to be kept
+            self.report_segment(event_label, onset, messages)
+
+        reported = self.reported[event_label]
+        if reported is None or self.extending[event_label]:
+            return
+
+        # Reported event is final once no segment starting within the gap can extend it
+        if onset is not None:
+            gap_start = onset
+        else:
+            gap_start = frame_id
+        if self.gap(reported[1], gap_start) > self.minimum_event_gap:
+            messages.append(('offset', reported[1] * self.hop_length_seconds, event_label))
+            self.reported[event_label] = None
+
+    def gap(self, start_frame_id, stop_frame_id):
+        """Time between two frames, computed from the frame times like in event_detection
+
+        Parameters
+        ----------
+        start_frame_id : int
+            Start frame
+
+        stop_frame_id : int
+            Stop frame
+
+        Returns
+        -------
+        gap : float
+            Time in seconds
+
+        """
+
+        return stop_frame_id * self.hop_length_seconds - start_frame_id * self.hop_length_seconds